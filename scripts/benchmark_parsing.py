@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Document Illustrator - 文档解析性能回归测试
+用 synthetic_docs.py 生成不同大小的文档，分别测量
+analyze_document_structure / merge_sections_by_level / verify_content_coverage / extract_core_prompt
+的耗时和峰值内存（tracemalloc），在以下情况返回非零退出码：
+- 相比基线结果变慢（或内存增长）超过阈值
+- 相邻两个大小之间的耗时增长明显快于文档大小的增长（超线性）
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from generate_illustrations import (
+    analyze_document_structure,
+    extract_core_prompt,
+    merge_sections_by_level,
+    verify_content_coverage,
+)
+from synthetic_docs import format_size, parse_size, write_synthetic_markdown
+
+
+DEFAULT_SIZES = "1K,100K,1M,10M"
+DEFAULT_THRESHOLD = 1.5
+DEFAULT_MAX_EXPONENT = 1.3
+
+# 低于这个耗时的测量值噪声太大，不参与比较（秒）
+NOISE_FLOOR_SECONDS = 0.01
+
+# 每种场景对应的合成文档参数
+CASES = {
+    # 随机层级、10% 重复标题、中英混排
+    'mixed': {},
+    # 一个章节占一半大小
+    'giant': {'giant_ratio': 0.5},
+    # 只有一个 ##，其余全是它的子章节，合并时父章节内容和文档一样长
+    'wide': {'top_ratio': 0.0},
+}
+
+
+def build_style_file(path, doc_path):
+    """
+    以合成文档为正文构造一个同样大小的风格文件，
+    让 extract_core_prompt 的耗时随大小变化
+    """
+    with open(doc_path, 'r', encoding='utf-8') as src, open(path, 'w', encoding='utf-8') as dst:
+        dst.write("## 概述\n\n合成风格文件\n\n### 提示词\n\n")
+        shutil.copyfileobj(src, dst)
+        dst.write("\n\n需要生成 PPT 的内容：\n")
+
+
+def positive_int(value):
+    """argparse 类型：不小于 1 的整数"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"必须不小于 1: {value}")
+    return number
+
+
+def measure(func, repeat):
+    """
+    先多次计时取最快一次，再在 tracemalloc 下单独运行一次记录峰值内存
+    （tracemalloc 会拖慢执行，两者分开测）
+
+    repeat 至少按 1 次计
+
+    返回：(最短耗时秒数, 峰值内存字节数, 函数返回值)
+    """
+    best = None
+    for _ in range(max(1, repeat)):
+        start_time = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return best, peak, result
+
+
+def benchmark_case(case, options, sizes, workdir, repeat, level):
+    """
+    对一个场景的所有大小运行基准测试
+
+    返回：{"<场景>/<大小>/<函数>": {'size': 字节数, 'seconds': ..., 'peak_bytes': ...}, ...}
+    """
+    results = {}
+    for size in sizes:
+        doc_path = os.path.join(workdir, f"{case}-{format_size(size)}.md")
+        style_path = os.path.join(workdir, f"{case}-{format_size(size)}-style.md")
+        if not os.path.exists(doc_path):
+            write_synthetic_markdown(doc_path, size, **options)
+            build_style_file(style_path, doc_path)
+
+        def record(name, seconds, peak):
+            results[f"{case}/{format_size(size)}/{name}"] = {
+                'size': size,
+                'seconds': seconds,
+                'peak_bytes': peak
+            }
+            print(f"  {case:<6} {format_size(size):>6}  {name:<28} "
+                  f"{seconds * 1000:>10.1f} ms  {peak / 1024 / 1024:>8.1f} MB")
+
+        seconds, peak, structure = measure(lambda: analyze_document_structure(doc_path), repeat)
+        record('analyze_document_structure', seconds, peak)
+
+        sections = structure['sections']
+        seconds, peak, merged = measure(lambda: merge_sections_by_level(sections, level), repeat)
+        record('merge_sections_by_level', seconds, peak)
+
+        seconds, peak, _ = measure(lambda: verify_content_coverage(sections, merged), repeat)
+        record('verify_content_coverage', seconds, peak)
+
+        seconds, peak, _ = measure(lambda: extract_core_prompt(style_path), repeat)
+        record('extract_core_prompt', seconds, peak)
+
+    return results
+
+
+def check_scaling(results, max_exponent):
+    """
+    检查相邻大小之间的增长指数：log(耗时比) / log(大小比)
+    线性算法约为 1，二次方算法约为 2
+
+    返回：问题描述列表
+    """
+    problems = []
+    series = {}
+    for key, item in results.items():
+        case, _, name = key.split('/')
+        series.setdefault((case, name), []).append(item)
+
+    for (case, name), items in sorted(series.items()):
+        items.sort(key=lambda item: item['size'])
+        for smaller, larger in zip(items, items[1:]):
+            if smaller['seconds'] < NOISE_FLOOR_SECONDS or larger['seconds'] < NOISE_FLOOR_SECONDS:
+                continue
+            exponent = (math.log(larger['seconds'] / smaller['seconds'])
+                        / math.log(larger['size'] / smaller['size']))
+            if exponent > max_exponent:
+                problems.append(
+                    f"{case}/{name}: {format_size(smaller['size'])} → {format_size(larger['size'])} "
+                    f"增长指数 {exponent:.2f}（上限 {max_exponent}），疑似超线性"
+                )
+    return problems
+
+
+def compare_with_baseline(results, baseline, threshold):
+    """
+    与基线结果比较，耗时或峰值内存超过基线 × threshold 视为回归
+
+    返回：问题描述列表
+    """
+    problems = []
+    for key, item in sorted(results.items()):
+        base = baseline.get(key)
+        if not base:
+            continue
+        if item['seconds'] >= NOISE_FLOOR_SECONDS and item['seconds'] > base['seconds'] * threshold:
+            problems.append(
+                f"{key}: 耗时 {item['seconds'] * 1000:.1f} ms，基线 {base['seconds'] * 1000:.1f} ms"
+                f"（{item['seconds'] / base['seconds']:.2f}x > {threshold}x）"
+            )
+        if base['peak_bytes'] and item['peak_bytes'] > base['peak_bytes'] * threshold:
+            problems.append(
+                f"{key}: 峰值内存 {item['peak_bytes'] / 1024 / 1024:.1f} MB，"
+                f"基线 {base['peak_bytes'] / 1024 / 1024:.1f} MB"
+                f"（{item['peak_bytes'] / base['peak_bytes']:.2f}x > {threshold}x）"
+            )
+    return problems
+
+
+def main():
+    """主流程"""
+    parser = argparse.ArgumentParser(
+        description='Document Illustrator - 文档解析性能回归测试',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例用法:
+  # 记录基线
+  python benchmark_parsing.py --save bench-baseline.json
+
+  # 与基线比较，变慢超过 1.5 倍时失败
+  python benchmark_parsing.py --baseline bench-baseline.json --threshold 1.5
+
+  # 包含 100MB 文档
+  python benchmark_parsing.py --sizes 1K,1M,10M,100M --repeat 1
+"""
+    )
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f'文档大小列表（默认: {DEFAULT_SIZES}）')
+    parser.add_argument(
+        '--cases',
+        default=','.join(CASES),
+        help=f'场景列表（默认: {",".join(CASES)}）'
+    )
+    parser.add_argument('--level', choices=['h2', 'h3', 'h4'], default='h2', help='合并层级（默认: h2）')
+    parser.add_argument('--repeat', type=positive_int, default=3, help='每项计时的重复次数，取最快一次（默认: 3）')
+    parser.add_argument('--baseline', help='基线结果 JSON，用于比较')
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f'相对基线允许的倍数（默认: {DEFAULT_THRESHOLD}）'
+    )
+    parser.add_argument(
+        '--max-exponent',
+        type=float,
+        default=DEFAULT_MAX_EXPONENT,
+        help=f'相邻大小之间允许的耗时增长指数（默认: {DEFAULT_MAX_EXPONENT}，线性约为 1）'
+    )
+    parser.add_argument('--save', help='把本次结果写入 JSON 文件（可作为之后的基线）')
+    parser.add_argument('--workdir', help='合成文档的存放目录（默认: 临时目录，运行结束后删除）')
+
+    args = parser.parse_args()
+
+    try:
+        sizes = sorted(parse_size(s) for s in args.sizes.split(',') if s.strip())
+    except ValueError:
+        print(f"错误: 无效的大小列表: {args.sizes}", file=sys.stderr)
+        sys.exit(1)
+
+    cases = [c.strip() for c in args.cases.split(',') if c.strip()]
+    unknown = [c for c in cases if c not in CASES]
+    if unknown:
+        print(f"错误: 未知的场景: {', '.join(unknown)}，可选: {', '.join(CASES)}", file=sys.stderr)
+        sys.exit(1)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='illustrator-bench-')
+    os.makedirs(workdir, exist_ok=True)
+
+    print("=" * 60)
+    print("Document Illustrator - 解析性能测试")
+    print("=" * 60)
+    print(f"大小: {', '.join(format_size(s) for s in sizes)}")
+    print(f"场景: {', '.join(cases)}")
+    print()
+
+    results = {}
+    try:
+        for case in cases:
+            results.update(benchmark_case(case, CASES[case], sizes, workdir, args.repeat, args.level))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"\n✓ 结果已保存: {args.save}")
+
+    problems = check_scaling(results, args.max_exponent)
+    if baseline is not None:
+        problems += compare_with_baseline(results, baseline, args.threshold)
+
+    print()
+    print("=" * 60)
+    if problems:
+        print(f"✗ 发现 {len(problems)} 项性能回归:")
+        for problem in problems:
+            print(f"  - {problem}")
+        sys.exit(1)
+    print("✓ 未发现性能回归")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Document Illustrator - 上下文缓存的本地替身
+FakeCachingClient 模拟 genai.Client 中与风格提示词缓存有关的部分（caches.list / caches.create /
+models.generate_content），缓存按 TTL 过期，引用已过期的缓存返回 404，不支持缓存时创建返回 400。
+直接运行时用它验证 StylePromptCache 的命中、未命中、过期、不支持和并发行为，任一检查失败返回非零退出码
+"""
+
+import argparse
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from credential_pool import Credential
+from style_cache import StylePromptCache, print_cache_summary
+
+
+MODEL = "gemini-3-pro-image-preview"
+
+# 估算 token 数时每个 token 对应的字符数
+CHARS_PER_TOKEN = 4
+
+
+class FakeAPIError(Exception):
+    """带 HTTP 状态码的错误，与 google-genai 的 APIError 一样通过 code 属性读取"""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class FakeCacheStore:
+    """
+    一个 API 项目的缓存存储；同一项目的多个客户端（多次运行）共用同一个存储
+
+    clock: 返回当前时间的函数，测试过期时可以换成手动推进的时钟
+    """
+
+    def __init__(self, clock=time.time, supports_cache=True):
+        self.clock = clock
+        self.supports_cache = supports_cache
+        self.caches = {}
+        self.list_calls = 0
+        self.create_calls = 0
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def live(self):
+        now = self.clock()
+        with self._lock:
+            return [cached for cached in self.caches.values() if cached.expire_at > now]
+
+
+class _FakeCaches:
+    def __init__(self, store, list_gate=None):
+        self.store = store
+        self.list_gate = list_gate
+
+    def list(self):
+        with self.store._lock:
+            self.store.list_calls += 1
+        if self.list_gate is not None:
+            self.list_gate.wait()
+        return self.store.live()
+
+    def create(self, model, config):
+        store = self.store
+        with store._lock:
+            store.create_calls += 1
+            if not store.supports_cache:
+                raise FakeAPIError(400, f"Model {model} does not support cached content")
+            name = f"cachedContents/fake-{len(store.caches) + 1}"
+            text = ''.join(part.text for content in config.contents for part in content.parts)
+            cached = SimpleNamespace(
+                name=name,
+                display_name=config.display_name,
+                model=f"models/{model}",
+                expire_at=store.clock() + float(config.ttl.rstrip('s')),
+                token_count=len(text) // CHARS_PER_TOKEN
+            )
+            store.caches[name] = cached
+        return cached
+
+
+class _FakeModels:
+    def __init__(self, store):
+        self.store = store
+
+    def generate_content(self, model, contents, config):
+        store = self.store
+        prompt_tokens = len(contents) // CHARS_PER_TOKEN
+        cached_tokens = 0
+        name = getattr(config, 'cached_content', None)
+        if name:
+            cached = store.caches.get(name)
+            if cached is None or cached.expire_at <= store.clock():
+                raise FakeAPIError(404, f"CachedContent not found (or expired): {name}")
+            cached_tokens = cached.token_count
+            prompt_tokens += cached_tokens
+        with store._lock:
+            store.requests.append(name)
+        return SimpleNamespace(
+            parts=[],
+            usage_metadata=SimpleNamespace(prompt_token_count=prompt_tokens,
+                                           cached_content_token_count=cached_tokens)
+        )
+
+
+class FakeCachingClient:
+    """
+    替代 genai.Client 传给 StylePromptCache.generate_content()
+
+    store: 所属项目的缓存存储（默认新建）
+    list_gate: 不为空时 caches.list() 等待这个 Event，用来模拟挂起的网络调用
+    """
+
+    def __init__(self, store=None, list_gate=None):
+        self.store = store if store is not None else FakeCacheStore()
+        self.caches = _FakeCaches(self.store, list_gate)
+        self.models = _FakeModels(self.store)
+
+
+class ManualClock:
+    """手动推进的时钟"""
+
+    def __init__(self, start=1_000_000.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def _config():
+    from google.genai import types
+    return types.GenerateContentConfig(response_modalities=['IMAGE'])
+
+
+def _generate(cache, client, credential, style_prompt, suffix="## 标题\n内容"):
+    return cache.generate_content(client, credential, MODEL, style_prompt, suffix, _config())
+
+
+def check_hit_and_miss(style_prompt, images):
+    """第一张图创建缓存（未命中），之后全部命中；新的一次运行复用服务端已有的同名缓存"""
+    store = FakeCacheStore()
+    client = FakeCachingClient(store)
+    credential = Credential("fake-key-0001")
+    cache = StylePromptCache(ttl_seconds=600)
+    for _ in range(images):
+        _generate(cache, client, credential, style_prompt)
+
+    second_run = StylePromptCache(ttl_seconds=600)
+    _generate(second_run, FakeCachingClient(store), Credential("fake-key-0001"), style_prompt)
+
+    print_cache_summary(cache)
+    return [
+        ("每组凭据 + 风格只创建一次缓存", store.create_calls == 1),
+        ("全部请求都引用缓存", all(record['cached'] for record in cache.records)),
+        ("新的一次运行复用已有缓存", store.create_calls == 1 and second_run.records[0]['cached']),
+    ]
+
+
+def check_expiry(style_prompt):
+    """缓存过期后当前请求退回完整提示词，下一次请求重新创建缓存"""
+    clock = ManualClock()
+    store = FakeCacheStore(clock)
+    client = FakeCachingClient(store)
+    credential = Credential("fake-key-0002")
+    cache = StylePromptCache(ttl_seconds=60)
+
+    _generate(cache, client, credential, style_prompt)
+    clock.advance(61)
+    _generate(cache, client, credential, style_prompt)
+    _generate(cache, client, credential, style_prompt)
+    return [
+        ("过期后当前请求发送完整提示词", [r['cached'] for r in cache.records] == [True, False, True]),
+        ("过期后重新创建缓存", store.create_calls == 2),
+    ]
+
+
+def check_unsupported(style_prompt):
+    """不支持缓存时只尝试创建一次，之后都发送完整提示词"""
+    store = FakeCacheStore(supports_cache=False)
+    client = FakeCachingClient(store)
+    credential = Credential("fake-key-0003")
+    cache = StylePromptCache()
+    for _ in range(3):
+        _generate(cache, client, credential, style_prompt)
+    return [
+        ("不支持缓存时只尝试创建一次", store.create_calls == 1),
+        ("不支持缓存时发送完整提示词", not any(record['cached'] for record in cache.records)),
+    ]
+
+
+def check_concurrency(style_prompt, workers):
+    """
+    并发请求同一个键只创建一次缓存；
+    一组凭据的 caches.list() 挂起时，另一组凭据的请求不受影响
+    """
+    store = FakeCacheStore()
+    credential = Credential("fake-key-0004")
+    cache = StylePromptCache()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda _: _generate(cache, FakeCachingClient(store), credential, style_prompt),
+                          range(workers * 2)))
+    results = [("并发请求同一风格只创建一次缓存", store.create_calls == 1)]
+
+    gate = threading.Event()
+    blocked = threading.Thread(
+        target=_generate,
+        args=(cache, FakeCachingClient(FakeCacheStore(), list_gate=gate), Credential("fake-key-0005"), style_prompt),
+        daemon=True
+    )
+    blocked.start()
+    try:
+        other = FakeCacheStore()
+        done = threading.Thread(
+            target=_generate, args=(cache, FakeCachingClient(other), Credential("fake-key-0006"), style_prompt)
+        )
+        done.start()
+        done.join(timeout=5)
+        results.append(("挂起的 caches.list() 不阻塞其他凭据", not done.is_alive() and len(other.requests) == 1))
+    finally:
+        gate.set()
+        blocked.join(timeout=5)
+    return results
+
+
+def main():
+    """主流程"""
+    parser = argparse.ArgumentParser(
+        description='Document Illustrator - 用本地替身验证风格提示词缓存',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例用法:
+  python cache_stand_in.py
+  python cache_stand_in.py --images 50 --workers 16
+"""
+    )
+    parser.add_argument('--images', type=int, default=20, help='命中测试中的图片数（默认: 20）')
+    parser.add_argument('--workers', type=int, default=8, help='并发测试的线程数（默认: 8）')
+    args = parser.parse_args()
+
+    style_prompt = "风格提示词：票据风格，暖色纸张纹理，等宽字体，虚线分隔。" * 200
+
+    checks = []
+    checks += check_hit_and_miss(style_prompt, max(2, args.images))
+    checks += check_expiry(style_prompt)
+    checks += check_unsupported(style_prompt)
+    checks += check_concurrency(style_prompt, max(2, args.workers))
+
+    print()
+    for name, ok in checks:
+        print(f"{'✓' if ok else '✗'} {name}")
+    failed = [name for name, ok in checks if not ok]
+    if failed:
+        print(f"\n{len(failed)} 项检查未通过", file=sys.stderr)
+        sys.exit(1)
+    print(f"\n全部 {len(checks)} 项检查通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Document Illustrator - API 凭据池
+把多组（API 密钥, 端点）组成一个池，按每组的 RPM 限制和权重分配请求，
+遇到 429 / 鉴权错误的凭据暂时移出轮换，并统计每组凭据的用量
+"""
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+
+# 每分钟请求数统计窗口
+RPM_WINDOW_SECONDS = 60
+
+# 429 限流后的冷却时间，鉴权错误的冷却时间
+RATE_LIMIT_COOLDOWN_SECONDS = 60
+AUTH_ERROR_COOLDOWN_SECONDS = 600
+
+STRATEGIES = ('least-loaded', 'round-robin')
+
+# 单次请求的超时时间（秒），避免连接挂起导致整批任务停滞；等待可用凭据的时间也不超过它
+DEFAULT_REQUEST_TIMEOUT_SECONDS = 300
+
+# 等待凭据期间检查取消的间隔（秒）
+CANCEL_POLL_SECONDS = 0.5
+
+
+class CredentialsUnavailable(RuntimeError):
+    """没有可用凭据：全部鉴权失败、等待超时或运行已取消"""
+
+
+class RunCancelled(RuntimeError):
+    """所在的运行已被取消（见 cancellation()），放弃保存结果"""
+
+
+class MissingCredentials(RuntimeError):
+    """环境变量中没有配置任何 API 密钥"""
+
+
+_thread_state = threading.local()
+
+
+@contextlib.contextmanager
+def cancellation(event):
+    """
+    在 with 块内，当前线程等待凭据时一并观察 event：event 被设置后 acquire() 立即放弃
+    （调度器的工作线程用它把运行的取消传递到凭据池，无需改动各个 render 函数）
+    """
+    previous = getattr(_thread_state, 'cancel_event', None)
+    _thread_state.cancel_event = event
+    try:
+        yield
+    finally:
+        _thread_state.cancel_event = previous
+
+
+def cancel_requested():
+    """当前线程所在的 cancellation() 事件是否已被设置"""
+    event = getattr(_thread_state, 'cancel_event', None)
+    return event is not None and event.is_set()
+
+
+class Credential:
+    """单组凭据及其运行时状态"""
+
+    def __init__(self, api_key, endpoint=None, rpm=None, weight=1, name=None):
+        self.api_key = api_key
+        self.endpoint = endpoint or None
+        self.rpm = rpm
+        self.weight = max(1, weight)
+        # 日志中只显示密钥末 4 位
+        self.name = name or f"key-…{api_key[-4:]}"
+
+        self.in_flight = 0
+        self.recent_requests = deque()
+        self.cooldown_until = 0.0
+        self.auth_cooldown_until = 0.0
+        self.current_weight = 0
+
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.auth_errors = 0
+        self.total_latency = 0.0
+
+    def _trim_window(self, now):
+        while self.recent_requests and self.recent_requests[0] <= now - RPM_WINDOW_SECONDS:
+            self.recent_requests.popleft()
+
+    def available_at(self, now):
+        """返回该凭据最早可用的时间点（当前可用则返回 now）"""
+        if self.cooldown_until > now:
+            return self.cooldown_until
+        self._trim_window(now)
+        if self.rpm and len(self.recent_requests) >= self.rpm:
+            return self.recent_requests[0] + RPM_WINDOW_SECONDS
+        return now
+
+    def load(self, now):
+        """按权重归一化的负载：在途请求 + 窗口内已用配额比例"""
+        self._trim_window(now)
+        used = len(self.recent_requests) / self.rpm if self.rpm else 0
+        return (self.in_flight + used) / self.weight
+
+
+def error_status_code(error):
+    """从 google-genai 异常中取出 HTTP 状态码，取不到时返回 None"""
+    for attr in ('code', 'status_code'):
+        code = getattr(error, attr, None)
+        if isinstance(code, int):
+            return code
+    return None
+
+
+class CredentialPool:
+    """
+    线程安全的凭据池
+
+    request_timeout: 单次请求超时（秒），None 表示不限制
+    strategy:
+    - least-loaded: 选择按权重归一化后负载最低的凭据
+    - round-robin: 平滑加权轮询
+    """
+
+    def __init__(self, credentials, strategy='least-loaded', request_timeout=DEFAULT_REQUEST_TIMEOUT_SECONDS):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"不支持的调度策略: {strategy}，请使用 {' 或 '.join(STRATEGIES)}")
+        self.credentials = list(credentials)
+        self.strategy = strategy
+        # 需在首次创建 client 之前设置
+        self.request_timeout = request_timeout
+        self._condition = threading.Condition()
+        self._clients = {}
+
+    def __len__(self):
+        return len(self.credentials)
+
+    def _pick(self, ready):
+        if self.strategy == 'round-robin':
+            total = sum(c.weight for c in ready)
+            for c in ready:
+                c.current_weight += c.weight
+            chosen = max(ready, key=lambda c: c.current_weight)
+            chosen.current_weight -= total
+            return chosen
+        now = time.time()
+        # 负载相同时选累计请求较少的，串行调用也能分散到各组凭据
+        return min(ready, key=lambda c: (c.load(now), c.requests / c.weight))
+
+    def acquire(self, timeout=None):
+        """
+        取得一组可用凭据；全部处于限流冷却或配额用尽时阻塞等待
+
+        以下情况抛出 CredentialsUnavailable，不再等待：
+        - 全部凭据都因鉴权错误处于冷却中（等下去也只会再次失败）
+        - 最早可用的时间超过 timeout（默认为 request_timeout，None 表示不限制）
+        - 当前线程所在的 cancellation() 事件已被设置
+        """
+        if timeout is None:
+            timeout = self.request_timeout
+        give_up_at = time.time() + timeout if timeout else None
+        cancel_event = getattr(_thread_state, 'cancel_event', None)
+
+        with self._condition:
+            while True:
+                now = time.time()
+                ready = [c for c in self.credentials if c.available_at(now) <= now]
+                if ready:
+                    credential = self._pick(ready)
+                    credential.in_flight += 1
+                    credential.requests += 1
+                    credential.recent_requests.append(now)
+                    return credential
+
+                if all(c.auth_cooldown_until > now for c in self.credentials):
+                    raise CredentialsUnavailable("全部凭据都因鉴权错误（HTTP 401/403）处于冷却中，请检查 API 密钥")
+                if cancel_event is not None and cancel_event.is_set():
+                    raise CredentialsUnavailable("运行已取消，放弃等待可用凭据")
+
+                wait_until = min(c.available_at(now) for c in self.credentials)
+                if give_up_at is not None and wait_until > give_up_at:
+                    raise CredentialsUnavailable(
+                        f"全部凭据都在冷却或配额已用完，{wait_until - now:.0f}s 后才有可用凭据，"
+                        f"超过等待上限 {timeout:.0f}s"
+                    )
+                wait = max(0.05, wait_until - now)
+                if cancel_event is not None:
+                    wait = min(wait, CANCEL_POLL_SECONDS)
+                self._condition.wait(timeout=wait)
+
+    def release(self, credential, error=None, latency=None):
+        """
+        归还凭据并记录结果；429 和鉴权错误会让该凭据冷却一段时间
+
+        返回：该错误是否适合换一组凭据重试
+        """
+        retry_elsewhere = False
+        with self._condition:
+            credential.in_flight -= 1
+            if latency is not None:
+                credential.total_latency += latency
+
+            if error is None:
+                credential.successes += 1
+            else:
+                credential.failures += 1
+                status = error_status_code(error)
+                if status == 429:
+                    credential.rate_limited += 1
+                    credential.cooldown_until = time.time() + RATE_LIMIT_COOLDOWN_SECONDS
+                    retry_elsewhere = True
+                elif status in (401, 403):
+                    credential.auth_errors += 1
+                    credential.cooldown_until = time.time() + AUTH_ERROR_COOLDOWN_SECONDS
+                    credential.auth_cooldown_until = credential.cooldown_until
+                    retry_elsewhere = True
+
+            self._condition.notify_all()
+        return retry_elsewhere
+
+    def run(self, request):
+        """
+        用池中的凭据执行 request(client, credential)，遇到限流或鉴权错误时
+        换一组凭据重试，池中每组凭据最多尝试一次；其他错误直接抛出
+
+        返回：request 的返回值
+        """
+        for attempt in range(len(self.credentials)):
+            credential = self.acquire()
+            start_time = time.time()
+            try:
+                result = request(self.client(credential), credential)
+            except Exception as e:
+                retry_elsewhere = self.release(credential, e, time.time() - start_time)
+                if retry_elsewhere and attempt + 1 < len(self.credentials):
+                    print(f"  ⚠️  凭据 {credential.name} 暂不可用（HTTP {error_status_code(e)}），切换到下一组凭据",
+                          file=sys.stderr)
+                    continue
+                raise
+            self.release(credential, latency=time.time() - start_time)
+            return result
+
+    def client(self, credential):
+        """返回该凭据对应的 genai.Client（每组凭据只创建一次）"""
+        with self._condition:
+            client = self._clients.get(id(credential))
+            if client is not None:
+                return client
+
+        from google import genai
+        from google.genai import types
+
+        # HttpOptions.timeout 的单位是毫秒
+        timeout = int(self.request_timeout * 1000) if self.request_timeout else None
+        if credential.endpoint:
+            client = genai.Client(
+                api_key=credential.api_key,
+                http_options=types.HttpOptions(api_version='v1beta', base_url=credential.endpoint, timeout=timeout)
+            )
+        else:
+            client = genai.Client(api_key=credential.api_key, http_options=types.HttpOptions(timeout=timeout))
+
+        with self._condition:
+            return self._clients.setdefault(id(credential), client)
+
+    def usage_report(self):
+        """返回每组凭据的用量统计列表"""
+        with self._condition:
+            return [
+                {
+                    'name': c.name,
+                    'endpoint': c.endpoint,
+                    'requests': c.requests,
+                    'successes': c.successes,
+                    'failures': c.failures,
+                    'rate_limited': c.rate_limited,
+                    'auth_errors': c.auth_errors,
+                    'avg_latency': c.total_latency / c.requests if c.requests else 0.0,
+                }
+                for c in self.credentials
+            ]
+
+
+def print_usage_summary(pool, file=None):
+    """在运行总结中打印每组凭据的用量"""
+    if pool is None or not len(pool):
+        return
+    print(f"\n🔑 凭据用量（{len(pool)} 组，策略: {pool.strategy}）:", file=file)
+    for usage in pool.usage_report():
+        endpoint = f" @ {usage['endpoint']}" if usage['endpoint'] else ""
+        print(f"  {usage['name']}{endpoint}: 请求 {usage['requests']} 次，成功 {usage['successes']}，"
+              f"失败 {usage['failures']}（限流 {usage['rate_limited']}，鉴权 {usage['auth_errors']}），"
+              f"平均耗时 {usage['avg_latency']:.1f}s", file=file)
+
+
+def load_credentials_from_env():
+    """
+    从环境变量读取凭据配置，优先级：
+    1. GEMINI_CREDENTIALS_FILE: JSON 文件，
+       [{"api_key": "...", "endpoint": "...", "rpm": 10, "weight": 2, "name": "..."}, ...]
+    2. GEMINI_API_KEYS: 逗号分隔的多个密钥，共用 GEMINI_API_ENDPOINT 和 GEMINI_API_RPM
+    3. GEMINI_API_KEY: 单个密钥（原有配置方式）
+
+    返回：Credential 列表
+    """
+    credentials_file = os.environ.get("GEMINI_CREDENTIALS_FILE")
+    if credentials_file:
+        with open(credentials_file, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        return [
+            Credential(
+                api_key=entry['api_key'],
+                endpoint=entry.get('endpoint'),
+                rpm=entry.get('rpm'),
+                weight=entry.get('weight', 1),
+                name=entry.get('name')
+            )
+            for entry in entries
+        ]
+
+    endpoint = os.environ.get("GEMINI_API_ENDPOINT")
+    rpm = os.environ.get("GEMINI_API_RPM")
+    rpm = int(rpm) if rpm else None
+
+    keys = os.environ.get("GEMINI_API_KEYS")
+    if keys:
+        return [Credential(key.strip(), endpoint, rpm) for key in keys.split(',') if key.strip()]
+
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if api_key:
+        return [Credential(api_key, endpoint, rpm)]
+
+    return []
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def default_pool():
+    """
+    返回进程内共享的凭据池；未配置任何密钥时抛出 MissingCredentials
+
+    GEMINI_REQUEST_TIMEOUT: 单次请求超时（秒，默认 300，0 表示不限制）
+
+    注意：RPM 限制按进程统计，多进程 / 多机部署时请按 worker 数拆分配额
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            credentials = load_credentials_from_env()
+            if not credentials:
+                raise MissingCredentials("未设置 GEMINI_API_KEY 环境变量")
+            strategy = os.environ.get("GEMINI_POOL_STRATEGY", "least-loaded")
+            timeout = float(os.environ.get("GEMINI_REQUEST_TIMEOUT", DEFAULT_REQUEST_TIMEOUT_SECONDS))
+            _default_pool = CredentialPool(credentials, strategy, timeout or None)
+        return _default_pool
+
+
+def exit_missing_credentials():
+    """命令行脚本在未配置密钥时打印提示并退出"""
+    print("错误: 未设置 GEMINI_API_KEY 环境变量", file=sys.stderr)
+    print("请在 .env 文件中设置: GEMINI_API_KEY=your-api-key", file=sys.stderr)
+    print("（多组密钥可设置 GEMINI_API_KEYS 或 GEMINI_CREDENTIALS_FILE）", file=sys.stderr)
+    sys.exit(1)
+
+
+def get_default_pool():
+    """命令行脚本使用的 default_pool()：未配置任何密钥时打印提示并退出"""
+    try:
+        return default_pool()
+    except MissingCredentials:
+        exit_missing_credentials()
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+Document Illustrator - 文档读取器
+以流式方式从 Markdown / 纯文本、PDF、DOCX、HTML 中提取正文和标题结构，
+统一输出 analyze_document_structure() / merge_sections_by_level() 使用的小节模型
+"""
+
+import os
+import re
+import sys
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from pathlib import Path
+from xml.etree import ElementTree
+
+
+# Markdown 标题：##、###、####（不包括 # 一级标题）
+MARKDOWN_HEADING_PATTERN = re.compile(r'^(#{2,4})\s+(.+)$')
+
+# PDF 没有显式标题结构时使用的编号标题规则
+PDF_HEADING_PATTERNS = [
+    (re.compile(r'^(第[一二三四五六七八九十百零\d]+章)\s*(.*)$'), 'h2'),
+    (re.compile(r'^(Chapter\s+\d+)[.:：\s]\s*(.*)$', re.IGNORECASE), 'h2'),
+    (re.compile(r'^(第[一二三四五六七八九十百零\d]+节)\s*(.*)$'), 'h3'),
+    (re.compile(r'^(\d+\.\d+\.\d+)\s+(\S.*)$'), 'h4'),
+    (re.compile(r'^(\d+\.\d+)\s+(\S.*)$'), 'h3'),
+    # 单个数字编号必须带「.」或「、」且标题不以数字开头，避免把「2024 revenue ...」或表格行当作标题
+    (re.compile(r'^(\d+)[.、]\s*([^\d\s.].*)$'), 'h2'),
+]
+
+# 标题行不应以句末标点结尾，且不能过长
+PDF_HEADING_MAX_LENGTH = 80
+SENTENCE_ENDINGS = ('。', '.', '；', ';', '，', ',', '：', ':')
+
+# 页数超过该值时才启用进程池并行提取
+PARALLEL_PDF_MIN_PAGES = 16
+
+
+def iter_markdown_events(doc_path):
+    """
+    逐行读取 Markdown / 纯文本文档
+
+    产出事件：
+    - ('heading', 'h2' | 'h3' | 'h4', 标题)
+    - ('text', None, 正文行)
+    """
+    with open(doc_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            match = MARKDOWN_HEADING_PATTERN.match(line)
+            if match:
+                level_marks, title = match.groups()
+                yield ('heading', 'h' + str(len(level_marks)), title)
+            else:
+                yield ('text', None, line)
+
+
+class _HTMLEventParser(HTMLParser):
+    """把 HTML 转换为标题 / 正文事件，h2–h4 作为标题，h1 视为文档标题忽略"""
+
+    BLOCK_TAGS = {
+        'p', 'div', 'li', 'tr', 'br', 'pre', 'blockquote', 'section',
+        'article', 'h1', 'h5', 'h6', 'table', 'ul', 'ol', 'dd', 'dt'
+    }
+    SKIP_TAGS = {'script', 'style', 'head', 'title', 'noscript'}
+    HEADING_TAGS = {'h2', 'h3', 'h4'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.events = deque()
+        self._buffer = []
+        self._heading_level = None
+        self._skip_depth = 0
+
+    def _flush(self):
+        text = ' '.join(''.join(self._buffer).split())
+        self._buffer = []
+        if not text:
+            return
+        if self._heading_level:
+            self.events.append(('heading', self._heading_level, text))
+        else:
+            self.events.append(('text', None, text))
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in self.HEADING_TAGS:
+            self._flush()
+            self._heading_level = tag
+        elif tag in self.BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self.HEADING_TAGS:
+            self._flush()
+            self._heading_level = None
+        elif tag in self.BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._buffer.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def iter_html_events(doc_path, chunk_size=64 * 1024):
+    """
+    分块读取 HTML 文档，边解析边产出事件
+    """
+    parser = _HTMLEventParser()
+    with open(doc_path, 'r', encoding='utf-8', errors='replace') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            parser.feed(chunk)
+            while parser.events:
+                yield parser.events.popleft()
+    parser.close()
+    while parser.events:
+        yield parser.events.popleft()
+
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+DOCX_HEADING_STYLE_PATTERN = re.compile(r'^(?:heading|标题)\s*(\d)$', re.IGNORECASE)
+
+
+def _docx_heading_styles(archive):
+    """
+    读取 styles.xml，返回 {styleId: 标题级别数字}
+
+    同时识别样式名（Heading 1 / 标题 1）和大纲级别（outlineLvl）
+    """
+    heading_styles = {}
+    try:
+        styles_xml = archive.read('word/styles.xml')
+    except KeyError:
+        return heading_styles
+
+    root = ElementTree.fromstring(styles_xml)
+    for style in root.iter(WORD_NS + 'style'):
+        style_id = style.get(WORD_NS + 'styleId')
+        name_el = style.find(WORD_NS + 'name')
+        name = name_el.get(WORD_NS + 'val') if name_el is not None else ''
+
+        match = DOCX_HEADING_STYLE_PATTERN.match(name or '')
+        if match:
+            heading_styles[style_id] = int(match.group(1))
+            continue
+
+        outline = style.find(f'{WORD_NS}pPr/{WORD_NS}outlineLvl')
+        if outline is not None:
+            heading_styles[style_id] = int(outline.get(WORD_NS + 'val')) + 1
+
+    return heading_styles
+
+
+def iter_docx_events(doc_path):
+    """
+    流式解析 DOCX（word/document.xml），无需额外依赖
+
+    Word 中的「标题 1」通常是章，「标题」样式才是文档标题，
+    因此映射为：标题 1 → h2，标题 2 → h3，标题 3 → h4，更深的标题作为正文
+    """
+    with zipfile.ZipFile(doc_path) as archive:
+        heading_styles = _docx_heading_styles(archive)
+
+        with archive.open('word/document.xml') as document_xml:
+            for event, element in ElementTree.iterparse(document_xml, events=('end',)):
+                if element.tag != WORD_NS + 'p':
+                    continue
+
+                text = ''.join(t.text or '' for t in element.iter(WORD_NS + 't')).strip()
+
+                heading_number = None
+                props = element.find(WORD_NS + 'pPr')
+                if props is not None:
+                    style = props.find(WORD_NS + 'pStyle')
+                    if style is not None:
+                        heading_number = heading_styles.get(style.get(WORD_NS + 'val'))
+                    outline = props.find(WORD_NS + 'outlineLvl')
+                    if outline is not None:
+                        heading_number = int(outline.get(WORD_NS + 'val')) + 1
+
+                # 释放已处理段落，内存只与单个段落相关
+                element.clear()
+
+                if text and heading_number and 1 <= heading_number <= 3:
+                    yield ('heading', 'h' + str(heading_number + 1), text)
+                else:
+                    yield ('text', None, text)
+
+
+def _import_pypdf():
+    try:
+        import pypdf
+    except ImportError:
+        print("错误: 读取 PDF 需要安装 pypdf 库", file=sys.stderr)
+        print("请运行: pip install pypdf", file=sys.stderr)
+        sys.exit(1)
+    return pypdf
+
+
+# 进程池中每个 worker 持有一个 PdfReader，避免每页重复打开文件
+_worker_pdf_reader = None
+
+
+def _init_pdf_worker(doc_path):
+    global _worker_pdf_reader
+    pypdf = _import_pypdf()
+    _worker_pdf_reader = pypdf.PdfReader(doc_path)
+
+
+def _extract_pdf_page(page_number):
+    return _worker_pdf_reader.pages[page_number].extract_text() or ''
+
+
+def iter_pdf_pages(doc_path, workers=None):
+    """
+    按页产出 PDF 文本
+
+    大文档在进程池中并行提取，同时最多只有 workers * 2 页在途，
+    保证内存占用按页而不是按整个文档增长
+    """
+    pypdf = _import_pypdf()
+    page_count = len(pypdf.PdfReader(doc_path).pages)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1 or page_count < PARALLEL_PDF_MIN_PAGES:
+        _init_pdf_worker(doc_path)
+        for page_number in range(page_count):
+            yield _extract_pdf_page(page_number)
+        return
+
+    window = workers * 2
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_pdf_worker,
+                             initargs=(doc_path,)) as executor:
+        pending = deque()
+        next_page = 0
+        while next_page < page_count or pending:
+            while next_page < page_count and len(pending) < window:
+                pending.append(executor.submit(_extract_pdf_page, next_page))
+                next_page += 1
+            yield pending.popleft().result()
+
+
+def _pdf_outline_headings(doc_path):
+    """
+    读取 PDF 书签，返回 {页码: [(级别, 标题), ...]}
+
+    书签第 1 层 → h2，第 2 层 → h3，第 3 层 → h4
+    """
+    pypdf = _import_pypdf()
+    reader = pypdf.PdfReader(doc_path)
+    headings = {}
+
+    def walk(items, depth):
+        for item in items:
+            if isinstance(item, list):
+                walk(item, depth + 1)
+                continue
+            if depth > 2:
+                continue
+            try:
+                page_number = reader.get_destination_page_number(item)
+            except Exception:
+                continue
+            title = (item.title or '').strip()
+            if title:
+                headings.setdefault(page_number, []).append(('h' + str(depth + 2), title))
+
+    try:
+        walk(reader.outline, 0)
+    except Exception:
+        return {}
+    return headings
+
+
+def _match_pdf_heading(line):
+    """用编号规则判断一行是否为标题，返回 (级别, 标题) 或 None"""
+    match = MARKDOWN_HEADING_PATTERN.match(line)
+    if match:
+        level_marks, title = match.groups()
+        return 'h' + str(len(level_marks)), title
+
+    if len(line) > PDF_HEADING_MAX_LENGTH or line.endswith(SENTENCE_ENDINGS):
+        return None
+
+    for pattern, level in PDF_HEADING_PATTERNS:
+        if pattern.match(line):
+            return level, line
+    return None
+
+
+def _normalize_heading(text):
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def _place_pdf_bookmarks(lines, headings):
+    """
+    按书签顺序在页内逐个查找与标题一致的行（忽略空白差异）
+
+    返回：({行号: (级别, 标题)}, [页内找不到的 (级别, 标题), ...])
+    """
+    normalized = [_normalize_heading(line) for line in lines]
+    placed = {}
+    unplaced = []
+    start = 0
+    for level, title in headings:
+        target = _normalize_heading(title)
+        for i in range(start, len(normalized)):
+            if normalized[i] == target:
+                placed[i] = (level, title)
+                start = i + 1
+                break
+        else:
+            unplaced.append((level, title))
+    return placed, unplaced
+
+
+def iter_pdf_events(doc_path, workers=None):
+    """
+    逐页解析 PDF
+
+    有书签时以书签为标题结构（在对应页中定位标题行），
+    否则按「第X章」「1.1 标题」等编号规则识别标题
+    """
+    outline = _pdf_outline_headings(doc_path)
+
+    for page_number, page_text in enumerate(iter_pdf_pages(doc_path, workers)):
+        lines = [line.strip() for line in page_text.split('\n')]
+
+        if outline:
+            placed, unplaced = _place_pdf_bookmarks(lines, outline.get(page_number, []))
+            for i, line in enumerate(lines):
+                # 未能在页内定位的书签标题放在第一行正文之前
+                if unplaced and line:
+                    for level, title in unplaced:
+                        yield ('heading', level, title)
+                    unplaced = []
+                if i in placed:
+                    level, title = placed[i]
+                    yield ('heading', level, title)
+                    continue
+                yield ('text', None, line)
+            for level, title in unplaced:
+                yield ('heading', level, title)
+        else:
+            for line in lines:
+                heading = _match_pdf_heading(line)
+                if heading:
+                    yield ('heading', heading[0], heading[1])
+                else:
+                    yield ('text', None, line)
+
+
+# 按扩展名注册的读取器，新增格式只需在此登记
+READERS = {
+    '.md': iter_markdown_events,
+    '.markdown': iter_markdown_events,
+    '.txt': iter_markdown_events,
+    '.html': iter_html_events,
+    '.htm': iter_html_events,
+    '.docx': iter_docx_events,
+    '.pdf': iter_pdf_events,
+}
+
+
+def iter_document_events(doc_path, workers=None):
+    """
+    根据扩展名选择读取器，产出 ('heading', 级别, 标题) / ('text', None, 行) 事件
+
+    未登记的扩展名按 Markdown / 纯文本处理
+    """
+    suffix = Path(doc_path).suffix.lower()
+    reader = READERS.get(suffix, iter_markdown_events)
+    if reader is iter_pdf_events:
+        return reader(doc_path, workers)
+    return reader(doc_path)
+
+
+def collect_sections(events):
+    """
+    把标题 / 正文事件组装为小节列表
+
+    返回：[
+        {'level': 'h2', 'title': '...', 'content': '...', 'line_start': 行号},
+        ...
+    ]
+
+    正文先收集到列表、小节结束时一次性拼接，避免字符串反复 += 带来的二次方开销
+    """
+    sections = []
+    current_section = None
+    current_lines = []
+
+    def finish():
+        current_section['content'] = '\n'.join(current_lines).strip()
+        sections.append(current_section)
+
+    for i, (kind, level, text) in enumerate(events):
+        if kind == 'heading':
+            if current_section:
+                finish()
+            current_section = {
+                'level': level,
+                'title': text,
+                'content': '',
+                'line_start': i
+            }
+            current_lines = []
+        elif current_section:
+            current_lines.append(text)
+
+    if current_section:
+        finish()
+
+    return sections
+
+
+def read_document_sections(doc_path, workers=None):
+    """
+    读取任意受支持格式的文档，返回小节列表（格式同 collect_sections）
+
+    参数：
+    - doc_path: 文档路径（.md / .txt / .pdf / .docx / .html）
+    - workers: PDF 并行提取的进程数（默认: CPU 核数）
+    """
+    return collect_sections(iter_document_events(doc_path, workers))
@@ -8,9 +8,40 @@ import os
 import sys
 import re
 import argparse
+from collections import Counter
 from pathlib import Path
 from dotenv import load_dotenv
 
+from credential_pool import DEFAULT_REQUEST_TIMEOUT_SECONDS, get_default_pool, print_usage_summary
+from document_readers import read_document_sections
+from generate_single_image import check_api_setup, get_image_dimensions, validate_image_dimensions
+from illustrator_api import ImageJob, generate_image
+from resolution_ladder import (
+    drafts_dir,
+    load_manifest,
+    parse_indices,
+    plan_ladder,
+    print_ladder_plan,
+    write_manifest,
+)
+from scheduler import (
+    DEFAULT_WORKERS,
+    GenerationScheduler,
+    LatencyHistory,
+    megabytes_to_bytes,
+    ndjson_event_writer,
+    open_ndjson_stream,
+    print_fallbacks,
+    print_memory_summary,
+    print_outstanding,
+    print_qa_summary,
+    write_ndjson,
+)
+from image_qa import DEFAULT_QA_RETRIES, get_qa
+from local_renderer import FALLBACK_MODES, get_fallback
+from similarity_index import DEFAULT_THRESHOLD, REUSE_MODES, SimilarityIndex, apply_reuse, index_result
+from style_cache import get_default_style_cache, print_cache_summary
+
 
 def find_and_load_env():
     """
@@ -19,6 +50,8 @@ def find_and_load_env():
     1. 当前脚本所在目录的上一级（Skill 根目录）
     2. 当前工作目录
     3. 用户主目录下的 .claude/skills/document-illustrator/
+
+    在导入时执行，此时还不知道 NDJSON 是否输出到标准输出，因此提示信息打印到标准错误
     """
     # 获取脚本所在目录的上一级（Skill 根目录）
     skill_root = Path(__file__).parent.parent
@@ -26,25 +59,25 @@ def find_and_load_env():
 
     if env_path.exists():
         load_dotenv(env_path, override=True)
-        print(f"✅ 已加载环境变量: {env_path}")
+        print(f"✅ 已加载环境变量: {env_path}", file=sys.stderr)
         return True
 
     # 尝试当前工作目录
     if Path(".env").exists():
         load_dotenv(".env", override=True)
-        print("✅ 已加载环境变量: ./.env")
+        print("✅ 已加载环境变量: ./.env", file=sys.stderr)
         return True
 
     # 尝试 Claude Code Skill 标准位置
     claude_skill_env = Path.home() / ".claude" / "skills" / "document-illustrator" / ".env"
     if claude_skill_env.exists():
         load_dotenv(claude_skill_env, override=True)
-        print(f"✅ 已加载环境变量: {claude_skill_env}")
+        print(f"✅ 已加载环境变量: {claude_skill_env}", file=sys.stderr)
         return True
 
     # 如果都没找到，尝试默认加载
     load_dotenv(override=True)
-    print("⚠️  未找到 .env 文件，尝试使用系统环境变量")
+    print("⚠️  未找到 .env 文件，尝试使用系统环境变量", file=sys.stderr)
     return False
 
 
@@ -52,10 +85,13 @@ def find_and_load_env():
 find_and_load_env()
 
 
-def analyze_document_structure(doc_path):
+def analyze_document_structure(doc_path, workers=None):
     """
     分析文档的标题层级结构
 
+    支持 Markdown / 纯文本、PDF、DOCX、HTML（见 document_readers.py）
+    workers: PDF 并行提取的进程数（默认: CPU 核数）
+
     返回：{
         'h2': ['标题1', '标题2', ...],
         'h3': ['标题1', '标题2', ...],
@@ -71,17 +107,12 @@ def analyze_document_structure(doc_path):
         print(f"错误: 文件不存在: {doc_path}", file=sys.stderr)
         sys.exit(1)
 
-    with open(doc_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    # 使用正则表达式识别标题
-    # 匹配 ##、###、#### 等标题（不包括 # 一级标题）
-    heading_pattern = re.compile(r'^(#{2,4})\s+(.+)$', re.MULTILINE)
-    headings = heading_pattern.findall(content)
+    # 按格式选择读取器，流式提取标题和正文（PDF 大文档按页并行提取）
+    sections = read_document_sections(doc_path, workers)
 
-    if not headings:
+    if not sections:
         print("错误: 文档中没有找到标题（##、###、####）", file=sys.stderr)
-        print("请确保文档使用 Markdown 格式并包含标题", file=sys.stderr)
+        print("请确保文档使用 Markdown 格式并包含标题，或 PDF / DOCX / HTML 中包含标题结构", file=sys.stderr)
         sys.exit(1)
 
     # 统计各级标题
@@ -89,51 +120,13 @@ def analyze_document_structure(doc_path):
     h3_titles = []
     h4_titles = []
 
-    for level, title in headings:
-        if level == '##':
-            h2_titles.append(title)
-        elif level == '###':
-            h3_titles.append(title)
-        elif level == '####':
-            h4_titles.append(title)
-
-    # 提取每个小节的内容
-    sections = []
-
-    # 将文档按标题分割
-    lines = content.split('\n')
-    current_section = None
-
-    for i, line in enumerate(lines):
-        # 检查是否是标题行
-        match = re.match(r'^(#{2,4})\s+(.+)$', line)
-
-        if match:
-            # 保存上一个小节
-            if current_section:
-                sections.append(current_section)
-
-            # 开始新小节
-            level_marks, title = match.groups()
-            level = 'h' + str(len(level_marks))
-
-            current_section = {
-                'level': level,
-                'title': title,
-                'content': '',
-                'line_start': i
-            }
-        elif current_section:
-            # 累积当前小节的内容
-            current_section['content'] += line + '\n'
-
-    # 添加最后一个小节
-    if current_section:
-        sections.append(current_section)
-
-    # 清理每个小节的内容（移除首尾空白）
     for section in sections:
-        section['content'] = section['content'].strip()
+        if section['level'] == 'h2':
+            h2_titles.append(section['title'])
+        elif section['level'] == 'h3':
+            h3_titles.append(section['title'])
+        elif section['level'] == 'h4':
+            h4_titles.append(section['title'])
 
     return {
         'h2': h2_titles,
@@ -159,6 +152,12 @@ def merge_sections_by_level(sections, target_level):
 
     merged_sections = []
     current_parent = None
+    # 父章节的内容片段，保存时一次性拼接，避免字符串反复 += 带来的二次方开销
+    current_parts = []
+
+    def save_parent():
+        current_parent['content'] = '\n\n'.join(current_parts)
+        merged_sections.append(current_parent)
 
     for section in sections:
         section_level_num = level_hierarchy[section['level']]
@@ -167,7 +166,7 @@ def merge_sections_by_level(sections, target_level):
             # 找到目标层级的章节
             if current_parent:
                 # 保存上一个父章节
-                merged_sections.append(current_parent)
+                save_parent()
 
             # 创建新的父章节
             current_parent = {
@@ -176,16 +175,13 @@ def merge_sections_by_level(sections, target_level):
                 'content': section['content'],
                 'merged_from': [section['title']]  # 记录合并来源
             }
+            current_parts = [section['content']] if section['content'] else []
 
         elif section_level_num > target_level_num:
             # 子章节，需要合并到当前父章节
             if current_parent:
-                # 添加子章节的内容
-                if current_parent['content']:
-                    current_parent['content'] += '\n\n'
-
                 # 添加子章节标题和内容
-                current_parent['content'] += f"【{section['title']}】\n{section['content']}"
+                current_parts.append(f"【{section['title']}】\n{section['content']}")
                 current_parent['merged_from'].append(section['title'])
             else:
                 # 没有父章节，说明文档结构有问题，作为独立章节处理
@@ -200,7 +196,7 @@ def merge_sections_by_level(sections, target_level):
             # 比目标层级更高的章节（比如选了 h3 但遇到 h2）
             # 保存当前父章节
             if current_parent:
-                merged_sections.append(current_parent)
+                save_parent()
 
             # 这个高层级章节作为独立章节
             merged_sections.append({
@@ -213,7 +209,7 @@ def merge_sections_by_level(sections, target_level):
 
     # 保存最后一个父章节
     if current_parent:
-        merged_sections.append(current_parent)
+        save_parent()
 
     return merged_sections
 
@@ -286,30 +282,62 @@ def verify_content_coverage(original_sections, merged_sections):
     }
 
 
-def prompt_user_for_granularity(structure):
+# 单张配图的内容长度上限（避免超过 API 限制）
+MAX_CONTENT_LENGTH = 1000
+
+
+def truncate_content(content):
+    """截取过长的内容，返回 (内容, 是否被截取)"""
+    if len(content) > MAX_CONTENT_LENGTH:
+        return content[:MAX_CONTENT_LENGTH] + "...", True
+    return content, False
+
+
+def prepare_sections(doc_path, level, workers=None):
+    """
+    非交互地解析文档、按层级合并并验证覆盖度
+
+    返回：合并后的章节列表（有遗漏时打印错误并退出）
+    """
+    structure = analyze_document_structure(doc_path, workers)
+    sections = merge_sections_by_level(structure['sections'], level)
+
+    verification = verify_content_coverage(structure['sections'], sections)
+    if not verification['all_covered']:
+        print(f"错误: 有 {verification['missing_count']} 个章节遗漏，请检查文档结构", file=sys.stderr)
+        sys.exit(1)
+
+    if not sections:
+        print(f"错误: 没有找到级别为 {level} 的小节", file=sys.stderr)
+        sys.exit(1)
+
+    return sections
+
+
+def prompt_user_for_granularity(structure, log=None):
     """
     根据文档结构，让用户选择生成粒度
 
     返回：选中的标题级别（'h2', 'h3', 或 'h4'）
     """
-    print(f"\n检测到文档结构：")
-    print(f"- {len(structure['h2'])} 个二级标题 (##)")
-    print(f"- {len(structure['h3'])} 个三级标题 (###)")
-    print(f"- {len(structure['h4'])} 个四级标题 (####)")
+    print(f"\n检测到文档结构：", file=log)
+    print(f"- {len(structure['h2'])} 个二级标题 (##)", file=log)
+    print(f"- {len(structure['h3'])} 个三级标题 (###)", file=log)
+    print(f"- {len(structure['h4'])} 个四级标题 (####)", file=log)
 
-    print(f"\n请选择生成粒度：")
+    print(f"\n请选择生成粒度：", file=log)
 
     options = []
     if len(structure['h2']) > 0:
-        print(f"1. 粗粒度 - 按二级标题生成 ({len(structure['h2'])} 张图片)")
+        print(f"1. 粗粒度 - 按二级标题生成 ({len(structure['h2'])} 张图片)", file=log)
         options.append(('1', 'h2'))
 
     if len(structure['h3']) > 0:
-        print(f"2. 中等粒度 - 按三级标题生成 ({len(structure['h3'])} 张图片)")
+        print(f"2. 中等粒度 - 按三级标题生成 ({len(structure['h3'])} 张图片)", file=log)
         options.append(('2', 'h3'))
 
     if len(structure['h4']) > 0:
-        print(f"3. 细粒度 - 按四级标题生成 ({len(structure['h4'])} 张图片)")
+        print(f"3. 细粒度 - 按四级标题生成 ({len(structure['h4'])} 张图片)", file=log)
         options.append(('3', 'h4'))
 
     if not options:
@@ -318,16 +346,26 @@ def prompt_user_for_granularity(structure):
 
     while True:
         valid_choices = [opt[0] for opt in options]
-        choice = input(f"\n请输入选择 ({'/'.join(valid_choices)}): ").strip()
+        print(f"\n请输入选择 ({'/'.join(valid_choices)}): ", end='', file=log, flush=True)
+        choice = input().strip()
 
         for opt_choice, opt_level in options:
             if choice == opt_choice:
                 return opt_level
 
-        print(f"无效选择，请输入 {' 或 '.join(valid_choices)}")
+        print(f"无效选择，请输入 {' 或 '.join(valid_choices)}", file=log)
+
+
+def get_style_file(style):
+    """返回 styles/ 目录下指定风格的文件路径，不存在时打印错误并退出"""
+    style_file = Path(__file__).parent.parent / "styles" / f"{style}.md"
+    if not style_file.exists():
+        print(f"错误: 风格文件不存在: {style_file}", file=sys.stderr)
+        sys.exit(1)
+    return str(style_file)
 
 
-def prompt_user_for_style():
+def prompt_user_for_style(log=None):
     """
     让用户选择风格
 
@@ -359,12 +397,13 @@ def prompt_user_for_style():
         }
     ]
 
-    print("\n请选择配图风格：")
+    print("\n请选择配图风格：", file=log)
     for style in styles:
-        print(f"{style['number']}. {style['name']} - {style['description']}")
+        print(f"{style['number']}. {style['name']} - {style['description']}", file=log)
 
     while True:
-        choice = input("\n请输入选择 (1/2/3): ").strip()
+        print("\n请输入选择 (1/2/3): ", end='', file=log, flush=True)
+        choice = input().strip()
 
         for style in styles:
             if choice == style['number']:
@@ -374,7 +413,7 @@ def prompt_user_for_style():
                     sys.exit(1)
                 return str(style_path)
 
-        print("无效选择，请输入 1、2 或 3")
+        print("无效选择，请输入 1、2 或 3", file=log)
 
 
 def extract_core_prompt(style_file_path):
@@ -454,7 +493,7 @@ def extract_core_prompt(style_file_path):
 
 def generate_illustration(section_title, section_content, style_prompt, output_dir, index, resolution='2K'):
     """
-    调用 Gemini API 生成单张配图
+    调用 Gemini API 生成单张配图（illustrator_api.generate_image() 的封装）
 
     参数：
     - section_title: 小节标题
@@ -462,58 +501,152 @@ def generate_illustration(section_title, section_content, style_prompt, output_d
     - style_prompt: 风格提示词
     - output_dir: 输出目录
     - index: 图片序号
-    - resolution: 图片分辨率（'2K' 或 '4K'）
+    - resolution: 图片分辨率（'1K'、'2K' 或 '4K'，1K 用于草图）
 
-    返回：生成的图片路径
+    返回：ImageResult（成功时 path 为生成的图片路径）
     """
+    job = ImageJob(
+        title=section_title,
+        content=section_content,
+        style_prompt=style_prompt,
+        output_path=os.path.join(output_dir, f"illustration-{index:02d}.png"),
+        aspect_ratio="16:9",
+        resolution=resolution
+    )
+    result = generate_image(job)
+
+    if result.error_class == 'NoImageData':
+        print(f"警告: 第 {index} 张图片生成失败 - {result.error}", file=sys.stderr)
+    elif not result.ok:
+        print(f"错误: 第 {index} 张图片生成失败 - {result.error}", file=sys.stderr)
+    return result
+
+
+def resolve_output_dir(document, output=None):
+    """输出目录：--output 下的 images/，默认为文档所在目录下的 images/"""
+    if output:
+        return os.path.join(output, "images")
+    return os.path.join(os.path.dirname(os.path.abspath(document)), "images")
+
+
+def check_image_dimensions(image_path, resolution, log=None):
+    """校验已保存图片的尺寸，不符合时打印警告"""
     try:
-        from google import genai
-        from google.genai import types
-    except ImportError:
-        print("错误: 未安装 google-genai 库", file=sys.stderr)
-        print("请运行: pip install google-genai", file=sys.stderr)
+        ok, _, message = validate_image_dimensions(image_path, "16:9", resolution)
+    except Exception as e:
+        ok, message = False, f"无法读取图片（{e}）"
+    if ok:
+        print(f"  尺寸: {message}", file=log)
+    else:
+        print(f"  ⚠️  尺寸校验未通过: {message}", file=sys.stderr)
+    return ok
+
+
+def print_qa_problems(result, log=None):
+    """打印重试后仍未通过质检的问题"""
+    if result.get('qa'):
+        print(f"  ⚠️  质检未通过: {'；'.join(result['qa'])}", file=sys.stderr)
+
+
+def finalize_drafts(output_dir, indices_text, workers=DEFAULT_WORKERS, deadline=None, priority_text=None,
+                    ndjson=None, memory_budget=None, fallback=None, qa=None, qa_retries=0, log=None):
+    """
+    草图模式第二阶段：把审核通过的序号按最终分辨率重新生成
+
+    使用草图清单中记录的标题、内容和风格提示词，保证与草图的提示词完全一致
+    priority_text: 优先生成的序号（如 "1,3"）
+    ndjson: 每张图保存后写入一行 NDJSON 的流
+    memory_budget: 在途图片数据的内存预算（字节）
+    fallback: API 生成失败时的兜底函数（见 GenerationScheduler）
+    qa / qa_retries: 保存后的质检函数和每张图因质检未通过重新生成的次数上限
+    log: 进度信息的输出流（默认为标准输出）
+    """
+    manifest = load_manifest(output_dir)
+    if manifest is None:
+        print(f"错误: 未找到草图清单，请先使用 --draft 生成草图: {drafts_dir(output_dir)}", file=sys.stderr)
         sys.exit(1)
 
-    # 获取 API 密钥
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
-        print("错误: 未设置 GEMINI_API_KEY 环境变量", file=sys.stderr)
-        print("请在 .env 文件中设置: GEMINI_API_KEY=your-api-key", file=sys.stderr)
+    items = {int(index): item for index, item in manifest['items'].items()}
+    try:
+        approved = parse_indices(indices_text, items.keys())
+        flagged = set(parse_indices(priority_text, approved)) if priority_text else set()
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
         sys.exit(1)
 
-    # 组合提示词
-    full_prompt = f"{style_prompt}\n\n根据以下内容生成配图：\n\n标题：{section_title}\n\n内容：{section_content}"
+    resolution = manifest['final_resolution']
+    width, height = get_image_dimensions(manifest['aspect_ratio'], resolution)
+    print(f"\n🖼️  终稿阶段：重新生成 {len(approved)} 张通过审核的配图", file=log)
+    print(f"分辨率: {resolution} ({width}x{height})", file=log)
+    print("=" * 60, file=log)
+    print(file=log)
 
-    try:
-        # 调用 API
-        client = genai.Client(api_key=api_key)
-
-        response = client.models.generate_content(
-            model="gemini-3-pro-image-preview",  # Nano Banana Pro
-            contents=full_prompt,
-            config=types.GenerateContentConfig(
-                response_modalities=['IMAGE'],
-                image_config=types.ImageConfig(
-                    aspect_ratio="16:9",
-                    image_size=resolution
-                )
-            )
+    jobs = [
+        {
+            'index': index,
+            'title': items[index]['title'],
+            'content': items[index]['content'],
+            'resolution': resolution,
+            'aspect_ratio': manifest['aspect_ratio'],
+            'priority': index in flagged,
+            'output_path': os.path.join(output_dir, f"illustration-{index:02d}.png")
+        }
+        for index in approved
+    ]
+
+    successful = 0
+    failed = 0
+
+    def render(job):
+        return generate_illustration(
+            job['title'],
+            job['content'],
+            manifest['style_prompt'],
+            output_dir,
+            job['index'],
+            job['resolution']
         )
 
-        # 保存图片
-        for part in response.parts:
-            if part.inline_data is not None:
-                image = part.as_image()
-                image_path = os.path.join(output_dir, f"illustration-{index:02d}.png")
-                image.save(image_path)
-                return image_path
+    def on_result(result):
+        nonlocal successful, failed
+        job = result['job']
+        if ndjson:
+            write_ndjson(ndjson, result)
+        print(f"序号 {job['index']}: {job['title']}（{result['elapsed']:.1f}s）", file=log)
+        if result.get('fallback'):
+            print(f"  🪧 生成失败，已用本地占位图代替: {result['path']}", file=log)
+            failed += 1
+        elif result['path']:
+            print(f"  ✓ 已保存: {result['path']}", file=log)
+            check_image_dimensions(result['path'], job['resolution'], log=log)
+            print_qa_problems(result, log=log)
+            successful += 1
+        else:
+            print(f"  ✗ 生成失败", file=log)
+            failed += 1
+        print(file=log)
 
-        print(f"警告: 第 {index} 张图片生成失败 - 未收到图片数据", file=sys.stderr)
-        return None
+    scheduler = GenerationScheduler(workers, deadline, LatencyHistory.for_output_dir(output_dir), memory_budget,
+                                    fallback, qa, qa_retries)
+    results = scheduler.run(jobs, render, on_result, on_event=ndjson_event_writer(ndjson))
 
-    except Exception as e:
-        print(f"错误: 第 {index} 张图片生成失败 - {e}", file=sys.stderr)
-        return None
+    print("=" * 60, file=log)
+    print("✨ 终稿生成完成！", file=log)
+    print("=" * 60, file=log)
+    print(f"成功: {successful} 张", file=log)
+    if failed > 0:
+        print(f"失败: {failed} 张", file=log)
+    print_fallbacks(results, file=log)
+    print_qa_summary(scheduler, results, file=log)
+    print_outstanding(scheduler, file=log)
+    print_memory_summary(scheduler, file=log)
+    print_usage_summary(get_default_pool(), file=log)
+    print_cache_summary(get_default_style_cache(), file=log)
+    print(f"\n终稿已保存到: {output_dir}", file=log)
+    print(file=log)
+
+    if scheduler.outstanding:
+        sys.exit(1)
 
 
 def main():
@@ -526,13 +659,39 @@ def main():
   python generate_illustrations.py document.md
   python generate_illustrations.py document.md --resolution 4K
   python generate_illustrations.py document.md --output /custom/output
+  python generate_illustrations.py report.pdf --extract-workers 8
+
+  # 两阶段：先以 1K 生成全部草图，审核后只把通过的序号按 4K 重新生成
+  python generate_illustrations.py document.md --draft --resolution 4K
+  python generate_illustrations.py document.md --finalize 1,3,5-7
+
+  # 自动化流水线：整批最多运行 10 分钟，单次请求最多 120 秒
+  python generate_illustrations.py document.md --style ticket --level h2 --deadline 600 --request-timeout 120
+
+  # 第 3、5 节优先生成，每张图保存后立即在标准输出写一行 NDJSON（其余信息改到标准错误）
+  python generate_illustrations.py document.md --style ticket --level h2 --priority 3,5 --ndjson -
+
+  # 4K 高并发：在途图片数据不超过 512MB
+  python generate_illustrations.py document.md --resolution 4K --workers 32 --memory-budget 512
+
+  # API 限流或不可用时用本地渲染的文字卡片占位，之后重新运行即可覆盖
+  python generate_illustrations.py document.md --style ticket --level h2 --fallback local
+
+  # 保存后自动质检（空白画面、比例不符、文件损坏），未通过的图片最多重新生成 2 次
+  python generate_illustrations.py document.md --style ticket --level h2 --qa --qa-retries 2
 
 环境变量:
-  GEMINI_API_KEY: Google AI API 密钥（必需）
+  GEMINI_API_KEY: Google AI API 密钥（必需，或使用下面的多凭据配置）
+  GEMINI_API_KEYS: 逗号分隔的多个 API 密钥
+  GEMINI_CREDENTIALS_FILE: 凭据池 JSON 文件（每组可设置 endpoint / rpm / weight）
+  GEMINI_POOL_STRATEGY: least-loaded（默认）或 round-robin
+  GEMINI_STYLE_CACHE: 设为 off 关闭风格提示词缓存（默认开启）
+  GEMINI_STYLE_CACHE_TTL: 风格提示词缓存有效期（秒，默认 3600）
+  GEMINI_REQUEST_TIMEOUT: 单次请求超时（秒，默认 300，0 表示不限制）
 """
     )
 
-    parser.add_argument('document', help='文档路径')
+    parser.add_argument('document', help='文档路径（支持 .md / .txt / .pdf / .docx / .html）')
     parser.add_argument(
         '--output',
         default=None,
@@ -554,17 +713,138 @@ def main():
         choices=['h2', 'h3', 'h4'],
         help='标题层级（h2: 二级标题, h3: 三级标题, h4: 四级标题）'
     )
+    parser.add_argument(
+        '--extract-workers',
+        type=int,
+        default=None,
+        help='PDF 并行提取的进程数（默认: CPU 核数）'
+    )
+    parser.add_argument(
+        '--no-style-cache',
+        action='store_true',
+        help='不使用风格提示词上下文缓存，每张图发送完整提示词'
+    )
+    parser.add_argument(
+        '--draft',
+        action='store_true',
+        help='草图模式：以最小分辨率生成全部草图到 images/drafts/，审核后再用 --finalize 生成终稿'
+    )
+    parser.add_argument(
+        '--finalize',
+        metavar='INDICES',
+        default=None,
+        help='终稿模式：按草图清单把审核通过的序号（如 1,3,5-7 或 all）按最终分辨率重新生成'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f'同时进行的生成请求数（默认: {DEFAULT_WORKERS}）'
+    )
+    parser.add_argument(
+        '--deadline',
+        type=float,
+        default=None,
+        help='整批运行的截止时间（秒）；到达后取消在途请求，保留已完成的图片并列出未完成序号'
+    )
+    parser.add_argument(
+        '--request-timeout',
+        type=float,
+        default=None,
+        help=f'单次请求超时（秒，默认: {DEFAULT_REQUEST_TIMEOUT_SECONDS}）'
+    )
+    parser.add_argument(
+        '--memory-budget',
+        type=float,
+        default=None,
+        metavar='MB',
+        help='在途图片数据的内存预算（MB）；超出时暂缓派发新请求，4K 每个请求约占 32MB'
+    )
+    parser.add_argument(
+        '--priority',
+        metavar='INDICES',
+        default=None,
+        help='优先生成的小节序号（如 1,3,5-7），其余按预计耗时从短到长生成'
+    )
+    parser.add_argument(
+        '--reuse',
+        choices=REUSE_MODES,
+        default='off',
+        help='复用相似度足够高的已有图片：off 不复用（默认）、ask 逐个询问、auto 自动复用'
+    )
+    parser.add_argument(
+        '--reuse-threshold',
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f'复用所需的最低相似度（0~1，默认: {DEFAULT_THRESHOLD}）'
+    )
+    parser.add_argument(
+        '--reuse-index',
+        metavar='PATH',
+        default=None,
+        help='相似提示词索引文件（默认: 输出目录下的 .similarity-index.db；多个文档共用时指定同一路径）'
+    )
+    parser.add_argument(
+        '--ndjson',
+        metavar='PATH',
+        default=None,
+        help='每张图保存后立即写入一行 NDJSON 结果；"-" 表示标准输出（其余信息改到标准错误）'
+    )
+    parser.add_argument(
+        '--fallback',
+        choices=FALLBACK_MODES,
+        default='none',
+        help='API 生成失败时的兜底：none 记为失败（默认）、local 用本地渲染的文字卡片占位（需要 Pillow）'
+    )
+    parser.add_argument(
+        '--qa',
+        action='store_true',
+        help='每张图保存后质检（空白 / 纯色画面、比例不符、文件截断或损坏），未通过的重新生成（需要 numpy）'
+    )
+    parser.add_argument(
+        '--qa-retries',
+        type=int,
+        default=DEFAULT_QA_RETRIES,
+        help=f'每张图因质检未通过重新生成的次数上限（默认: {DEFAULT_QA_RETRIES}）'
+    )
 
     args = parser.parse_args()
 
-    print("=" * 60)
-    print("Document Illustrator - 文档配图生成器")
-    print("=" * 60)
-    print()
+    ndjson, log = open_ndjson_stream(args.ndjson) if args.ndjson else (None, sys.stdout)
+    fallback = get_fallback(args.fallback)
+    qa = get_qa(args.qa)
+
+    if args.no_style_cache:
+        get_default_style_cache().enabled = False
+    check_api_setup()
+    if args.request_timeout is not None:
+        get_default_pool().request_timeout = args.request_timeout or None
+
+    print("=" * 60, file=log)
+    print("Document Illustrator - 文档配图生成器", file=log)
+    print("=" * 60, file=log)
+    print(file=log)
+
+    # 终稿阶段只依赖草图清单，无需重新解析文档和选择风格
+    if args.finalize:
+        finalize_drafts(
+            resolve_output_dir(args.document, args.output),
+            args.finalize,
+            args.workers,
+            args.deadline,
+            args.priority,
+            ndjson,
+            megabytes_to_bytes(args.memory_budget),
+            fallback,
+            qa,
+            args.qa_retries,
+            log
+        )
+        return
 
     # 1. 分析文档结构
-    print("📖 分析文档结构...")
-    structure = analyze_document_structure(args.document)
+    print("📖 分析文档结构...", file=log)
+    structure = analyze_document_structure(args.document, args.extract_workers)
 
     # 2. 用户选择生成粒度
     if args.level:
@@ -575,10 +855,10 @@ def main():
             'h3': len(structure['h3']),
             'h4': len(structure['h4'])
         }
-        print(f"\n🎯 使用指定粒度: {selected_level} ({level_counts[selected_level]} 张图片)")
+        print(f"\n🎯 使用指定粒度: {selected_level} ({level_counts[selected_level]} 张图片)", file=log)
     else:
         # 交互模式：提示用户选择
-        print("\n🎯 选择生成粒度...")
+        print("\n🎯 选择生成粒度...", file=log)
         selected_level = prompt_user_for_granularity(structure)
 
     # 3. 用户选择风格
@@ -597,67 +877,62 @@ def main():
             'ticket': '票据风格',
             'vector-illustration': '矢量插画风格'
         }
-        print(f"\n🎨 使用指定风格: {style_names[args.style]}")
+        print(f"\n🎨 使用指定风格: {style_names[args.style]}", file=log)
     else:
         # 交互模式：提示用户选择
-        print("\n🎨 选择配图风格...")
+        print("\n🎨 选择配图风格...", file=log)
         style_file = prompt_user_for_style()
 
     style_prompt = extract_core_prompt(style_file)
 
     # 显示提取的风格提示词预览（前 200 个字符）
-    print(f"\n✓ 已加载风格提示词")
-    print(f"  预览: {style_prompt[:200]}...")
-
-    # 4. 创建输出目录（在文档所在目录下）
-    doc_dir = os.path.dirname(os.path.abspath(args.document))
-
-    if args.output:
-        output_dir = os.path.join(args.output, "images")
-    else:
-        # 默认：文档所在目录下的 images/ 文件夹
-        output_dir = os.path.join(doc_dir, "images")
+    print(f"\n✓ 已加载风格提示词", file=log)
+    print(f"  预览: {style_prompt[:200]}...", file=log)
 
+    # 4. 创建输出目录（默认：文档所在目录下的 images/ 文件夹）
+    output_dir = resolve_output_dir(args.document, args.output)
     os.makedirs(output_dir, exist_ok=True)
 
-    print(f"\n📁 输出目录: {output_dir}")
+    print(f"\n📁 输出目录: {output_dir}", file=log)
 
     # 4.5. 智能合并章节并验证内容覆盖
-    print(f"\n📋 合并子章节内容...")
+    print(f"\n📋 合并子章节内容...", file=log)
     merged_sections = merge_sections_by_level(structure['sections'], selected_level)
 
-    print(f"\n✓ 已合并章节")
-    print(f"  原始章节数: {len(structure['sections'])}")
-    print(f"  合并后章节数: {len(merged_sections)}")
+    print(f"\n✓ 已合并章节", file=log)
+    print(f"  原始章节数: {len(structure['sections'])}", file=log)
+    print(f"  合并后章节数: {len(merged_sections)}", file=log)
 
     # 验证内容覆盖度
-    print(f"\n🔍 验证内容覆盖...")
+    print(f"\n🔍 验证内容覆盖...", file=log)
     verification = verify_content_coverage(structure['sections'], merged_sections)
 
     if verification['all_covered']:
-        print(f"✓ 所有内容已覆盖，无遗漏")
+        print(f"✓ 所有内容已覆盖，无遗漏", file=log)
     else:
-        print(f"⚠️  警告: 发现 {verification['missing_count']} 个章节可能遗漏")
+        print(f"⚠️  警告: 发现 {verification['missing_count']} 个章节可能遗漏", file=log)
+
+    # 统计每个父章节合并了多少子章节（一次遍历，避免对每个父章节重复扫描整个报告）
+    merged_counts = Counter(item['merged_into'] for item in verification['coverage_report']
+                            if item['status'] == 'merged')
 
     # 显示详细的覆盖报告
-    print(f"\n📊 内容覆盖报告:")
+    print(f"\n📊 内容覆盖报告:", file=log)
     for item in verification['coverage_report']:
         if item['status'] == 'MISSING':
-            print(f"  ⚠️  遗漏: {item['title']}")
+            print(f"  ⚠️  遗漏: {item['title']}", file=log)
         elif item['status'] == 'merged':
-            print(f"  ✓ 已整合: {item['title']} → 合并到「{item['merged_into']}」")
+            print(f"  ✓ 已整合: {item['title']} → 合并到「{item['merged_into']}」", file=log)
         elif item['status'] == 'parent':
-            # 统计该父章节合并了多少子章节
-            merged_count = sum(1 for x in verification['coverage_report']
-                             if x.get('merged_into') == item['title'])
+            merged_count = merged_counts[item['title']]
             if merged_count > 0:
-                print(f"  ✓ 父章节: {item['title']} (包含 {merged_count} 个子章节)")
+                print(f"  ✓ 父章节: {item['title']} (包含 {merged_count} 个子章节)", file=log)
             else:
-                print(f"  ✓ 独立章节: {item['title']}")
+                print(f"  ✓ 独立章节: {item['title']}", file=log)
 
     if not verification['all_covered']:
-        print(f"\n❌ 错误: 有内容遗漏，请检查文档结构")
-        print(f"建议: 尝试不同的粒度，或检查文档标题层级是否规范")
+        print(f"\n❌ 错误: 有内容遗漏，请检查文档结构", file=log)
+        print(f"建议: 尝试不同的粒度，或检查文档标题层级是否规范", file=log)
         sys.exit(1)
 
     # 5. 生成配图
@@ -667,51 +942,145 @@ def main():
         print(f"错误: 没有找到级别为 {selected_level} 的小节", file=sys.stderr)
         sys.exit(1)
 
-    print(f"\n🖼️  开始生成 {len(sections)} 张配图...")
-    print(f"分辨率: {args.resolution}")
-    print("=" * 60)
-    print()
+    # 草图模式：先以最小分辨率生成到 drafts/，并记录提示词供终稿阶段复用
+    if args.draft:
+        plan = plan_ladder("16:9", args.resolution)
+        resolution = plan['draft']['resolution']
+        target_dir = drafts_dir(output_dir)
+        os.makedirs(target_dir, exist_ok=True)
+        print(f"\n📝 草图模式", file=log)
+        print_ladder_plan(plan, len(sections), file=log)
+    else:
+        resolution = args.resolution
+        target_dir = output_dir
 
-    successful = 0
-    failed = 0
+    try:
+        flagged = set(parse_indices(args.priority, range(1, len(sections) + 1))) if args.priority else set()
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
 
-    for i, section in enumerate(sections, 1):
-        print(f"正在生成第 {i}/{len(sections)} 张...")
-        print(f"  标题: {section['title']}")
+    print(f"\n🖼️  开始生成 {len(sections)} 张配图...", file=log)
+    print(f"分辨率: {resolution}", file=log)
+    print(f"并发数: {args.workers}", file=log)
+    print("=" * 60, file=log)
+    print(file=log)
 
+    jobs = []
+    for i, section in enumerate(sections, 1):
         # 限制内容长度（避免超过 API 限制）
-        content = section['content']
-        if len(content) > 1000:
-            content = content[:1000] + "..."
-            print(f"  提示: 内容较长，已截取前 1000 字符")
-
-        image_path = generate_illustration(
-            section['title'],
-            content,
+        content, truncated = truncate_content(section['content'])
+        if truncated:
+            print(f"  提示: 第 {i} 张内容较长，已截取前 {MAX_CONTENT_LENGTH} 字符", file=log)
+
+        jobs.append({
+            'index': i,
+            'title': section['title'],
+            'content': content,
+            'resolution': resolution,
+            'priority': i in flagged,
+            'style_prompt': style_prompt,
+            'aspect_ratio': "16:9",
+            'output_path': os.path.join(target_dir, f"illustration-{i:02d}.png")
+        })
+
+    successful = 0
+    failed = 0
+    draft_items = {}
+    total = len(jobs)
+
+    # 相似提示词索引：成功生成的图片都会加入索引，--reuse 开启时先查找可复用的已有图片
+    prompt_index = (SimilarityIndex(args.reuse_index) if args.reuse_index
+                    else SimilarityIndex.for_output_dir(output_dir))
+    jobs, reused = apply_reuse(jobs, prompt_index, args.reuse, args.reuse_threshold, log=log)
+
+    def render(job):
+        return generate_illustration(
+            job['title'],
+            job['content'],
             style_prompt,
-            output_dir,
-            i,
-            args.resolution
+            target_dir,
+            job['index'],
+            job['resolution']
         )
 
-        if image_path:
-            print(f"  ✓ 已保存: {image_path}")
+    def on_result(result):
+        nonlocal successful, failed
+        job = result['job']
+        image_path = result['path']
+        if ndjson:
+            write_ndjson(ndjson, result)
+        index_result(prompt_index, result)
+        print(f"第 {job['index']}/{total} 张: {job['title']}（{result['elapsed']:.1f}s）", file=log)
+
+        if args.draft:
+            draft_items[job['index']] = {
+                'title': job['title'],
+                'content': job['content'],
+                'is_cover': False,
+                'draft_path': image_path
+            }
+
+        if result.get('fallback'):
+            print(f"  🪧 生成失败，已用本地占位图代替: {image_path}", file=log)
+            failed += 1
+        elif result.get('reused_from'):
+            print(f"  ♻️  复用已有图片（相似度 {result['similarity']:.0%}）: {result['reused_from']} → {image_path}", file=log)
+            successful += 1
+        elif image_path:
+            print(f"  ✓ 已保存: {image_path}", file=log)
+            check_image_dimensions(image_path, job['resolution'], log=log)
+            print_qa_problems(result, log=log)
             successful += 1
         else:
-            print(f"  ✗ 生成失败")
+            print(f"  ✗ 生成失败", file=log)
             failed += 1
 
-        print()
+        print(file=log)
+
+    for result in reused:
+        on_result(result)
+
+    scheduler = GenerationScheduler(
+        args.workers,
+        args.deadline,
+        LatencyHistory.for_output_dir(output_dir),
+        megabytes_to_bytes(args.memory_budget),
+        fallback,
+        qa,
+        args.qa_retries
+    )
+    results = scheduler.run(jobs, render, on_result, on_event=ndjson_event_writer(ndjson))
 
     # 6. 完成
-    print("=" * 60)
-    print("✨ 生成完成！")
-    print("=" * 60)
-    print(f"成功: {successful} 张")
+    print("=" * 60, file=log)
+    print("✨ 生成完成！", file=log)
+    print("=" * 60, file=log)
+    print(f"成功: {successful} 张", file=log)
+    if reused:
+        print(f"其中复用已有图片: {len(reused)} 张", file=log)
     if failed > 0:
-        print(f"失败: {failed} 张")
-    print(f"\n所有配图已保存到: {output_dir}")
-    print()
+        print(f"失败: {failed} 张", file=log)
+    print_fallbacks(results, file=log)
+    print_qa_summary(scheduler, results, file=log)
+    print_outstanding(scheduler, file=log)
+    print_memory_summary(scheduler, file=log)
+    print_usage_summary(get_default_pool(), file=log)
+    print_cache_summary(get_default_style_cache(), file=log)
+    prompt_index.close()
+
+    if args.draft:
+        manifest_path = write_manifest(output_dir, plan, style_prompt, draft_items)
+        print(f"\n所有草图已保存到: {target_dir}", file=log)
+        print(f"草图清单: {manifest_path}", file=log)
+        print(f"\n审核后运行以下命令，把通过的序号按 {args.resolution} 生成终稿：", file=log)
+        print(f"  python generate_illustrations.py {args.document} --finalize 1,2,3", file=log)
+    else:
+        print(f"\n所有配图已保存到: {output_dir}", file=log)
+    print(file=log)
+
+    if scheduler.outstanding:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -2,14 +2,20 @@
 """
 Document Illustrator - 单图片生成工具
 由 Claude 负责文档分析和内容归纳，此脚本只负责调用 Gemini API 生成图片
+（生成逻辑在 illustrator_api.py 中，其他 Python 程序可直接导入调用）
 """
 
-import os
 import sys
 import argparse
+import traceback
 from pathlib import Path
 from dotenv import load_dotenv
 
+import illustrator_api
+from credential_pool import MissingCredentials, default_pool, exit_missing_credentials, get_default_pool
+from illustrator_api import ImageJob, build_prompt, build_prompt_suffix, partial_path, save_image_atomically
+from style_cache import get_default_style_cache
+
 
 def find_and_load_env():
     """
@@ -47,22 +53,28 @@ def find_and_load_env():
 find_and_load_env()
 
 
+# 支持的分辨率，从小到大排列；草图阶段使用最小的一档
+RESOLUTIONS = ["1K", "2K", "4K"]
+
+
 def get_image_dimensions(aspect_ratio, resolution):
     """
     根据比例和分辨率返回图片尺寸
 
     参数：
     - aspect_ratio: "16:9" 或 "3:4"
-    - resolution: "2K" 或 "4K"
+    - resolution: "1K"、"2K" 或 "4K"
 
     返回：(width, height)
     """
     dimensions = {
         "16:9": {
+            "1K": (1280, 720),
             "2K": (2560, 1440),
             "4K": (3840, 2160)
         },
         "3:4": {
+            "1K": (960, 1280),
             "2K": (1920, 2560),
             "4K": (2880, 3840)
         }
@@ -72,134 +84,134 @@ def get_image_dimensions(aspect_ratio, resolution):
         raise ValueError(f"不支持的比例: {aspect_ratio}，请使用 '16:9' 或 '3:4'")
 
     if resolution not in dimensions[aspect_ratio]:
-        raise ValueError(f"不支持的分辨率: {resolution}，请使用 '2K' 或 '4K'")
+        raise ValueError(f"不支持的分辨率: {resolution}，请使用 '1K'、'2K' 或 '4K'")
 
     return dimensions[aspect_ratio][resolution]
 
 
-def generate_image(title, content, style_prompt, output_path, aspect_ratio="16:9", resolution="2K", is_cover=False):
+def compare_image_dimensions(width, height, aspect_ratio, resolution, ratio_tolerance=0.03, size_tolerance=0.15):
     """
-    调用 Gemini API 生成单张配图
+    检查图片尺寸是否符合请求的比例和分辨率
 
-    参数：
-    - title: 图片标题
-    - content: 图片内容文本
-    - style_prompt: 风格提示词
-    - output_path: 输出文件路径（包含文件名）
-    - aspect_ratio: 宽高比 "16:9" 或 "3:4"
-    - resolution: 分辨率 "2K" 或 "4K"
-    - is_cover: 是否为封面图
+    比例误差需在 ratio_tolerance 以内；长边不得小于期望值的 (1 - size_tolerance)，
+    更大的输出视为合格（不同模型版本的实际像素可能略大于标称值）
 
-    返回：成功返回图片路径，失败返回 None
+    返回：(是否合格, 说明)
     """
-    try:
-        from google import genai
-        from google.genai import types
-    except ImportError:
-        print("错误: 未安装 google-genai 库", file=sys.stderr)
-        print("请运行: pip install google-genai", file=sys.stderr)
-        sys.exit(1)
+    expected_width, expected_height = get_image_dimensions(aspect_ratio, resolution)
 
-    # 获取 API 密钥和代理配置
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
-        print("错误: 未设置 GEMINI_API_KEY 环境变量", file=sys.stderr)
-        print("请在 .env 文件中设置: GEMINI_API_KEY=your-api-key", file=sys.stderr)
-        sys.exit(1)
+    expected_ratio = expected_width / expected_height
+    actual_ratio = width / height
+    if abs(actual_ratio - expected_ratio) / expected_ratio > ratio_tolerance:
+        return False, f"比例不符: {width}x{height}，期望 {aspect_ratio}"
+
+    if max(width, height) < max(expected_width, expected_height) * (1 - size_tolerance):
+        return False, f"尺寸过小: {width}x{height}，期望约 {expected_width}x{expected_height}（{resolution}）"
+
+    return True, f"{width}x{height}"
 
-    # 获取可选的 API 端点配置（用于代理）
-    api_endpoint = os.environ.get("GEMINI_API_ENDPOINT")
 
-    # 组合提示词
-    if is_cover:
-        # 封面图的提示词，强调概括性和引导性
-        full_prompt = f"""{style_prompt}
+def validate_image_dimensions(image_path, aspect_ratio, resolution, ratio_tolerance=0.03, size_tolerance=0.15):
+    """
+    读取图片并用 compare_image_dimensions() 检查尺寸
 
-这是一张封面图，需要概括整个文档的核心信息。
+    返回：(是否合格, (实际宽, 实际高), 说明)
+    """
+    from PIL import Image
 
-标题：{title}
+    with Image.open(image_path) as image:
+        width, height = image.size
 
-核心内容（需要在一张图中体现）：
-{content}
+    ok, message = compare_image_dimensions(width, height, aspect_ratio, resolution, ratio_tolerance, size_tolerance)
+    return ok, (width, height), message
 
-要求：
-- 封面图需要突出主题，具有引导性
-- 信息要精炼但完整，能代表整个系列
-- 视觉冲击力强，吸引读者注意
-"""
-    else:
-        # 普通内容配图
-        full_prompt = f"""{style_prompt}
 
-根据以下内容生成配图：
+def _exit_missing_genai():
+    print("错误: 未安装 google-genai 库", file=sys.stderr)
+    print("请运行: pip install google-genai", file=sys.stderr)
+    sys.exit(1)
 
-标题：{title}
 
-内容：
-{content}
-"""
+def exit_on_setup_error(result):
+    """
+    命令行脚本遇到环境问题（未安装 google-genai、未配置密钥）时打印提示并退出，
+    这类错误每张图都会重复出现，不必继续生成（只能在主线程中调用）
+    """
+    if result.error_class == 'ImportError':
+        _exit_missing_genai()
+    if result.error_class == 'MissingCredentials':
+        exit_missing_credentials()
 
+
+def check_api_setup():
+    """
+    并发生成前在主线程中检查 google-genai 和 API 密钥，缺失时打印提示并退出
+    （工作线程中的生成只会返回 ImportError / MissingCredentials 结果，不能退出进程）
+    """
     try:
-        # 调用 API（支持代理配置）
-        if api_endpoint:
-            # 使用自定义代理端点
-            from google.genai import types as client_types
-            client = genai.Client(
-                api_key=api_key,
-                http_options=client_types.HttpOptions(api_version='v1beta', base_url=api_endpoint)
-            )
-            print(f"  使用代理: {api_endpoint}")
-        else:
-            client = genai.Client(api_key=api_key)
-
-        response = client.models.generate_content(
-            model="gemini-3-pro-image-preview",  # Nano Banana Pro
-            contents=full_prompt,
-            config=types.GenerateContentConfig(
-                response_modalities=['IMAGE'],
-                image_config=types.ImageConfig(
-                    aspect_ratio=aspect_ratio,
-                    image_size=resolution
-                )
-            )
-        )
-
-        # 检查响应是否有效
-        if response is None:
-            print(f"错误: API 返回空响应", file=sys.stderr)
-            return None
-
-        if not hasattr(response, 'parts') or response.parts is None:
-            print(f"错误: API 响应中没有 parts 属性", file=sys.stderr)
-            print(f"响应内容: {response}", file=sys.stderr)
-            return None
-
-        # 保存图片
-        for part in response.parts:
-            if part.inline_data is not None:
-                image = part.as_image()
-
-                # 确保输出目录存在
-                output_dir = os.path.dirname(output_path)
-                if output_dir:
-                    os.makedirs(output_dir, exist_ok=True)
-
-                image.save(output_path)
-                return output_path
-
-        print(f"警告: 图片生成失败 - 未收到图片数据", file=sys.stderr)
+        from google import genai  # noqa: F401
+    except ImportError:
+        _exit_missing_genai()
+    get_default_pool()
+
+
+def generate_image(title, content, style_prompt, output_path, aspect_ratio="16:9", resolution="2K", is_cover=False,
+                   pool=None, style_cache=None, exit_on_setup=True):
+    """
+    调用 Gemini API 生成单张配图（illustrator_api.generate_image() 的命令行封装，打印错误信息）
+
+    参数：
+    - title: 图片标题
+    - content: 图片内容文本
+    - style_prompt: 风格提示词
+    - output_path: 输出文件路径（包含文件名）
+    - aspect_ratio: 宽高比 "16:9" 或 "3:4"
+    - resolution: 分辨率 "2K" 或 "4K"
+    - is_cover: 是否为封面图
+    - pool: 凭据池（默认使用由环境变量构建的共享凭据池）
+    - style_cache: 风格提示词缓存（默认使用进程内共享的缓存）
+    - exit_on_setup: 未安装 google-genai 或未配置密钥时退出；为 False 时只打印错误并返回 None
+      （用于 --fallback local，由调用方改为渲染本地占位图）
+
+    返回：成功返回图片路径，失败返回 None
+    """
+    job = ImageJob(
+        title=title,
+        content=content,
+        style_prompt=style_prompt,
+        output_path=output_path,
+        aspect_ratio=aspect_ratio,
+        resolution=resolution,
+        is_cover=is_cover
+    )
+    result = illustrator_api.generate_image(job, pool, style_cache)
+    if exit_on_setup:
+        exit_on_setup_error(result)
+
+    if result.ok:
+        return result.path
+
+    if result.error_class in ('ImportError', 'MissingCredentials'):
+        print(f"错误: {result.error}", file=sys.stderr)
         return None
 
-    except Exception as e:
-        import traceback
-        print(f"错误: 图片生成失败 - {e}", file=sys.stderr)
+    if result.exception is not None:
+        print(f"错误: 图片生成失败 - {result.error}", file=sys.stderr)
         print(f"详细错误信息:", file=sys.stderr)
-        traceback.print_exc(file=sys.stderr)
-        return None
+        traceback.print_exception(type(result.exception), result.exception, result.exception.__traceback__,
+                                  file=sys.stderr)
+    elif result.error_class == 'NoImageData':
+        print(f"警告: 图片生成失败 - {result.error}", file=sys.stderr)
+    else:
+        print(f"错误: {result.error}", file=sys.stderr)
+    return None
 
 
 def main():
     """主流程"""
+    # local_renderer 依赖本模块的尺寸表，在此处导入以避免循环导入
+    from local_renderer import FALLBACK_MODES, get_fallback, render_card
+
     parser = argparse.ArgumentParser(
         description='Document Illustrator - 单图片生成工具',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -224,14 +236,31 @@ def main():
     --resolution 2K \\
     --cover
 
+  # 两阶段：先生成 1K 草图，审核通过后按 4K 生成终稿（复用相同提示词）
+  python generate_single_image.py --title "..." --content "..." \\
+    --style-file ../styles/ticket.md --output images/drafts/image-01.png \\
+    --resolution 4K --draft
+  python generate_single_image.py --finalize images/drafts/image-01.png \\
+    --output images/image-01.png
+
+  # API 不可用时用本地渲染的文字卡片占位
+  python generate_single_image.py --title "..." --content "..." \\
+    --style-file ../styles/ticket.md --output images/image-01.png --fallback local
+
 环境变量:
-  GEMINI_API_KEY: Google AI API 密钥（必需）
+  GEMINI_API_KEY: Google AI API 密钥（必需，或使用下面的多凭据配置）
+  GEMINI_API_KEYS: 逗号分隔的多个 API 密钥
+  GEMINI_CREDENTIALS_FILE: 凭据池 JSON 文件（每组可设置 endpoint / rpm / weight）
+  GEMINI_POOL_STRATEGY: least-loaded（默认）或 round-robin
+  GEMINI_STYLE_CACHE: 设为 off 关闭风格提示词缓存（默认开启）
+  GEMINI_STYLE_CACHE_TTL: 风格提示词缓存有效期（秒，默认 3600）
+  GEMINI_REQUEST_TIMEOUT: 请求超时（秒，默认 300，0 表示不限制）
 """
     )
 
-    parser.add_argument('--title', required=True, help='图片标题')
-    parser.add_argument('--content', required=True, help='图片内容文本')
-    parser.add_argument('--style-file', required=True, help='风格提示词文件路径')
+    parser.add_argument('--title', help='图片标题')
+    parser.add_argument('--content', help='图片内容文本')
+    parser.add_argument('--style-file', help='风格提示词文件路径')
     parser.add_argument('--output', required=True, help='输出文件路径（包含文件名）')
     parser.add_argument(
         '--ratio',
@@ -250,44 +279,134 @@ def main():
         action='store_true',
         help='标记为封面图（会使用不同的提示词策略）'
     )
+    parser.add_argument(
+        '--no-style-cache',
+        action='store_true',
+        help='不使用风格提示词上下文缓存，每次发送完整提示词'
+    )
+    parser.add_argument(
+        '--draft',
+        action='store_true',
+        help='草图模式：以最小分辨率快速生成，并在图片旁记录提示词供终稿复用'
+    )
+    parser.add_argument(
+        '--finalize',
+        metavar='DRAFT_PATH',
+        default=None,
+        help='终稿模式：读取草图记录，用完全相同的提示词按最终分辨率生成到 --output'
+    )
+    parser.add_argument(
+        '--request-timeout',
+        type=float,
+        default=None,
+        help='请求超时（秒，默认: 300，0 表示不限制）'
+    )
+    parser.add_argument(
+        '--fallback',
+        choices=FALLBACK_MODES,
+        default='none',
+        help='生成失败时的兜底：none 直接失败（默认）、local 用本地渲染的文字卡片占位（需要 Pillow）'
+    )
 
     args = parser.parse_args()
+    get_fallback(args.fallback)
+
+    if args.no_style_cache:
+        get_default_style_cache().enabled = False
+    if args.request_timeout is not None:
+        # --fallback local 时未配置密钥也继续，生成失败后渲染本地占位图
+        try:
+            default_pool().request_timeout = args.request_timeout or None
+        except MissingCredentials:
+            if args.fallback == 'none':
+                exit_missing_credentials()
+
+    # resolution_ladder 依赖本模块的尺寸表，在此处导入以避免循环导入
+    from resolution_ladder import load_draft_record, plan_ladder, write_draft_record
+
+    if args.finalize:
+        # 终稿：复用草图记录中的标题、内容、风格提示词和比例
+        record = load_draft_record(args.finalize)
+        if record is None:
+            print(f"错误: 未找到草图记录: {args.finalize}", file=sys.stderr)
+            sys.exit(1)
+        title = record['title']
+        content = record['content']
+        style_prompt = record['style_prompt']
+        aspect_ratio = record['aspect_ratio']
+        resolution = record['final_resolution']
+        is_cover = record['is_cover']
+    else:
+        if not (args.title and args.content and args.style_file):
+            parser.error("需要提供 --title、--content 和 --style-file（终稿模式使用 --finalize）")
 
-    # 读取风格提示词
-    style_file_path = Path(args.style_file)
-    if not style_file_path.exists():
-        print(f"错误: 风格文件不存在: {args.style_file}", file=sys.stderr)
-        sys.exit(1)
+        # 读取风格提示词
+        style_file_path = Path(args.style_file)
+        if not style_file_path.exists():
+            print(f"错误: 风格文件不存在: {args.style_file}", file=sys.stderr)
+            sys.exit(1)
 
-    with open(style_file_path, 'r', encoding='utf-8') as f:
-        style_prompt = f.read()
+        with open(style_file_path, 'r', encoding='utf-8') as f:
+            style_prompt = f.read()
 
-    # 显示生成信息
-    image_type = "封面图" if args.cover else "内容配图"
-    print(f"正在生成{image_type}...")
-    print(f"  标题: {args.title}")
-    print(f"  比例: {args.ratio}")
-    print(f"  分辨率: {args.resolution}")
+        title = args.title
+        content = args.content
+        aspect_ratio = args.ratio
+        resolution = args.resolution
+        is_cover = args.cover
+
+    if args.draft:
+        plan = plan_ladder(aspect_ratio, resolution)
+        final_resolution = resolution
+        resolution = plan['draft']['resolution']
 
-    width, height = get_image_dimensions(args.ratio, args.resolution)
+    # 显示生成信息
+    image_type = "封面图" if is_cover else "内容配图"
+    stage = "草图" if args.draft else ("终稿" if args.finalize else "")
+    print(f"正在生成{image_type}{stage}...")
+    print(f"  标题: {title}")
+    print(f"  比例: {aspect_ratio}")
+    print(f"  分辨率: {resolution}")
+
+    width, height = get_image_dimensions(aspect_ratio, resolution)
     print(f"  尺寸: {width}x{height}")
 
     # 生成图片
     result_path = generate_image(
-        title=args.title,
-        content=args.content,
+        title=title,
+        content=content,
         style_prompt=style_prompt,
         output_path=args.output,
-        aspect_ratio=args.ratio,
-        resolution=args.resolution,
-        is_cover=args.cover
+        aspect_ratio=aspect_ratio,
+        resolution=resolution,
+        is_cover=is_cover,
+        exit_on_setup=args.fallback == 'none'
     )
 
     if result_path:
         print(f"✓ 已保存: {result_path}")
+
+        ok, _, message = validate_image_dimensions(result_path, aspect_ratio, resolution)
+        if not ok:
+            print(f"⚠️  尺寸校验未通过: {message}", file=sys.stderr)
+
+        if args.draft:
+            write_draft_record(result_path, {
+                'title': title,
+                'content': content,
+                'style_prompt': style_prompt,
+                'aspect_ratio': aspect_ratio,
+                'draft_resolution': resolution,
+                'final_resolution': final_resolution,
+                'is_cover': is_cover
+            })
+            print(f"  审核通过后生成终稿: python generate_single_image.py --finalize {result_path} --output <终稿路径>")
         sys.exit(0)
     else:
         print(f"✗ 生成失败", file=sys.stderr)
+        if args.fallback == 'local':
+            placeholder = render_card(title, content, args.output, aspect_ratio, resolution, is_cover)
+            print(f"🪧 已用本地占位图代替: {placeholder}", file=sys.stderr)
         sys.exit(1)
 
 
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Document Illustrator - 进程内调用接口
+供其他 Python 程序直接嵌入使用，无需启动子进程：
+以 ImageJob 描述任务，返回结构化的 ImageResult（路径、字节数、耗时、重试次数、错误类型），
+同时提供同步和 async 版本的单张 / 批量生成；所有调用共用进程内的凭据池和风格提示词缓存。
+命令行脚本（generate_single_image.py 等）都是对这里的薄封装
+
+示例：
+    from illustrator_api import ImageJob, generate_images_async
+
+    jobs = [ImageJob(title=..., content=..., style_prompt=..., output_path=...), ...]
+    results = await generate_images_async(jobs, concurrency=16)
+    for result in results:
+        print(result.path if result.ok else f"{result.error_class}: {result.error}")
+"""
+
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+from credential_pool import RunCancelled, cancel_requested, default_pool
+from style_cache import get_default_style_cache
+
+
+MODEL = "gemini-3-pro-image-preview"  # Nano Banana Pro
+
+# async 接口共用线程池的大小，也是批量接口的默认并发数上限
+DEFAULT_CONCURRENCY = 32
+
+
+@dataclass
+class ImageJob:
+    """一张图片的生成任务"""
+    title: str
+    content: str
+    style_prompt: str
+    output_path: str
+    aspect_ratio: str = "16:9"
+    resolution: str = "2K"
+    is_cover: bool = False
+
+
+@dataclass
+class ImageResult:
+    """
+    一张图片的生成结果
+
+    - path: 成功时为图片路径，失败时为 None
+    - size_bytes: 写入的图片字节数
+    - latency: 整个生成过程的耗时（秒，包含凭据切换重试）
+    - retries: 因限流 / 鉴权错误换凭据重试的次数
+    - error_class: 失败时的错误类型名，例如 ClientError、NoImageData；
+      环境问题为 ImportError（未安装 google-genai）或 MissingCredentials（未配置 API 密钥）
+    """
+    job: ImageJob
+    path: Optional[str] = None
+    size_bytes: int = 0
+    latency: float = 0.0
+    retries: int = 0
+    error: Optional[str] = None
+    error_class: Optional[str] = None
+    exception: Optional[BaseException] = field(default=None, repr=False, compare=False)
+
+    @property
+    def ok(self):
+        return self.path is not None
+
+
+def build_prompt_suffix(title, content, is_cover=False):
+    """
+    组合提示词中随图片变化的部分（风格提示词之后的标题和内容）
+
+    参数：
+    - title: 图片标题
+    - content: 图片内容文本
+    - is_cover: 是否为封面图
+
+    返回：提示词后缀字符串
+    """
+    if is_cover:
+        # 封面图的提示词，强调概括性和引导性
+        return f"""这是一张封面图，需要概括整个文档的核心信息。
+
+标题：{title}
+
+核心内容（需要在一张图中体现）：
+{content}
+
+要求：
+- 封面图需要突出主题，具有引导性
+- 信息要精炼但完整，能代表整个系列
+- 视觉冲击力强，吸引读者注意
+"""
+
+    # 普通内容配图
+    return f"""根据以下内容生成配图：
+
+标题：{title}
+
+内容：
+{content}
+"""
+
+
+def build_prompt(title, content, style_prompt, is_cover=False):
+    """
+    组合发送给 Gemini 的完整提示词：风格提示词 + 标题和内容
+
+    参数：
+    - title: 图片标题
+    - content: 图片内容文本
+    - style_prompt: 风格提示词
+    - is_cover: 是否为封面图
+
+    返回：完整提示词字符串
+    """
+    return f"{style_prompt}\n\n{build_prompt_suffix(title, content, is_cover)}"
+
+
+def partial_path(output_path):
+    """图片写入过程中使用的临时文件路径"""
+    root, ext = os.path.splitext(output_path)
+    return f"{root}.part{ext}"
+
+
+def _write_atomically(output_path, write):
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    # 调度器已取消运行时不再写入：取消后清理 .part 文件的步骤不必与这里竞争
+    if cancel_requested():
+        raise RunCancelled("运行已取消，未保存图片")
+    temp_path = partial_path(output_path)
+    write(temp_path)
+    if cancel_requested():
+        os.remove(temp_path)
+        raise RunCancelled("运行已取消，未保存图片")
+    os.replace(temp_path, output_path)
+    return output_path
+
+
+def save_image_atomically(image, output_path, **save_options):
+    """
+    先写入 .part 临时文件再原子替换为目标文件，
+    运行被取消或中断时不会在输出目录留下不完整的图片；
+    在调度器的工作线程中运行被取消后不再保存（抛出 RunCancelled）
+
+    save_options 原样传给 image.save()（例如 PNG 的 pnginfo）
+    """
+    return _write_atomically(output_path, lambda temp_path: image.save(temp_path, **save_options))
+
+
+def save_bytes_atomically(data, output_path):
+    """与 save_image_atomically() 相同，但直接写入已编码的图片字节"""
+    def write(temp_path):
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+
+    return _write_atomically(output_path, write)
+
+
+def save_inline_image(part, output_path):
+    """
+    保存响应中的内联图片
+
+    PNG 数据直接写入 .png 文件，不经过 PIL 解码（4K 图片解码后要占用几十 MB 内存）；
+    其他格式或扩展名不一致时才解码后由 PIL 转换格式
+    """
+    inline_data = part.inline_data
+    if inline_data.mime_type == 'image/png' and output_path.lower().endswith('.png'):
+        return save_bytes_atomically(inline_data.data, output_path)
+    return save_image_atomically(part.as_image(), output_path)
+
+
+def _image_config(aspect_ratio, resolution):
+    try:
+        from google.genai import types
+    except ImportError:
+        raise ImportError("未安装 google-genai 库，请运行: pip install google-genai")
+
+    return types.GenerateContentConfig(
+        response_modalities=['IMAGE'],
+        image_config=types.ImageConfig(
+            aspect_ratio=aspect_ratio,
+            image_size=resolution
+        )
+    )
+
+
+def generate_image(job, pool=None, style_cache=None):
+    """
+    同步生成单张图片，不抛出错误（包括未安装 google-genai、未配置密钥），失败信息记录在返回的 ImageResult 中
+
+    参数：
+    - job: ImageJob
+    - pool: 凭据池（默认使用由环境变量构建的共享凭据池）
+    - style_cache: 风格提示词缓存（默认使用进程内共享的缓存）
+
+    返回：ImageResult
+    """
+    # 风格提示词作为共享前缀（可缓存），只有标题和内容随图片变化
+    if style_cache is None:
+        style_cache = get_default_style_cache()
+    prompt_suffix = build_prompt_suffix(job.title, job.content, job.is_cover)
+
+    attempts = 0
+    config = None
+
+    def request(client, credential):
+        nonlocal attempts
+        attempts += 1
+        return style_cache.generate_content(client, credential, MODEL, job.style_prompt, prompt_suffix, config)
+
+    result = ImageResult(job=job)
+    start_time = time.time()
+    try:
+        config = _image_config(job.aspect_ratio, job.resolution)
+
+        # 凭据池：支持多组 API 密钥 / 端点（未配置时退回单个 GEMINI_API_KEY）
+        if pool is None:
+            pool = default_pool()
+
+        # 遇到限流或鉴权错误时自动换一组凭据重试
+        response = pool.run(request)
+
+        if response is None:
+            result.error_class, result.error = 'EmptyResponse', "API 返回空响应"
+        elif getattr(response, 'parts', None) is None:
+            result.error_class, result.error = 'EmptyResponse', f"API 响应中没有 parts 属性: {response}"
+        else:
+            for part in response.parts:
+                if part.inline_data is not None:
+                    result.path = save_inline_image(part, job.output_path)
+                    result.size_bytes = os.path.getsize(result.path)
+                    break
+            else:
+                result.error_class, result.error = 'NoImageData', "未收到图片数据"
+    except Exception as e:
+        result.error_class = type(e).__name__
+        result.error = str(e)
+        result.exception = e
+
+    result.latency = time.time() - start_time
+    result.retries = max(0, attempts - 1)
+    return result
+
+
+def generate_images(jobs, max_workers=DEFAULT_CONCURRENCY, pool=None, style_cache=None):
+    """
+    同步批量生成，最多 max_workers 张同时进行
+
+    返回：与 jobs 顺序一致的 ImageResult 列表
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+        return list(executor.map(lambda job: generate_image(job, pool, style_cache), jobs))
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """async 接口共用的线程池（genai 的同步客户端在线程中执行，不阻塞事件循环）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DEFAULT_CONCURRENCY, thread_name_prefix='illustrator')
+        return _executor
+
+
+async def generate_image_async(job, pool=None, style_cache=None):
+    """generate_image() 的 async 版本"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(generate_image, job, pool, style_cache))
+
+
+async def generate_images_async(jobs, concurrency=DEFAULT_CONCURRENCY, pool=None, style_cache=None):
+    """
+    async 批量生成，最多 concurrency 张同时进行（上限为共用线程池的大小 DEFAULT_CONCURRENCY）
+
+    返回：与 jobs 顺序一致的 ImageResult 列表
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(job):
+        async with semaphore:
+            return await generate_image_async(job, pool, style_cache)
+
+    return await asyncio.gather(*(run(job) for job in jobs))
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Document Illustrator - 生成结果质检
+图片保存后用 NumPy 在缩小后的像素上快速检查：
+- 文件不完整（截断）或无法解码
+- 尺寸与请求的比例 / 分辨率不符
+- 空白或几乎纯色的画面
+检查在进程池中并行执行；调度器可把未通过的任务重新放回生成队列（见 GenerationScheduler 的 qa 参数）
+"""
+
+import argparse
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from generate_single_image import compare_image_dimensions
+
+
+DEFAULT_QA_RETRIES = 1
+
+# 检查前把长边缩小到约这个像素数（只需判断整体是否空白，不需要细节）
+THUMBNAIL_SIZE = 256
+
+# 灰度标准差低于此值视为纯色画面
+MIN_PIXEL_STD = 3.0
+
+# 亮度相差不超过 DOMINANT_TOLERANCE 的像素占比超过此值视为几乎空白
+MAX_DOMINANT_FRACTION = 0.985
+DOMINANT_TOLERANCE = 4
+
+
+def _thumbnail_pixels(image):
+    """缩小后转为灰度 NumPy 数组（先按整数倍缩小，避免在全尺寸上转换颜色）"""
+    import numpy as np
+
+    factor = max(1, max(image.size) // THUMBNAIL_SIZE)
+    if factor > 1:
+        image = image.reduce(factor)
+    return np.asarray(image.convert('L'), dtype=np.uint8)
+
+
+def blank_problem(pixels):
+    """
+    判断灰度像素数组是否为空白 / 纯色画面
+
+    返回：问题说明，合格时返回 None
+    """
+    import numpy as np
+
+    std = float(pixels.std())
+    if std < MIN_PIXEL_STD:
+        return f"画面几乎是纯色（灰度标准差 {std:.1f}）"
+
+    # 主色及其附近亮度的像素占比
+    histogram = np.bincount(pixels.ravel(), minlength=256)
+    window = np.convolve(histogram, np.ones(2 * DOMINANT_TOLERANCE + 1, dtype=np.int64), mode='same')
+    fraction = float(window.max()) / pixels.size
+    if fraction > MAX_DOMINANT_FRACTION:
+        return f"{fraction:.1%} 的像素为同一颜色，疑似空白画面"
+    return None
+
+
+def check_image(image_path, aspect_ratio, resolution):
+    """
+    检查一张已保存的图片
+
+    返回：问题说明列表，合格时为空列表
+    （未安装 numpy 时抛出 ImportError）
+    """
+    import numpy  # noqa: F401
+    from PIL import Image
+
+    if not os.path.exists(image_path):
+        return ["文件不存在"]
+    if os.path.getsize(image_path) == 0:
+        return ["文件为空"]
+
+    try:
+        # verify() 只校验文件结构（PNG 的块校验和、结束标记），不解码像素
+        with Image.open(image_path) as image:
+            image.verify()
+        with Image.open(image_path) as image:
+            width, height = image.size
+            factor = max(width, height) // THUMBNAIL_SIZE
+            if image.format == 'JPEG' and factor > 1:
+                # JPEG 解码时可直接按 1/2 ~ 1/8 缩小并只解码灰度，不必解码全尺寸彩色图（仍会读完整个文件，截断照样报错）；
+                # PNG 没有缩小解码，只能完整解码后再缩小
+                image.draft('L', (width // factor, height // factor))
+            image.load()
+            pixels = _thumbnail_pixels(image)
+    except Exception as e:
+        return [f"文件不完整或无法解码（{e}）"]
+
+    problems = []
+    ok, message = compare_image_dimensions(width, height, aspect_ratio, resolution)
+    if not ok:
+        problems.append(message)
+    problem = blank_problem(pixels)
+    if problem:
+        problems.append(problem)
+    return problems
+
+
+def _check_image_args(args):
+    return check_image(*args)
+
+
+def check_images(items, workers=None):
+    """
+    用进程池批量检查
+
+    items: (图片路径, 比例, 分辨率) 列表
+    返回：与 items 顺序一致的问题列表的列表
+    """
+    items = list(items)
+    if len(items) <= 1:
+        return [check_image(*item) for item in items]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_check_image_args, items, chunksize=4))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def check_image_in_pool(image_path, aspect_ratio, resolution):
+    """
+    在进程内共享的进程池中检查一张图片（供调度器的工作线程在图片保存后调用）
+
+    返回：问题说明列表
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor()
+        pool = _pool
+    return pool.submit(check_image, image_path, aspect_ratio, resolution).result()
+
+
+def qa_check(job, image_path):
+    """调度器的质检函数：按任务请求的比例和分辨率检查刚保存的图片"""
+    return check_image_in_pool(image_path, job.get('aspect_ratio', '16:9'), job['resolution'])
+
+
+def get_qa(enabled):
+    """
+    命令行 --qa 对应的调度器质检函数：未开启时返回 None
+    （未安装 numpy 时直接退出，避免生成完第一张图才发现无法质检）
+    """
+    if not enabled:
+        return None
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        print("错误: 未安装 numpy 库，无法使用 --qa 质检", file=sys.stderr)
+        print("请运行: pip install numpy", file=sys.stderr)
+        sys.exit(1)
+    return qa_check
+
+
+def main():
+    """主流程"""
+    parser = argparse.ArgumentParser(
+        description='Document Illustrator - 检查已生成的配图',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例用法:
+  # 检查 images/ 下的全部配图，列出未通过的序号
+  python image_qa.py images/ --ratio 16:9 --resolution 2K
+
+  # 在生成时自动质检，未通过的图片最多重新生成 2 次
+  python generate_illustrations.py document.md --style ticket --level h2 --qa --qa-retries 2
+"""
+    )
+    parser.add_argument('paths', nargs='+', help='图片文件或目录（目录下的 *.png）')
+    parser.add_argument('--ratio', choices=['16:9', '3:4'], default='16:9', help='期望的宽高比（默认: 16:9）')
+    parser.add_argument('--resolution', choices=['1K', '2K', '4K'], default='2K', help='期望的分辨率（默认: 2K）')
+    parser.add_argument('--workers', type=int, default=None, help='检查进程数（默认: CPU 核数）')
+
+    args = parser.parse_args()
+    get_qa(True)
+
+    image_paths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            image_paths += sorted(os.path.join(path, name) for name in os.listdir(path)
+                                  if name.lower().endswith('.png') and '.part.' not in name)
+        else:
+            image_paths.append(path)
+    if not image_paths:
+        print("错误: 没有找到图片", file=sys.stderr)
+        sys.exit(1)
+
+    start_time = time.time()
+    results = check_images([(path, args.ratio, args.resolution) for path in image_paths], args.workers)
+    elapsed = time.time() - start_time
+
+    failed = []
+    for path, problems in zip(image_paths, results):
+        if problems:
+            failed.append(path)
+            print(f"✗ {path}: {'；'.join(problems)}")
+
+    print(f"\n已检查 {len(image_paths)} 张（{elapsed:.2f}s），未通过 {len(failed)} 张")
+    indices = [match.group(1) for match in (re.search(r'illustration-(\d+)', os.path.basename(path))
+                                            for path in failed) if match]
+    if indices:
+        print(f"未通过的序号: {','.join(str(int(i)) for i in indices)}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Document Illustrator - 共享任务队列
+多台生成机器共用一个队列：生产者写入解析好的小节，worker 以带租约的方式领取任务，
+租约过期的任务自动重新入队（超过最大尝试次数时标记为失败），结果按提示词哈希幂等提交。
+任务按（提示词哈希, 输出路径）去重：不同文档中内容相同的小节各自有任务，
+后完成的任务直接复制已有结果到自己的输出路径
+"""
+
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+
+
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def prompt_hash(full_prompt, aspect_ratio, resolution):
+    """
+    计算任务的幂等键：相同提示词 + 比例 + 分辨率 视为同一张图
+    """
+    key = f"{aspect_ratio}\n{resolution}\n{full_prompt}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def job_key(payload):
+    """任务的去重键：同一张图（提示词哈希）写到不同输出路径时是不同的任务"""
+    key = f"{payload['prompt_hash']}\n{payload['output_path']}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+# 租约过期且已用完尝试次数的任务记录的错误
+LEASE_EXPIRED_ERROR = "租约过期（worker 可能已崩溃），已达到最大尝试次数"
+
+
+class SQLiteJobQueue:
+    """
+    基于 SQLite 的任务队列，数据库文件可以放在多台机器共享的卷上
+
+    注意：网络文件系统上不能使用 WAL 模式，这里使用默认的回滚日志，
+    所有写操作都在 BEGIN IMMEDIATE 事务中完成，由 SQLite 文件锁保证互斥
+    """
+
+    def __init__(self, path, busy_timeout=30):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    prompt_hash TEXT NOT NULL,
+                    output_path TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'queued',
+                    worker TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    UNIQUE (prompt_hash, output_path)
+                );
+                CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+                CREATE TABLE IF NOT EXISTS results (
+                    prompt_hash TEXT PRIMARY KEY,
+                    output_path TEXT NOT NULL,
+                    worker TEXT,
+                    completed_at REAL NOT NULL
+                );
+            """)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return _ClosingConnection(conn)
+
+    def enqueue(self, payloads):
+        """
+        写入任务，payload 中必须包含 prompt_hash 和 output_path；
+        （提示词哈希, 输出路径）已存在的任务会被忽略
+
+        返回：新写入的任务数
+        """
+        now = time.time()
+        added = 0
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for payload in payloads:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO jobs (prompt_hash, output_path, payload, created_at) VALUES (?, ?, ?, ?)",
+                    (payload['prompt_hash'], payload['output_path'], json.dumps(payload, ensure_ascii=False), now)
+                )
+                added += cursor.rowcount
+            conn.execute("COMMIT")
+        return added
+
+    def claim(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        领取一个任务并加租约，先把租约已过期的任务放回队列
+        （已用完 max_attempts 次尝试的标记为 failed，避免让 worker 崩溃的任务无限重试）
+
+        返回：{'id': ..., 'payload': {...}, 'attempts': ...}，无任务时返回 None
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END, "
+                "last_error = CASE WHEN attempts < ? THEN last_error ELSE ? END, "
+                "worker = NULL, lease_expires = NULL "
+                "WHERE state = 'leased' AND lease_expires < ?",
+                (max_attempts, max_attempts, LEASE_EXPIRED_ERROR, now)
+            )
+            row = conn.execute(
+                "SELECT id, payload, attempts FROM jobs WHERE state = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE id = ?",
+                (worker_id, now + lease_seconds, row['id'])
+            )
+            conn.execute("COMMIT")
+        return {'id': row['id'], 'payload': json.loads(row['payload']), 'attempts': row['attempts'] + 1}
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        续租；租约已被收回（过期后被其他 worker 领取）时返回 False
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                (time.time() + lease_seconds, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def get_result(self, job_hash):
+        """返回已提交的结果 {'output_path': ..., 'worker': ...}，未完成时返回 None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT output_path, worker FROM results WHERE prompt_hash = ?", (job_hash,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def complete(self, job_id, worker_id, job_hash, output_path):
+        """
+        幂等提交结果：同一哈希只记录第一次提交；
+        租约已被收回（过期后被其他 worker 领取）时只记录结果，不改动任务状态
+
+        返回：本次是否为首次提交
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO results (prompt_hash, output_path, worker, completed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (job_hash, output_path, worker_id, time.time())
+            )
+            conn.execute(
+                "UPDATE jobs SET state = 'done', lease_expires = NULL WHERE id = ? AND worker = ?",
+                (job_id, worker_id)
+            )
+            conn.execute("COMMIT")
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        记录失败；未超过最大尝试次数时重新入队，否则标记为 failed
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END, "
+                "worker = NULL, lease_expires = NULL, last_error = ? "
+                "WHERE id = ? AND worker = ?",
+                (max_attempts, str(error), job_id, worker_id)
+            )
+            conn.execute("COMMIT")
+
+    def stats(self):
+        """返回各状态的任务数 {'queued': n, 'leased': n, 'done': n, 'failed': n}"""
+        counts = {'queued': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        with self._connect() as conn:
+            for row in conn.execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state"):
+                counts[row['state']] = row['n']
+        return counts
+
+
+class _ClosingConnection:
+    """with 语句结束时关闭连接（sqlite3 自带的上下文管理器只管事务不关连接）"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.conn.in_transaction:
+            self.conn.execute("ROLLBACK")
+        self.conn.close()
+        return False
+
+
+class RedisJobQueue:
+    """
+    基于 Redis 协议的任务队列，可连接 Redis 或任何兼容 RESP 协议的本地替代服务
+
+    所有「检查后写入」的操作（入队、领取、续租、提交、失败和租约回收）都用 Lua 脚本在服务端原子执行：
+    worker 在任意时刻崩溃都不会丢失任务，租约已被收回的 worker 也无法改动别人持有的任务
+    （兼容服务需要支持 EVAL）
+
+    键布局（prefix 默认 illustrator）：
+    - {prefix}:jobs      hash  任务 id（job_key）→ payload
+    - {prefix}:queue     list  待领取的任务 id
+    - {prefix}:leases    zset  任务 id → 租约到期时间
+    - {prefix}:owners    hash  任务 id → worker
+    - {prefix}:attempts  hash  任务 id → 尝试次数
+    - {prefix}:state     hash  任务 id → 状态
+    - {prefix}:results   hash  prompt_hash → 结果
+    """
+
+    # 只有任务不存在时才写入并入队
+    _ENQUEUE_SCRIPT = """
+        if redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2]) == 0 then
+            return 0
+        end
+        redis.call('HSET', KEYS[2], ARGV[1], 'queued')
+        redis.call('RPUSH', KEYS[3], ARGV[1])
+        return 1
+    """
+
+    # 先回收过期租约（用完尝试次数的标记为 failed），再领取队首任务并加租约
+    _CLAIM_SCRIPT = """
+        local queue, leases, owners, state, attempts, jobs =
+            KEYS[1], KEYS[2], KEYS[3], KEYS[4], KEYS[5], KEYS[6]
+        local now, expires, worker, max_attempts =
+            tonumber(ARGV[1]), tonumber(ARGV[2]), ARGV[3], tonumber(ARGV[4])
+
+        for _, id in ipairs(redis.call('ZRANGEBYSCORE', leases, 0, now)) do
+            redis.call('ZREM', leases, id)
+            redis.call('HDEL', owners, id)
+            if tonumber(redis.call('HGET', attempts, id) or '0') >= max_attempts then
+                redis.call('HSET', state, id, 'failed')
+            else
+                redis.call('HSET', state, id, 'queued')
+                redis.call('LPUSH', queue, id)
+            end
+        end
+
+        local id = redis.call('LPOP', queue)
+        if not id then
+            return false
+        end
+        redis.call('ZADD', leases, expires, id)
+        redis.call('HSET', owners, id, worker)
+        redis.call('HSET', state, id, 'leased')
+        local count = redis.call('HINCRBY', attempts, id, 1)
+        return {id, count, redis.call('HGET', jobs, id)}
+    """
+
+    # 只有仍持有租约的 worker 才能续租
+    _HEARTBEAT_SCRIPT = """
+        if redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] then
+            return 0
+        end
+        return redis.call('ZADD', KEYS[1], 'XX', 'CH', ARGV[3], ARGV[1])
+    """
+
+    # 结果总是幂等记录；只有仍持有租约时才把任务标记为 done
+    _COMPLETE_SCRIPT = """
+        local first = redis.call('HSETNX', KEYS[1], ARGV[3], ARGV[4])
+        if redis.call('HGET', KEYS[3], ARGV[1]) == ARGV[2] then
+            redis.call('ZREM', KEYS[2], ARGV[1])
+            redis.call('HDEL', KEYS[3], ARGV[1])
+            redis.call('HSET', KEYS[4], ARGV[1], 'done')
+        end
+        return first
+    """
+
+    # 只有仍持有租约时才记录失败：未用完尝试次数时重新入队，否则标记为 failed
+    _FAIL_SCRIPT = """
+        local leases, owners, state, attempts, queue = KEYS[1], KEYS[2], KEYS[3], KEYS[4], KEYS[5]
+        local id, worker = ARGV[1], ARGV[2]
+        if redis.call('HGET', owners, id) ~= worker then
+            return 0
+        end
+        redis.call('ZREM', leases, id)
+        redis.call('HDEL', owners, id)
+        if tonumber(redis.call('HGET', attempts, id) or '0') < tonumber(ARGV[3]) then
+            redis.call('HSET', state, id, 'queued')
+            redis.call('RPUSH', queue, id)
+        else
+            redis.call('HSET', state, id, 'failed')
+        end
+        return 1
+    """
+
+    def __init__(self, url, prefix='illustrator'):
+        try:
+            import redis
+        except ImportError:
+            print("错误: 使用 Redis 队列需要安装 redis 库", file=sys.stderr)
+            print("请运行: pip install redis", file=sys.stderr)
+            sys.exit(1)
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._enqueue_script = self.client.register_script(self._ENQUEUE_SCRIPT)
+        self._claim_script = self.client.register_script(self._CLAIM_SCRIPT)
+        self._heartbeat_script = self.client.register_script(self._HEARTBEAT_SCRIPT)
+        self._complete_script = self.client.register_script(self._COMPLETE_SCRIPT)
+        self._fail_script = self.client.register_script(self._FAIL_SCRIPT)
+
+    def _key(self, name):
+        return f"{self.prefix}:{name}"
+
+    def enqueue(self, payloads):
+        added = 0
+        for payload in payloads:
+            added += self._enqueue_script(
+                keys=[self._key('jobs'), self._key('state'), self._key('queue')],
+                args=[job_key(payload), json.dumps(payload, ensure_ascii=False)]
+            )
+        return added
+
+    def claim(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        now = time.time()
+        claimed = self._claim_script(
+            keys=[self._key(name) for name in ('queue', 'leases', 'owners', 'state', 'attempts', 'jobs')],
+            args=[now, now + lease_seconds, worker_id, max_attempts]
+        )
+        if not claimed:
+            return None
+        job_id, attempts, payload = claimed
+        return {'id': job_id, 'payload': json.loads(payload), 'attempts': int(attempts)}
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        return bool(self._heartbeat_script(
+            keys=[self._key('leases'), self._key('owners')],
+            args=[job_id, worker_id, time.time() + lease_seconds]
+        ))
+
+    def get_result(self, job_hash):
+        result = self.client.hget(self._key('results'), job_hash)
+        return json.loads(result) if result else None
+
+    def complete(self, job_id, worker_id, job_hash, output_path):
+        result = json.dumps({'output_path': output_path, 'worker': worker_id}, ensure_ascii=False)
+        return bool(self._complete_script(
+            keys=[self._key('results'), self._key('leases'), self._key('owners'), self._key('state')],
+            args=[job_id, worker_id, job_hash, result]
+        ))
+
+    def fail(self, job_id, worker_id, error, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self._fail_script(
+            keys=[self._key(name) for name in ('leases', 'owners', 'state', 'attempts', 'queue')],
+            args=[job_id, worker_id, max_attempts]
+        )
+
+    def stats(self):
+        counts = {'queued': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        for state in self.client.hvals(self._key('state')):
+            counts[state] = counts.get(state, 0) + 1
+        return counts
+
+
+def open_queue(url):
+    """
+    根据地址打开队列
+
+    - sqlite:///path/to/queue.db 或直接给出文件路径 → SQLiteJobQueue
+    - redis://host:port/db → RedisJobQueue
+    """
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisJobQueue(url)
+    if url.startswith('sqlite:///'):
+        url = url[len('sqlite:///'):]
+    return SQLiteJobQueue(url)
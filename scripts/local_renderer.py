@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Document Illustrator - 本地卡片渲染
+不调用 API，用 Pillow 按 get_image_dimensions() 的精确尺寸绘制黑白票券风格的文字卡片：
+网格排版、多级字号、分割线、打孔线、条形码装饰，支持中文字体。
+用作占位图或 API 限流 / 不可用时的兜底图片；之后照常重新生成即可覆盖为正式图片
+"""
+
+import argparse
+import glob
+import hashlib
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from generate_single_image import get_image_dimensions
+from illustrator_api import save_image_atomically
+
+
+# 占位图在 PNG 文本块中的标记，用于识别需要重新生成的图片
+PLACEHOLDER_KEY = "illustrator-placeholder"
+
+# 自定义中文字体路径
+FONT_ENV = "ILLUSTRATOR_CJK_FONT"
+
+CJK_FONT_CANDIDATES = [
+    # Linux
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",
+    # macOS
+    "/System/Library/Fonts/PingFang.ttc",
+    "/System/Library/Fonts/STHeiti Medium.ttc",
+    "/System/Library/Fonts/Hiragino Sans GB.ttc",
+    "/Library/Fonts/Arial Unicode.ttf",
+    # Windows
+    "C:/Windows/Fonts/msyh.ttc",
+    "C:/Windows/Fonts/simhei.ttf",
+    "C:/Windows/Fonts/simsun.ttc",
+]
+
+FONT_SEARCH_DIRS = ["/usr/share/fonts", "/usr/local/share/fonts", os.path.expanduser("~/.fonts"),
+                    "/System/Library/Fonts", "/Library/Fonts", "C:/Windows/Fonts"]
+FONT_NAME_HINTS = ["CJK", "Han", "Hei", "Song", "Ming", "WenQuanYi", "wqy", "PingFang", "YaHei"]
+
+# 卡片只有黑白灰三种颜色，用 8 位灰度图绘制：内存和 PNG 编码量都只有 RGB 的三分之一
+BLACK = 17
+WHITE = 255
+GRAY = 120
+
+
+_font_path = None
+_font_path_searched = False
+
+
+def find_cjk_font():
+    """
+    查找可显示中文的字体文件：环境变量 ILLUSTRATOR_CJK_FONT → 常见系统路径 → 字体目录中的文件名匹配
+
+    返回：字体路径，找不到时返回 None（退回 Pillow 内置字体，中文可能无法显示）
+    """
+    global _font_path, _font_path_searched
+    if _font_path_searched:
+        return _font_path
+    _font_path_searched = True
+
+    custom = os.environ.get(FONT_ENV)
+    if custom and os.path.exists(custom):
+        _font_path = custom
+        return _font_path
+
+    for path in CJK_FONT_CANDIDATES:
+        if os.path.exists(path):
+            _font_path = path
+            return _font_path
+
+    for directory in FONT_SEARCH_DIRS:
+        if not os.path.isdir(directory):
+            continue
+        for path in glob.glob(os.path.join(directory, "**", "*.tt[fc]"), recursive=True) + \
+                glob.glob(os.path.join(directory, "**", "*.otf"), recursive=True):
+            if any(hint.lower() in os.path.basename(path).lower() for hint in FONT_NAME_HINTS):
+                _font_path = path
+                return _font_path
+
+    print(f"  提示: 未找到中文字体，可通过 {FONT_ENV} 指定字体文件", file=sys.stderr)
+    return None
+
+
+_fonts = {}
+
+
+def _font(size):
+    from PIL import ImageFont
+
+    size = max(8, int(size))
+    if size not in _fonts:
+        path = find_cjk_font()
+        if path:
+            _fonts[size] = ImageFont.truetype(path, size)
+        else:
+            try:
+                _fonts[size] = ImageFont.load_default(size)
+            except TypeError:
+                # Pillow < 10.1 的内置字体不支持字号
+                _fonts[size] = ImageFont.load_default()
+    return _fonts[size]
+
+
+_char_widths = {}
+
+
+def _char_width(font, char):
+    """单个字符的宽度（按字号缓存；逐字累加忽略字距调整，对排版足够准确）"""
+    key = (font.size, char)
+    width = _char_widths.get(key)
+    if width is None:
+        width = _char_widths[key] = font.getlength(char)
+    return width
+
+
+def wrap_text(text, font, max_width, max_lines):
+    """
+    按像素宽度逐字换行（中文没有空格，不能按单词换行），超出 max_lines 时末尾加省略号
+
+    返回：行列表
+    """
+    lines = []
+    for paragraph in text.splitlines():
+        line = []
+        line_width = 0
+        for char in paragraph:
+            char_width = _char_width(font, char)
+            if line and line_width + char_width > max_width:
+                lines.append(''.join(line))
+                if len(lines) > max_lines:
+                    break
+                line, line_width = ([], 0) if char.isspace() else ([char], char_width)
+            else:
+                line.append(char)
+                line_width += char_width
+        lines.append(''.join(line))
+        if len(lines) > max_lines:
+            break
+
+    if len(lines) > max_lines:
+        lines = lines[:max_lines]
+        last = lines[-1]
+        ellipsis_width = _char_width(font, '…')
+        while last and sum(_char_width(font, c) for c in last) + ellipsis_width > max_width:
+            last = last[:-1]
+        lines[-1] = last + '…'
+    return lines
+
+
+def _fit_title(draw, title, max_width, max_height, start_size):
+    """从 start_size 开始缩小字号，直到标题在两行之内放得下"""
+    size = start_size
+    while size > 12:
+        font = _font(size)
+        lines = wrap_text(title, font, max_width, 2)
+        line_height = size * 1.2
+        if len(lines) * line_height <= max_height and not lines[-1].endswith('…'):
+            return font, lines, line_height
+        size = int(size * 0.9)
+    font = _font(size)
+    return font, wrap_text(title, font, max_width, 2), size * 1.2
+
+
+def _barcode(draw, box, seed_text, color=BLACK):
+    """按标题哈希绘制确定性的条形码装饰"""
+    left, top, right, bottom = box
+    bits = ''.join(f"{byte:08b}" for byte in hashlib.sha256(seed_text.encode('utf-8')).digest())
+    unit = max(1, (right - left) / 160)
+    x = left
+    i = 0
+    while x < right:
+        width = unit * (1 + int(bits[i % len(bits)]) + int(bits[(i + 1) % len(bits)]))
+        if i % 2 == 0:
+            draw.rectangle([x, top, min(right, x + width), bottom], fill=color)
+        x += width
+        i += 1
+
+
+def _dashed_line(draw, start, end, dash, width, color=BLACK):
+    (x1, y1), (x2, y2) = start, end
+    length = max(abs(x2 - x1), abs(y2 - y1))
+    steps = int(length // (dash * 2)) + 1
+    for i in range(steps):
+        t1 = i * dash * 2 / length
+        t2 = min(1, (i * dash * 2 + dash) / length)
+        if t1 >= 1:
+            break
+        draw.line([(x1 + (x2 - x1) * t1, y1 + (y2 - y1) * t1), (x1 + (x2 - x1) * t2, y1 + (y2 - y1) * t2)],
+                  fill=color, width=width)
+
+
+def _vertical_text(image, text, font, position, color=BLACK):
+    """竖排（旋转 90°）绘制英文标签"""
+    from PIL import Image, ImageDraw
+
+    width = int(font.getlength(text)) + 4
+    height = int(font.size * 1.3)
+    label = Image.new('LA', (width, height), (WHITE, 0))
+    ImageDraw.Draw(label).text((2, 0), text, font=font, fill=(color, 255))
+    label = label.rotate(90, expand=True)
+    image.paste(label, position, label)
+
+
+def render_card(title, content, output_path, aspect_ratio="16:9", resolution="2K", is_cover=False, index=None):
+    """
+    绘制一张票券风格的文字卡片并保存为 PNG（带占位图标记）
+
+    返回：图片路径
+    """
+    from PIL import Image, ImageDraw
+    from PIL.PngImagePlugin import PngInfo
+
+    width, height = get_image_dimensions(aspect_ratio, resolution)
+    unit = min(width, height) / 100
+    landscape = width > height
+
+    image = Image.new('L', (width, height), WHITE)
+    draw = ImageDraw.Draw(image)
+    line_width = max(2, int(unit * 0.35))
+
+    # 外框
+    margin = int(unit * 4)
+    draw.rectangle([margin, margin, width - margin, height - margin], outline=BLACK, width=line_width)
+
+    # 票根：横版在右侧，竖版在底部，用打孔虚线和半圆缺口分隔
+    notch = int(unit * 3)
+    if landscape:
+        stub_edge = int(width * 0.74)
+        main_box = (margin, margin, stub_edge, height - margin)
+        stub_box = (stub_edge, margin, width - margin, height - margin)
+        _dashed_line(draw, (stub_edge, margin + notch), (stub_edge, height - margin - notch), unit, line_width)
+        for cy in (margin, height - margin):
+            draw.ellipse([stub_edge - notch, cy - notch, stub_edge + notch, cy + notch],
+                         fill=WHITE, outline=BLACK, width=line_width)
+    else:
+        stub_edge = int(height * 0.78)
+        main_box = (margin, margin, width - margin, stub_edge)
+        stub_box = (margin, stub_edge, width - margin, height - margin)
+        _dashed_line(draw, (margin + notch, stub_edge), (width - margin - notch, stub_edge), unit, line_width)
+        for cx in (margin, width - margin):
+            draw.ellipse([cx - notch, stub_edge - notch, cx + notch, stub_edge + notch],
+                         fill=WHITE, outline=BLACK, width=line_width)
+
+    left, top, right, bottom = main_box
+    pad = int(unit * 5)
+    inner_left, inner_right = left + pad, right - pad
+    inner_width = inner_right - inner_left
+    y = top + pad
+
+    # 页眉：小号标签 + 编号，下方细分割线
+    small = _font(unit * 2.6)
+    label = "COVER ★ 封面" if is_cover else "ILLUSTRATION → 配图"
+    draw.text((inner_left, y), label, font=small, fill=BLACK)
+    number = f"No.{index:02d}" if index is not None else "No.--"
+    draw.text((inner_right - small.getlength(number), y), number, font=small, fill=BLACK)
+    y += int(unit * 4.5)
+    draw.line([(inner_left, y), (inner_right, y)], fill=BLACK, width=max(1, line_width // 2))
+    y += int(unit * 4)
+
+    # 主标题：最大字号，最多两行，放不下时逐步缩小
+    title_size = unit * (11 if is_cover else 9)
+    title_font, title_lines, title_line_height = _fit_title(draw, title, inner_width, (bottom - y) * 0.4, title_size)
+    for line in title_lines:
+        draw.text((inner_left, y), line, font=title_font, fill=BLACK)
+        y += title_line_height
+    y += int(unit * 2)
+
+    # 标题下的粗分割线和箭头装饰
+    draw.line([(inner_left, y), (inner_left + inner_width * 0.3, y)], fill=BLACK, width=line_width * 2)
+    arrow = "→ → →"
+    draw.text((inner_right - small.getlength(arrow), y - small.size * 0.6), arrow, font=small, fill=BLACK)
+    y += int(unit * 4)
+
+    # 正文：网格排版，横版分两栏
+    body = _font(unit * (2.8 if landscape else 3.0))
+    body_line_height = body.size * 1.6
+    columns = 2 if landscape else 1
+    gutter = int(unit * 4)
+    column_width = (inner_width - gutter * (columns - 1)) / columns
+    footer_height = int(unit * 8)
+    lines_per_column = max(1, int((bottom - pad - footer_height - y) // body_line_height))
+    lines = wrap_text(' '.join(content.split()), body, column_width, lines_per_column * columns)
+    for column in range(columns):
+        x = inner_left + column * (column_width + gutter)
+        for i, line in enumerate(lines[column * lines_per_column:(column + 1) * lines_per_column]):
+            draw.text((x, y + i * body_line_height), line, font=body, fill=BLACK)
+        if column > 0:
+            gx = x - gutter / 2
+            draw.line([(gx, y), (gx, y + lines_per_column * body_line_height)], fill=GRAY, width=1)
+
+    # 页脚：日期 + 标记
+    footer_y = bottom - pad - small.size
+    draw.line([(inner_left, footer_y - unit * 2), (inner_right, footer_y - unit * 2)],
+              fill=BLACK, width=max(1, line_width // 2))
+    draw.text((inner_left, footer_y), time.strftime("%Y.%m.%d") + "  ↗", font=small, fill=BLACK)
+    mark = "DOCUMENT ILLUSTRATOR®"
+    draw.text((inner_right - small.getlength(mark), footer_y), mark, font=small, fill=BLACK)
+
+    # 票根：竖排 CHECK IN、编号和条形码
+    s_left, s_top, s_right, s_bottom = stub_box
+    stub_pad = int(unit * 4)
+    if landscape:
+        _vertical_text(image, "CHECK IN @ DOCUMENT", _font(unit * 3.2), (s_left + stub_pad, s_top + stub_pad))
+        big = _font(unit * 12)
+        stub_number = f"{index:02d}" if index is not None else "--"
+        draw.text((s_right - stub_pad - big.getlength(stub_number), s_top + stub_pad), stub_number, font=big, fill=BLACK)
+        _barcode(draw, (s_left + stub_pad * 3, s_bottom - stub_pad - unit * 14, s_right - stub_pad,
+                        s_bottom - stub_pad), title)
+    else:
+        draw.text((s_left + stub_pad, s_top + stub_pad), "CHECK IN @ DOCUMENT", font=_font(unit * 3.2), fill=BLACK)
+        _barcode(draw, (s_left + stub_pad, s_bottom - stub_pad - unit * 8, s_right - stub_pad, s_bottom - stub_pad),
+                 title)
+
+    # 黑白卡片压缩率本来就高，用最快的压缩级别换取速度
+    info = PngInfo()
+    info.add_text(PLACEHOLDER_KEY, "local")
+    return save_image_atomically(image, output_path, pnginfo=info, compress_level=1)
+
+
+def is_placeholder(image_path):
+    """判断图片是否为本地渲染的占位图"""
+    from PIL import Image
+
+    try:
+        with Image.open(image_path) as image:
+            return getattr(image, 'text', {}).get(PLACEHOLDER_KEY) is not None
+    except Exception:
+        return False
+
+
+def _render_card_kwargs(card):
+    return render_card(**card)
+
+
+def render_cards(cards, workers=None):
+    """
+    用进程池批量渲染卡片
+
+    cards: render_card() 的参数字典列表
+    返回：与 cards 顺序一致的图片路径列表
+    """
+    cards = list(cards)
+    if len(cards) <= 1:
+        return [render_card(**card) for card in cards]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_render_card_kwargs, cards))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def render_card_in_pool(**card):
+    """
+    在进程内共享的进程池中渲染一张卡片（供调度器的工作线程在 API 失败时调用）
+
+    返回：图片路径
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor()
+        pool = _pool
+    return pool.submit(_render_card_kwargs, card).result()
+
+
+def local_fallback(job):
+    """调度器的兜底函数：把任务渲染为本地占位卡片"""
+    return render_card_in_pool(
+        title=job['title'],
+        content=job['content'],
+        output_path=job['output_path'],
+        aspect_ratio=job.get('aspect_ratio', '16:9'),
+        resolution=job.get('resolution', '2K'),
+        is_cover=job.get('is_cover', False),
+        index=job.get('index')
+    )
+
+
+FALLBACK_MODES = ['none', 'local']
+
+
+def get_fallback(mode):
+    """
+    命令行 --fallback 对应的调度器兜底函数：'none' 返回 None，'local' 返回 local_fallback
+    （未安装 Pillow 时直接退出，避免到 API 失败时才发现无法兜底）
+    """
+    if mode != 'local':
+        return None
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        print("错误: 未安装 Pillow 库，无法使用本地兜底渲染", file=sys.stderr)
+        print("请运行: pip install Pillow", file=sys.stderr)
+        sys.exit(1)
+    return local_fallback
+
+
+def main():
+    """主流程"""
+    parser = argparse.ArgumentParser(
+        description='Document Illustrator - 本地卡片渲染（不调用 API）',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例用法:
+  python local_renderer.py --title "AI 工具演化" --content "从 Rules 到 Skills..." \\
+    --output images/illustration-01.png --ratio 16:9 --resolution 2K
+
+环境变量:
+  ILLUSTRATOR_CJK_FONT: 中文字体文件路径（默认自动查找系统字体）
+"""
+    )
+    parser.add_argument('--title', required=True, help='图片标题')
+    parser.add_argument('--content', required=True, help='图片内容文本')
+    parser.add_argument('--output', required=True, help='输出文件路径')
+    parser.add_argument('--ratio', choices=['16:9', '3:4'], default='16:9', help='宽高比（默认: 16:9）')
+    parser.add_argument('--resolution', choices=['1K', '2K', '4K'], default='2K', help='分辨率（默认: 2K）')
+    parser.add_argument('--cover', action='store_true', help='封面样式')
+    parser.add_argument('--index', type=int, default=None, help='卡片编号')
+
+    args = parser.parse_args()
+
+    start_time = time.time()
+    path = render_card(args.title, args.content, args.output, args.ratio, args.resolution, args.cover, args.index)
+    print(f"✓ 已保存: {path}（{(time.time() - start_time) * 1000:.0f}ms）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Document Illustrator - 队列生产者 / worker
+多台机器共用一个任务队列生成同一批配图：
+  enqueue: 解析文档，把每个小节作为任务写入队列
+  work:    启动若干 worker 进程领取任务并生成图片
+  status:  查看队列状态
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import threading
+import time
+
+from credential_pool import get_default_pool, print_usage_summary
+from style_cache import get_default_style_cache, print_cache_summary
+from job_queue import (
+    DEFAULT_LEASE_SECONDS,
+    DEFAULT_MAX_ATTEMPTS,
+    open_queue,
+    prompt_hash,
+)
+
+
+def build_jobs(document, style, level, output_dir, aspect_ratio, resolution, extract_workers=None):
+    """
+    解析文档并为每个合并后的小节构造任务 payload
+
+    返回：payload 列表
+    """
+    from generate_illustrations import extract_core_prompt, get_style_file, prepare_sections, truncate_content
+    from illustrator_api import build_prompt
+
+    sections = prepare_sections(document, level, extract_workers)
+
+    style_prompt = extract_core_prompt(get_style_file(style))
+
+    jobs = []
+    for i, section in enumerate(sections, 1):
+        content, _ = truncate_content(section['content'])
+        full_prompt = build_prompt(section['title'], content, style_prompt)
+        jobs.append({
+            'index': i,
+            'title': section['title'],
+            'content': content,
+            'style_prompt': style_prompt,
+            'output_path': os.path.join(output_dir, f"illustration-{i:02d}.png"),
+            'aspect_ratio': aspect_ratio,
+            'resolution': resolution,
+            'is_cover': False,
+            'prompt_hash': prompt_hash(full_prompt, aspect_ratio, resolution),
+        })
+    return jobs
+
+
+def _temp_output_path(output_path, worker_id):
+    root, ext = os.path.splitext(output_path)
+    return f"{root}.{worker_id}.part{ext}"
+
+
+def _copy_result(source_path, output_path, worker_id):
+    """把已有结果复制到本任务的输出路径（同样先写临时文件再原子替换）"""
+    if os.path.abspath(source_path) == os.path.abspath(output_path):
+        return
+    temp_path = _temp_output_path(output_path, worker_id)
+    shutil.copyfile(source_path, temp_path)
+    os.replace(temp_path, output_path)
+
+
+def run_job(queue, job, worker_id, lease_seconds, max_attempts):
+    """
+    执行单个任务：生成期间定期续租，完成后按提示词哈希幂等提交
+    同一提示词已有结果时（其他文档的相同小节，或租约过期后被重复领取）直接复制到本任务的输出路径
+    """
+    from illustrator_api import ImageJob, generate_image
+
+    payload = job['payload']
+    job_hash = payload['prompt_hash']
+    output_path = payload['output_path']
+
+    existing = queue.get_result(job_hash)
+    if existing and os.path.exists(existing['output_path']):
+        _copy_result(existing['output_path'], output_path, worker_id)
+        queue.complete(job['id'], worker_id, job_hash, output_path)
+        return output_path
+
+    stop_heartbeat = threading.Event()
+
+    def heartbeat():
+        while not stop_heartbeat.wait(lease_seconds / 3):
+            if not queue.heartbeat(job['id'], worker_id, lease_seconds):
+                print(f"  ⚠️  [{worker_id}] 第 {payload['index']} 张的租约已失效", file=sys.stderr)
+                return
+
+    heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+    heartbeat_thread.start()
+
+    # 先写入临时文件，成功后再原子替换，避免多个 worker 写坏同一个文件
+    temp_path = _temp_output_path(output_path, worker_id)
+    try:
+        result = generate_image(ImageJob(
+            title=payload['title'],
+            content=payload['content'],
+            style_prompt=payload['style_prompt'],
+            output_path=temp_path,
+            aspect_ratio=payload['aspect_ratio'],
+            resolution=payload['resolution'],
+            is_cover=payload['is_cover']
+        ))
+    finally:
+        stop_heartbeat.set()
+        heartbeat_thread.join()
+
+    if not result.ok:
+        print(f"  ✗ [{worker_id}] 第 {payload['index']} 张生成失败（{result.error_class}）: {result.error}",
+              file=sys.stderr)
+        queue.fail(job['id'], worker_id, f"{result.error_class}: {result.error}", max_attempts)
+        return None
+
+    # 结果表只记录同一提示词的第一次提交，但本任务的输出路径总要写入
+    os.replace(temp_path, output_path)
+    queue.complete(job['id'], worker_id, job_hash, output_path)
+    return output_path
+
+
+def worker_loop(queue_url, worker_id, lease_seconds, max_attempts, wait):
+    """
+    worker 进程主循环：不断领取任务直到队列清空（wait 模式下持续轮询）
+    """
+    from generate_single_image import check_api_setup
+    check_api_setup()
+
+    queue = open_queue(queue_url)
+    successful = 0
+    failed = 0
+
+    while True:
+        job = queue.claim(worker_id, lease_seconds, max_attempts)
+        if job is None:
+            # 仍有进行中的任务时继续等待：其 worker 若已失联，租约过期后任务会重新入队
+            if wait or queue.stats()['leased'] > 0:
+                time.sleep(2)
+                continue
+            break
+
+        payload = job['payload']
+        print(f"[{worker_id}] 正在生成第 {payload['index']} 张（第 {job['attempts']} 次尝试）: {payload['title']}")
+        try:
+            result_path = run_job(queue, job, worker_id, lease_seconds, max_attempts)
+        except Exception as e:
+            queue.fail(job['id'], worker_id, e, max_attempts)
+            result_path = None
+            print(f"  ✗ [{worker_id}] 第 {payload['index']} 张出错: {e}", file=sys.stderr)
+
+        if result_path:
+            print(f"  ✓ [{worker_id}] 已保存: {result_path}")
+            successful += 1
+        else:
+            print(f"  ✗ [{worker_id}] 第 {payload['index']} 张生成失败")
+            failed += 1
+
+    print(f"[{worker_id}] 结束：成功 {successful} 张，失败 {failed} 张")
+    if successful or failed:
+        print_usage_summary(get_default_pool())
+        print_cache_summary(get_default_style_cache())
+
+
+def main():
+    """主流程"""
+    parser = argparse.ArgumentParser(
+        description='Document Illustrator - 共享队列生成',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例用法:
+  # 生产者：解析文档并入队
+  python queue_worker.py enqueue document.md --queue /shared/queue.db --style ticket --level h2
+
+  # 每台生成机器上启动 4 个 worker 进程
+  python queue_worker.py work --queue /shared/queue.db --processes 4
+
+  # 使用 Redis（或兼容 Redis 协议的本地服务）作为队列
+  python queue_worker.py work --queue redis://127.0.0.1:6379/0
+
+  # 查看队列状态
+  python queue_worker.py status --queue /shared/queue.db
+"""
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    enqueue_parser = subparsers.add_parser('enqueue', help='解析文档并写入任务')
+    enqueue_parser.add_argument('document', help='文档路径')
+    enqueue_parser.add_argument('--queue', required=True, help='队列地址（SQLite 文件路径或 redis:// 地址）')
+    enqueue_parser.add_argument(
+        '--style',
+        choices=['gradient-glass', 'ticket', 'vector-illustration'],
+        required=True,
+        help='配图风格'
+    )
+    enqueue_parser.add_argument('--level', choices=['h2', 'h3', 'h4'], required=True, help='标题层级')
+    enqueue_parser.add_argument('--output', default=None, help='输出目录（默认：文档所在目录下的 images/ 文件夹）')
+    enqueue_parser.add_argument('--ratio', choices=['16:9', '3:4'], default='16:9', help='宽高比（默认: 16:9）')
+    enqueue_parser.add_argument('--resolution', choices=['2K', '4K'], default='2K', help='分辨率（默认: 2K）')
+    enqueue_parser.add_argument('--extract-workers', type=int, default=None, help='PDF 并行提取的进程数')
+
+    work_parser = subparsers.add_parser('work', help='启动 worker 领取任务')
+    work_parser.add_argument('--queue', required=True, help='队列地址（SQLite 文件路径或 redis:// 地址）')
+    work_parser.add_argument('--processes', type=int, default=1, help='本机 worker 进程数（默认: 1）')
+    work_parser.add_argument('--lease', type=int, default=DEFAULT_LEASE_SECONDS,
+                             help=f'租约时长（秒，默认: {DEFAULT_LEASE_SECONDS}）')
+    work_parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                             help=f'单个任务最大尝试次数（默认: {DEFAULT_MAX_ATTEMPTS}）')
+    work_parser.add_argument('--wait', action='store_true', help='队列为空时继续等待新任务')
+
+    status_parser = subparsers.add_parser('status', help='查看队列状态')
+    status_parser.add_argument('--queue', required=True, help='队列地址（SQLite 文件路径或 redis:// 地址）')
+
+    args = parser.parse_args()
+
+    if args.command == 'enqueue':
+        if args.output:
+            output_dir = os.path.join(args.output, "images")
+        else:
+            output_dir = os.path.join(os.path.dirname(os.path.abspath(args.document)), "images")
+        os.makedirs(output_dir, exist_ok=True)
+
+        jobs = build_jobs(args.document, args.style, args.level, output_dir,
+                          args.ratio, args.resolution, args.extract_workers)
+        added = open_queue(args.queue).enqueue(jobs)
+        print(f"✓ 已入队 {added} 个任务（共 {len(jobs)} 个小节，{len(jobs) - added} 个已在队列中）")
+        print(f"📁 输出目录: {output_dir}")
+
+    elif args.command == 'work':
+        hostname = socket.gethostname()
+        processes = []
+        for n in range(max(1, args.processes)):
+            worker_id = f"{hostname}-{os.getpid()}-{n}"
+            process = multiprocessing.Process(
+                target=worker_loop,
+                args=(args.queue, worker_id, args.lease, args.max_attempts, args.wait)
+            )
+            process.start()
+            processes.append(process)
+
+        for process in processes:
+            process.join()
+
+        stats = open_queue(args.queue).stats()
+        print(f"\n📊 队列状态: 待领取 {stats['queued']}，进行中 {stats['leased']}，"
+              f"已完成 {stats['done']}，失败 {stats['failed']}")
+
+    elif args.command == 'status':
+        stats = open_queue(args.queue).stats()
+        print(f"待领取: {stats['queued']}")
+        print(f"进行中: {stats['leased']}")
+        print(f"已完成: {stats['done']}")
+        print(f"失败:   {stats['failed']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,597 @@
+#!/usr/bin/env python3
+"""
+Document Illustrator - 书籍级文档按章节分片生成
+把长文档按章节切分，按各章内容大小分配配图数量，每章生成一张章节封面和若干内容配图：
+- 每章输出到独立目录（images/chapters/chapter-NN/），记录自己的 chapter.json，可单独重新生成
+- 所有章节的任务交给同一个调度器并发执行，中断后重新运行只补齐未完成的图片
+- images/chapters/index.json 汇总全部章节的标题、配图数量和完成状态
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+
+from credential_pool import DEFAULT_REQUEST_TIMEOUT_SECONDS, get_default_pool, print_usage_summary
+from generate_illustrations import (
+    analyze_document_structure,
+    extract_core_prompt,
+    get_style_file,
+    merge_sections_by_level,
+    resolve_output_dir,
+    truncate_content,
+)
+from generate_single_image import RESOLUTIONS, check_api_setup, get_image_dimensions
+from illustrator_api import build_prompt
+from image_qa import DEFAULT_QA_RETRIES, get_qa
+from job_queue import prompt_hash
+from local_renderer import FALLBACK_MODES, get_fallback
+from resolution_ladder import parse_indices
+from scheduler import (
+    DEFAULT_WORKERS,
+    GenerationScheduler,
+    LatencyHistory,
+    megabytes_to_bytes,
+    ndjson_event_writer,
+    open_ndjson_stream,
+    print_fallbacks,
+    print_memory_summary,
+    print_outstanding,
+    print_qa_summary,
+    write_ndjson,
+)
+from style_cache import get_default_style_cache, print_cache_summary
+
+
+CHAPTERS_DIR_NAME = "chapters"
+INDEX_NAME = "index.json"
+CHAPTER_MANIFEST_NAME = "chapter.json"
+
+LEVELS = ['h2', 'h3', 'h4']
+LEVEL_NUMBERS = {'h2': 2, 'h3': 3, 'h4': 4}
+
+# 未指定 --budget 时，按全文每多少字符一张内容配图估算总数
+DEFAULT_CHARS_PER_IMAGE = 3000
+
+
+def split_chapters(sections, chapter_level='h2'):
+    """
+    按章节标题切分：每个不低于 chapter_level 的标题开始一章，其后更低层级的小节都属于这一章
+    （第一个章节标题之前的小节单独成章）
+
+    返回：[{'number': 1, 'title': ..., 'intro': 章节标题下的正文, 'sections': [子小节...], 'size': 字符数}, ...]
+    """
+    chapter_level_num = LEVEL_NUMBERS[chapter_level]
+    chapters = []
+    current = None
+
+    for section in sections:
+        if LEVEL_NUMBERS[section['level']] <= chapter_level_num or current is None:
+            is_heading = LEVEL_NUMBERS[section['level']] <= chapter_level_num
+            current = {
+                'number': len(chapters) + 1,
+                'title': section['title'],
+                'intro': section['content'] if is_heading else '',
+                'sections': [] if is_heading else [section],
+                'size': len(section['title']) + len(section['content'])
+            }
+            chapters.append(current)
+        else:
+            current['sections'].append(section)
+            current['size'] += len(section['title']) + len(section['content'])
+
+    return chapters
+
+
+def chapter_units(chapter, level):
+    """
+    章节内可单独配图的内容单元：子小节按 level 合并（同 merge_sections_by_level）；
+    没有子小节时没有内容单元，章节导语只用于封面（否则封面和内容配图会用同一段文字各生成一张）
+
+    返回：[{'title': ..., 'content': ...}, ...]
+    """
+    if not chapter['sections']:
+        return []
+    return merge_sections_by_level(chapter['sections'], level)
+
+
+def allocate_budget(sizes, capacities, budget):
+    """
+    按大小比例分配配图数量（最大余数法），每章不超过其内容单元数
+
+    返回：与 sizes 顺序一致的数量列表
+    """
+    total = sum(size for size, capacity in zip(sizes, capacities) if capacity > 0)
+    if not total or budget <= 0:
+        return [0] * len(sizes)
+
+    quotas = [budget * size / total if capacity > 0 else 0 for size, capacity in zip(sizes, capacities)]
+    counts = [min(capacity, int(quota)) for quota, capacity in zip(quotas, capacities)]
+
+    # 余下的名额按小数部分从大到小补给还有空位的章节（封顶章节多出的份额也在这里重新分配）
+    remaining = budget - sum(counts)
+    order = sorted(range(len(sizes)), key=lambda i: quotas[i] - counts[i], reverse=True)
+    while remaining > 0:
+        progressed = False
+        for i in order:
+            if remaining == 0:
+                break
+            if counts[i] < capacities[i]:
+                counts[i] += 1
+                remaining -= 1
+                progressed = True
+        if not progressed:
+            break
+    return counts
+
+
+def group_units(units, count):
+    """
+    把内容单元按顺序切成 count 组，每组内容量大致相同（相邻单元合并，不丢失内容）
+
+    返回：[{'title': 组内第一节标题, 'content': ..., 'merged_from': [...]}, ...]
+    """
+    if count <= 0:
+        return []
+    if count >= len(units):
+        groups = [[unit] for unit in units]
+    else:
+        sizes = [len(unit['content']) + len(unit['title']) for unit in units]
+        total = sum(sizes)
+        groups = []
+        current = []
+        accumulated = 0
+        for i, (unit, size) in enumerate(zip(units, sizes)):
+            current.append(unit)
+            accumulated += size
+            groups_left = count - len(groups) - 1
+            units_left = len(units) - i - 1
+            # 累计内容量达到下一个等分点，或剩余单元恰好每组一个时结束当前组
+            if groups_left > 0 and (accumulated >= total * (len(groups) + 1) / count or units_left == groups_left):
+                groups.append(current)
+                current = []
+        groups.append(current)
+
+    merged = []
+    for group in groups:
+        parts = [group[0]['content']] if group[0]['content'] else []
+        parts += [f"【{unit['title']}】\n{unit['content']}" for unit in group[1:]]
+        merged.append({
+            'title': group[0]['title'],
+            'content': '\n\n'.join(parts),
+            'merged_from': [unit['title'] for unit in group]
+        })
+    return merged
+
+
+def cover_content(chapter, units):
+    """章节封面的内容：章节导语 + 本章各小节标题"""
+    parts = [chapter['intro'].strip()] if chapter['intro'].strip() else []
+    if units:
+        parts.append("本章包含：\n" + '\n'.join(f"- {unit['title']}" for unit in units))
+    return '\n\n'.join(parts) or chapter['title']
+
+
+def chapters_dir(output_dir):
+    return os.path.join(output_dir, CHAPTERS_DIR_NAME)
+
+
+def chapter_dir_name(number):
+    return f"chapter-{number:02d}"
+
+
+def _write_json(path, data):
+    """先写临时文件再原子替换，中断时不会留下写了一半的清单"""
+    temp_path = f"{path}.part"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
+
+
+def load_chapter_manifest(chapter_dir):
+    """读取章节清单，不存在时返回 None"""
+    path = os.path.join(chapter_dir, CHAPTER_MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def plan_book(chapters, level, budget, output_dir):
+    """
+    为每章分配配图数量并生成内容分组
+
+    返回：[{'chapter': ..., 'dir': ..., 'budget': 内容配图数, 'cover': {...}, 'groups': [...]}, ...]
+    """
+    units = [chapter_units(chapter, level) for chapter in chapters]
+    counts = allocate_budget([c['size'] for c in chapters], [len(u) for u in units], budget)
+
+    plan = []
+    for chapter, chapter_unit_list, count in zip(chapters, units, counts):
+        plan.append({
+            'chapter': chapter,
+            'dir': os.path.join(chapters_dir(output_dir), chapter_dir_name(chapter['number'])),
+            'budget': count,
+            'cover': {'title': chapter['title'], 'content': cover_content(chapter, chapter_unit_list)},
+            'groups': group_units(chapter_unit_list, count)
+        })
+    return plan
+
+
+def build_chapter_jobs(entry, style_prompt, aspect_ratio, resolution):
+    """
+    为一章构造任务：序号 0 为章节封面，1.. 为内容配图
+
+    返回：任务列表（每个任务带 prompt_hash，用于判断已有图片是否可以跳过）
+    """
+    number = entry['chapter']['number']
+    items = [(0, entry['cover'], True, "cover.png")]
+    items += [(i, group, False, f"illustration-{i:02d}.png") for i, group in enumerate(entry['groups'], 1)]
+
+    jobs = []
+    for index, item, is_cover, file_name in items:
+        content, _ = truncate_content(item['content'])
+        jobs.append({
+            'index': index,
+            'variant': chapter_dir_name(number),
+            'chapter': number,
+            'title': item['title'],
+            'content': content,
+            'style_prompt': style_prompt,
+            'output_path': os.path.join(entry['dir'], file_name),
+            'aspect_ratio': aspect_ratio,
+            'resolution': resolution,
+            'is_cover': is_cover,
+            'prompt_hash': prompt_hash(build_prompt(item['title'], content, style_prompt, is_cover),
+                                       aspect_ratio, resolution),
+        })
+    return jobs
+
+
+def resume_state(entry, jobs, force=False):
+    """
+    对照章节清单找出已完成的图片：文件存在、状态为 done 且提示词哈希一致的任务可以跳过；
+    删除清单中不再属于本次计划的旧图片（例如配图数量变少）
+
+    返回：{文件名: 状态}
+    """
+    manifest = load_chapter_manifest(entry['dir']) or {'images': []}
+    planned = {os.path.basename(job['output_path']): job for job in jobs}
+
+    status = {}
+    for image in manifest['images']:
+        path = os.path.join(entry['dir'], image['file'])
+        job = planned.get(image['file'])
+        if job is None:
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+        if (not force and image['status'] == 'done' and image['prompt_hash'] == job['prompt_hash']
+                and os.path.exists(path)):
+            status[image['file']] = 'done'
+
+    for file_name in planned:
+        status.setdefault(file_name, 'pending')
+    return status
+
+
+def manifest_status(entry, jobs):
+    """
+    本次未选中的章节：状态直接取自已有的章节清单（清单和图片保持不变），
+    没有清单时计划中的图片都为 pending
+
+    返回：{文件名: 状态}
+    """
+    manifest = load_chapter_manifest(entry['dir'])
+    if manifest is None:
+        return {os.path.basename(job['output_path']): 'pending' for job in jobs}
+    return {image['file']: image['status'] for image in manifest['images']}
+
+
+def write_chapter_manifest(entry, jobs, status):
+    """写入章节清单 chapter.json"""
+    chapter = entry['chapter']
+    _write_json(os.path.join(entry['dir'], CHAPTER_MANIFEST_NAME), {
+        'number': chapter['number'],
+        'title': chapter['title'],
+        'size': chapter['size'],
+        'budget': entry['budget'],
+        'images': [
+            {
+                'index': job['index'],
+                'file': os.path.basename(job['output_path']),
+                'title': job['title'],
+                'is_cover': job['is_cover'],
+                'merged_from': ([] if job['is_cover'] else entry['groups'][job['index'] - 1]['merged_from']),
+                'prompt_hash': job['prompt_hash'],
+                'status': status[os.path.basename(job['output_path'])]
+            }
+            for job in jobs
+        ]
+    })
+
+
+def chapter_status(status):
+    """章节整体状态：全部完成为 done，部分完成为 partial，否则为 pending"""
+    done = sum(1 for value in status.values() if value == 'done')
+    if done == len(status):
+        return 'done'
+    return 'partial' if done else 'pending'
+
+
+def write_index(output_dir, document, options, plan, statuses):
+    """写入全书索引 index.json"""
+    chapters = []
+    for entry in plan:
+        status = statuses[entry['chapter']['number']]
+        chapters.append({
+            'number': entry['chapter']['number'],
+            'title': entry['chapter']['title'],
+            'dir': os.path.relpath(entry['dir'], chapters_dir(output_dir)),
+            'size': entry['chapter']['size'],
+            'budget': entry['budget'],
+            'images': len(status),
+            'done': sum(1 for value in status.values() if value == 'done'),
+            'status': chapter_status(status)
+        })
+    path = os.path.join(chapters_dir(output_dir), INDEX_NAME)
+    _write_json(path, {'document': os.path.abspath(document), **options, 'chapters': chapters})
+    return path
+
+
+def result_status(result):
+    """把调度器结果转换为清单中的图片状态"""
+    if not result['path']:
+        return 'failed'
+    if result.get('fallback'):
+        return 'placeholder'
+    if result.get('qa'):
+        return 'qa_failed'
+    return 'done'
+
+
+def main():
+    """主流程"""
+    parser = argparse.ArgumentParser(
+        description='Document Illustrator - 书籍级文档按章节分片生成',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例用法:
+  # 按 ## 切分章节，全书共约 120 张内容配图（按各章内容量分配），每章另有一张封面
+  python render_book.py manual.md --style ticket --budget 120 --workers 16
+
+  # 中断后重新运行同一命令：已完成的图片自动跳过
+  python render_book.py manual.md --style ticket --budget 120 --workers 16
+
+  # 只重新生成第 3 章和第 7~9 章
+  python render_book.py manual.md --style ticket --budget 120 --chapters 3,7-9 --force
+
+输出目录:
+  images/chapters/index.json                     全书索引
+  images/chapters/chapter-NN/cover.png           章节封面
+  images/chapters/chapter-NN/illustration-NN.png 内容配图
+  images/chapters/chapter-NN/chapter.json        章节清单
+"""
+    )
+    parser.add_argument('document', help='文档路径（支持 .md / .txt / .pdf / .docx / .html）')
+    parser.add_argument(
+        '--style',
+        choices=['gradient-glass', 'ticket', 'vector-illustration'],
+        required=True,
+        help='配图风格'
+    )
+    parser.add_argument('--chapter-level', choices=LEVELS[:-1], default='h2', help='章节标题层级（默认: h2）')
+    parser.add_argument(
+        '--level',
+        choices=LEVELS,
+        default=None,
+        help='章节内合并小节的层级（默认: 章节层级的下一级）'
+    )
+    parser.add_argument(
+        '--budget',
+        type=int,
+        default=None,
+        help=f'全书内容配图总数，按各章内容量分配（默认: 每 {DEFAULT_CHARS_PER_IMAGE} 字符一张）'
+    )
+    parser.add_argument(
+        '--chapters',
+        metavar='INDICES',
+        default=None,
+        help='只生成这些章节（如 1,3,5-7；其中已完成且提示词未变的图片仍会跳过，加 --force 重新生成）'
+    )
+    parser.add_argument('--force', action='store_true', help='忽略已完成的图片，全部重新生成')
+    parser.add_argument('--output', default=None, help='输出目录（默认：文档所在目录下的 images/ 文件夹）')
+    parser.add_argument('--ratio', choices=['16:9', '3:4'], default='16:9', help='宽高比（默认: 16:9）')
+    parser.add_argument('--resolution', choices=RESOLUTIONS, default='2K', help='分辨率（默认: 2K）')
+    parser.add_argument('--extract-workers', type=int, default=None, help='PDF 并行提取的进程数')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f'同时进行的生成请求数（所有章节共用，默认: {DEFAULT_WORKERS}）'
+    )
+    parser.add_argument('--deadline', type=float, default=None, help='整批运行的截止时间（秒）')
+    parser.add_argument(
+        '--request-timeout',
+        type=float,
+        default=None,
+        help=f'单次请求超时（秒，默认: {DEFAULT_REQUEST_TIMEOUT_SECONDS}）'
+    )
+    parser.add_argument(
+        '--memory-budget',
+        type=float,
+        default=None,
+        metavar='MB',
+        help='在途图片数据的内存预算（MB）'
+    )
+    parser.add_argument(
+        '--ndjson',
+        metavar='PATH',
+        default=None,
+        help='每张图保存后立即写入一行 NDJSON 结果；"-" 表示标准输出（其余信息改到标准错误）'
+    )
+    parser.add_argument(
+        '--fallback',
+        choices=FALLBACK_MODES,
+        default='none',
+        help='API 生成失败时的兜底：none 记为失败（默认）、local 用本地渲染的文字卡片占位（需要 Pillow）'
+    )
+    parser.add_argument('--qa', action='store_true', help='每张图保存后质检，未通过的重新生成（需要 numpy）')
+    parser.add_argument(
+        '--qa-retries',
+        type=int,
+        default=DEFAULT_QA_RETRIES,
+        help=f'每张图因质检未通过重新生成的次数上限（默认: {DEFAULT_QA_RETRIES}）'
+    )
+
+    args = parser.parse_args()
+
+    ndjson, log = open_ndjson_stream(args.ndjson) if args.ndjson else (None, sys.stdout)
+    fallback = get_fallback(args.fallback)
+    qa = get_qa(args.qa)
+
+    if args.request_timeout is not None:
+        get_default_pool().request_timeout = args.request_timeout or None
+
+    level = args.level or LEVELS[LEVELS.index(args.chapter_level) + 1]
+    if LEVEL_NUMBERS[level] <= LEVEL_NUMBERS[args.chapter_level]:
+        print(f"错误: 小节层级 {level} 必须低于章节层级 {args.chapter_level}", file=sys.stderr)
+        sys.exit(1)
+
+    print("=" * 60, file=log)
+    print("Document Illustrator - 按章节分片生成", file=log)
+    print("=" * 60, file=log)
+
+    print(f"\n📖 分析文档结构（章节: {args.chapter_level}，小节: {level}）...", file=log)
+    structure = analyze_document_structure(args.document, args.extract_workers)
+    chapters = split_chapters(structure['sections'], args.chapter_level)
+
+    total_size = sum(chapter['size'] for chapter in chapters)
+    budget = args.budget if args.budget is not None else math.ceil(total_size / DEFAULT_CHARS_PER_IMAGE)
+
+    output_dir = resolve_output_dir(args.document, args.output)
+    plan = plan_book(chapters, level, budget, output_dir)
+
+    try:
+        selected = set(parse_indices(args.chapters, [c['number'] for c in chapters])) if args.chapters else None
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    style_prompt = extract_core_prompt(get_style_file(args.style))
+
+    # 每章独立计算断点：只有选中的章节参与本次生成，其余章节的清单和图片保持不变，只读取已有状态写入索引
+    jobs = []
+    chapter_jobs = {}
+    statuses = {}
+    for entry in plan:
+        number = entry['chapter']['number']
+        entry_jobs = build_chapter_jobs(entry, style_prompt, args.ratio, args.resolution)
+        chapter_jobs[number] = entry_jobs
+        if selected is not None and number not in selected:
+            statuses[number] = manifest_status(entry, entry_jobs)
+            continue
+        os.makedirs(entry['dir'], exist_ok=True)
+        statuses[number] = resume_state(entry, entry_jobs, args.force)
+        write_chapter_manifest(entry, entry_jobs, statuses[number])
+        jobs += [job for job in entry_jobs
+                 if statuses[number][os.path.basename(job['output_path'])] != 'done']
+
+    options = {
+        'style': args.style,
+        'chapter_level': args.chapter_level,
+        'level': level,
+        'ratio': args.ratio,
+        'resolution': args.resolution,
+        'budget': budget
+    }
+    index_path = write_index(output_dir, args.document, options, plan, statuses)
+
+    width, height = get_image_dimensions(args.ratio, args.resolution)
+    print(f"✓ 共 {len(chapters)} 章，内容配图预算 {budget} 张（另有每章一张封面），{width}x{height}", file=log)
+    for entry in plan:
+        number = entry['chapter']['number']
+        marker = '' if selected is None or number in selected else '（本次跳过）'
+        done = sum(1 for value in statuses[number].values() if value == 'done')
+        print(f"  {number:>3}. {entry['chapter']['title']}  {entry['chapter']['size']} 字符 → "
+              f"封面 + {entry['budget']} 张（已完成 {done}/{len(statuses[number])}）{marker}", file=log)
+    if selected is not None and not args.force:
+        kept = [str(number) for number in sorted(selected)
+                if any(value == 'done' for value in statuses[number].values())]
+        if kept:
+            print(f"\n⚠️  选中的第 {', '.join(kept)} 章已有完成且提示词未变的图片，本次跳过这些图片；"
+                  f"需要重新生成请加 --force", file=log)
+    print(f"\n待生成: {len(jobs)} 张，并发数: {args.workers}", file=log)
+    print("=" * 60, file=log)
+    print(file=log)
+
+    remaining = {number: sum(1 for job in jobs if job['chapter'] == number) for number in statuses}
+
+    def on_result(result):
+        job = result['job']
+        number = job['chapter']
+        entry = plan[number - 1]
+        status = result_status(result)
+        statuses[number][os.path.basename(job['output_path'])] = status
+        write_chapter_manifest(entry, chapter_jobs[number], statuses[number])
+        if ndjson:
+            write_ndjson(ndjson, result)
+
+        kind = "封面" if job['is_cover'] else f"第 {job['index']} 张"
+        print(f"[第 {number} 章] {kind}: {job['title']}（{result['elapsed']:.1f}s）", file=log)
+        if status == 'done':
+            print(f"  ✓ 已保存: {result['path']}", file=log)
+        elif status == 'placeholder':
+            print(f"  🪧 生成失败，已用本地占位图代替: {result['path']}", file=log)
+        elif status == 'qa_failed':
+            print(f"  ⚠️  已保存但质检未通过: {result['path']}（{'；'.join(result['qa'])}）", file=log)
+        else:
+            print(f"  ✗ 生成失败: {result['error']}", file=log)
+
+        # 一章的任务全部结束后刷新全书索引
+        remaining[number] -= 1
+        if remaining[number] == 0:
+            write_index(output_dir, args.document, options, plan, statuses)
+            print(f"  📘 第 {number} 章结束: {chapter_status(statuses[number])}", file=log)
+
+    if jobs:
+        check_api_setup()
+    scheduler = GenerationScheduler(
+        args.workers,
+        args.deadline,
+        LatencyHistory.for_output_dir(output_dir),
+        megabytes_to_bytes(args.memory_budget),
+        fallback,
+        qa,
+        args.qa_retries
+    )
+    results = scheduler.run(jobs, on_result=on_result, on_event=ndjson_event_writer(ndjson))
+    write_index(output_dir, args.document, options, plan, statuses)
+
+    print(file=log)
+    print("=" * 60, file=log)
+    print("✨ 章节生成完成！", file=log)
+    print("=" * 60, file=log)
+    unfinished = [number for number, status in statuses.items()
+                  if (selected is None or number in selected) and chapter_status(status) != 'done']
+    print(f"已完成章节: {sum(1 for status in statuses.values() if chapter_status(status) == 'done')}/{len(plan)}", file=log)
+    if unfinished:
+        print(f"未完成章节: {', '.join(str(number) for number in unfinished)}"
+              f"（重新运行同一命令即可继续，或用 --chapters 只处理这些章节）", file=log)
+    print_fallbacks(results, file=log)
+    print_qa_summary(scheduler, results, file=log)
+    print_outstanding(scheduler, file=log)
+    print_memory_summary(scheduler, file=log)
+    if results:
+        print_usage_summary(get_default_pool(), file=log)
+        print_cache_summary(get_default_style_cache(), file=log)
+    print(f"\n全书索引: {index_path}", file=log)
+    print(file=log)
+
+    if unfinished:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
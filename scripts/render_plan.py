@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Document Illustrator - 多变体渲染计划
+一次运行生成（风格 × 比例 × 分辨率）的多个变体：
+文档只解析一次，每种风格只提取一次风格提示词，
+所有变体的任务交给同一个调度器和凭据池并发执行，输出到各自的子目录
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from credential_pool import DEFAULT_REQUEST_TIMEOUT_SECONDS, get_default_pool, print_usage_summary
+from generate_illustrations import (
+    extract_core_prompt,
+    get_style_file,
+    prepare_sections,
+    resolve_output_dir,
+    truncate_content,
+)
+from generate_single_image import RESOLUTIONS, check_api_setup, get_image_dimensions
+from image_qa import DEFAULT_QA_RETRIES, get_qa
+from local_renderer import FALLBACK_MODES, get_fallback
+from resolution_ladder import parse_indices
+from scheduler import (
+    DEFAULT_WORKERS,
+    GenerationScheduler,
+    LatencyHistory,
+    megabytes_to_bytes,
+    ndjson_event_writer,
+    open_ndjson_stream,
+    print_fallbacks,
+    print_memory_summary,
+    print_outstanding,
+    print_qa_summary,
+    write_ndjson,
+)
+from similarity_index import DEFAULT_THRESHOLD, REUSE_MODES, SimilarityIndex, apply_reuse, index_result
+from style_cache import get_default_style_cache, print_cache_summary
+
+
+RATIOS = ['16:9', '3:4']
+
+
+def parse_variant(text):
+    """
+    解析 "风格:比例:分辨率" 形式的变体，例如 "ticket:3:4:2K"
+
+    返回：{'style': ..., 'ratio': ..., 'resolution': ...}
+    """
+    parts = text.split(':')
+    if len(parts) != 4:
+        raise ValueError(f"无效的变体: {text}，格式为 风格:比例:分辨率，例如 ticket:16:9:2K")
+    style, ratio_w, ratio_h, resolution = parts
+    return validate_variant({'style': style, 'ratio': f"{ratio_w}:{ratio_h}", 'resolution': resolution})
+
+
+def validate_variant(variant):
+    """检查变体的风格文件、比例和分辨率是否受支持"""
+    get_style_file(variant['style'])
+    if variant['ratio'] not in RATIOS:
+        raise ValueError(f"不支持的比例: {variant['ratio']}，请使用 {' 或 '.join(RATIOS)}")
+    if variant['resolution'] not in RESOLUTIONS:
+        raise ValueError(f"不支持的分辨率: {variant['resolution']}，请使用 {'、'.join(RESOLUTIONS)}")
+    return variant
+
+
+def variant_dir_name(variant):
+    """变体的输出子目录名，例如 ticket-16x9-2K"""
+    return f"{variant['style']}-{variant['ratio'].replace(':', 'x')}-{variant['resolution']}"
+
+
+def load_plan(plan_path):
+    """
+    读取渲染计划 JSON：
+    {
+        "level": "h2",
+        "variants": [
+            {"style": "gradient-glass", "ratio": "16:9", "resolution": "2K"},
+            {"style": "ticket", "ratio": "3:4", "resolution": "2K"}
+        ]
+    }
+    """
+    with open(plan_path, 'r', encoding='utf-8') as f:
+        plan = json.load(f)
+    plan['variants'] = [validate_variant(v) for v in plan.get('variants', [])]
+    return plan
+
+
+def build_plan_jobs(sections, variants, output_dir, flagged=()):
+    """
+    为所有变体构造任务：每种风格的提示词只提取一次，每个小节的内容只截取一次
+
+    flagged: 优先生成的小节序号（每个变体中对应的任务都优先）
+
+    返回：任务列表
+    """
+    style_prompts = {}
+    for variant in variants:
+        if variant['style'] not in style_prompts:
+            style_prompts[variant['style']] = extract_core_prompt(get_style_file(variant['style']))
+
+    contents = [truncate_content(section['content'])[0] for section in sections]
+
+    jobs = []
+    for variant in variants:
+        variant_dir = os.path.join(output_dir, variant_dir_name(variant))
+        os.makedirs(variant_dir, exist_ok=True)
+        for i, (section, content) in enumerate(zip(sections, contents), 1):
+            jobs.append({
+                'index': i,
+                'variant': variant_dir_name(variant),
+                'title': section['title'],
+                'content': content,
+                'style_prompt': style_prompts[variant['style']],
+                'output_path': os.path.join(variant_dir, f"illustration-{i:02d}.png"),
+                'aspect_ratio': variant['ratio'],
+                'resolution': variant['resolution'],
+                'is_cover': False,
+                'priority': i in flagged,
+            })
+    return jobs
+
+
+def main():
+    """主流程"""
+    parser = argparse.ArgumentParser(
+        description='Document Illustrator - 多变体渲染计划',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例用法:
+  # 同一篇文章同时生成 16:9 幻灯片和 3:4 社交卡片
+  python render_plan.py document.md --level h2 \\
+    --variant gradient-glass:16:9:2K --variant gradient-glass:3:4:2K
+
+  # 从 JSON 文件读取渲染计划
+  python render_plan.py document.md --plan plan.json --workers 8
+
+  # 第 1 节优先，每张图保存后立即在标准输出写一行 NDJSON
+  python render_plan.py document.md --plan plan.json --priority 1 --ndjson -
+
+  # 保存后自动质检，未通过的图片重新生成
+  python render_plan.py document.md --plan plan.json --qa
+
+输出目录:
+  images/<风格>-<比例>-<分辨率>/illustration-NN.png
+"""
+    )
+    parser.add_argument('document', help='文档路径（支持 .md / .txt / .pdf / .docx / .html）')
+    parser.add_argument('--plan', help='渲染计划 JSON 文件')
+    parser.add_argument(
+        '--variant',
+        action='append',
+        default=[],
+        help='变体，格式为 风格:比例:分辨率（可重复），例如 ticket:3:4:2K'
+    )
+    parser.add_argument('--level', choices=['h2', 'h3', 'h4'], help='标题层级（默认取计划文件中的 level，否则 h2）')
+    parser.add_argument('--output', default=None, help='输出目录（默认：文档所在目录下的 images/ 文件夹）')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f'同时进行的生成请求数（所有变体共用，默认: {DEFAULT_WORKERS}）'
+    )
+    parser.add_argument('--extract-workers', type=int, default=None, help='PDF 并行提取的进程数')
+    parser.add_argument(
+        '--deadline',
+        type=float,
+        default=None,
+        help='整个计划的截止时间（秒）；到达后取消在途请求，保留已完成的图片并列出未完成序号'
+    )
+    parser.add_argument(
+        '--request-timeout',
+        type=float,
+        default=None,
+        help=f'单次请求超时（秒，默认: {DEFAULT_REQUEST_TIMEOUT_SECONDS}）'
+    )
+    parser.add_argument(
+        '--memory-budget',
+        type=float,
+        default=None,
+        metavar='MB',
+        help='在途图片数据的内存预算（MB）；超出时暂缓派发新请求，4K 每个请求约占 32MB'
+    )
+    parser.add_argument(
+        '--priority',
+        metavar='INDICES',
+        default=None,
+        help='优先生成的小节序号（如 1,3,5-7），其余按预计耗时从短到长生成'
+    )
+    parser.add_argument(
+        '--reuse',
+        choices=REUSE_MODES,
+        default='off',
+        help='复用相似度足够高的已有图片：off 不复用（默认）、ask 逐个询问、auto 自动复用'
+    )
+    parser.add_argument(
+        '--reuse-threshold',
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f'复用所需的最低相似度（0~1，默认: {DEFAULT_THRESHOLD}）'
+    )
+    parser.add_argument(
+        '--reuse-index',
+        metavar='PATH',
+        default=None,
+        help='相似提示词索引文件（默认: 输出目录下的 .similarity-index.db；多个文档共用时指定同一路径）'
+    )
+    parser.add_argument(
+        '--ndjson',
+        metavar='PATH',
+        default=None,
+        help='每张图保存后立即写入一行 NDJSON 结果；"-" 表示标准输出（其余信息改到标准错误）'
+    )
+    parser.add_argument(
+        '--fallback',
+        choices=FALLBACK_MODES,
+        default='none',
+        help='API 生成失败时的兜底：none 记为失败（默认）、local 用本地渲染的文字卡片占位（需要 Pillow）'
+    )
+    parser.add_argument(
+        '--qa',
+        action='store_true',
+        help='每张图保存后质检（空白 / 纯色画面、比例不符、文件截断或损坏），未通过的重新生成（需要 numpy）'
+    )
+    parser.add_argument(
+        '--qa-retries',
+        type=int,
+        default=DEFAULT_QA_RETRIES,
+        help=f'每张图因质检未通过重新生成的次数上限（默认: {DEFAULT_QA_RETRIES}）'
+    )
+
+    args = parser.parse_args()
+
+    ndjson, log = open_ndjson_stream(args.ndjson) if args.ndjson else (None, sys.stdout)
+    fallback = get_fallback(args.fallback)
+    qa = get_qa(args.qa)
+
+    if args.request_timeout is not None:
+        get_default_pool().request_timeout = args.request_timeout or None
+
+    try:
+        plan = load_plan(args.plan) if args.plan else {'variants': []}
+        variants = plan['variants'] + [parse_variant(v) for v in args.variant]
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if not variants:
+        print("错误: 请通过 --plan 或 --variant 指定至少一个变体", file=sys.stderr)
+        sys.exit(1)
+
+    level = args.level or plan.get('level', 'h2')
+
+    print("=" * 60, file=log)
+    print("Document Illustrator - 多变体渲染", file=log)
+    print("=" * 60, file=log)
+
+    # 文档只解析一次，所有变体共用
+    print(f"\n📖 分析文档结构（粒度: {level}）...", file=log)
+    sections = prepare_sections(args.document, level, args.extract_workers)
+    print(f"✓ 共 {len(sections)} 个小节", file=log)
+
+    try:
+        flagged = set(parse_indices(args.priority, range(1, len(sections) + 1))) if args.priority else set()
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    output_dir = resolve_output_dir(args.document, args.output)
+    jobs = build_plan_jobs(sections, variants, output_dir, flagged)
+
+    print(f"\n🧩 渲染计划: {len(variants)} 个变体 × {len(sections)} 张 = {len(jobs)} 张", file=log)
+    for variant in variants:
+        width, height = get_image_dimensions(variant['ratio'], variant['resolution'])
+        print(f"  - {variant_dir_name(variant)} ({width}x{height})", file=log)
+    print(f"并发数: {args.workers}", file=log)
+    print("=" * 60, file=log)
+    print(file=log)
+
+    # 相似提示词索引：成功生成的图片都会加入索引，--reuse 开启时先查找可复用的已有图片
+    prompt_index = (SimilarityIndex(args.reuse_index) if args.reuse_index
+                    else SimilarityIndex.for_output_dir(output_dir))
+    jobs, reused = apply_reuse(jobs, prompt_index, args.reuse, args.reuse_threshold, log=log)
+
+    def on_result(result):
+        job = result['job']
+        if ndjson:
+            write_ndjson(ndjson, result)
+        index_result(prompt_index, result)
+        if result.get('fallback'):
+            status = f"🪧 生成失败，已用本地占位图代替: {result['path']}（{result['error']}）"
+        elif result.get('reused_from'):
+            status = f"♻️  复用已有图片（相似度 {result['similarity']:.0%}）: {result['reused_from']}"
+        elif result.get('qa'):
+            status = f"⚠️  已保存但质检未通过: {result['path']}（{'；'.join(result['qa'])}）"
+        elif result['path']:
+            status = f"✓ 已保存: {result['path']}"
+        else:
+            status = f"✗ 生成失败: {result['error']}"
+        print(f"[{job['variant']}] 第 {job['index']} 张 {job['title']}（{result['elapsed']:.1f}s）", file=log)
+        print(f"  {status}", file=log)
+
+    for result in reused:
+        on_result(result)
+
+    if jobs:
+        check_api_setup()
+    scheduler = GenerationScheduler(
+        args.workers,
+        args.deadline,
+        LatencyHistory.for_output_dir(output_dir),
+        megabytes_to_bytes(args.memory_budget),
+        fallback,
+        qa,
+        args.qa_retries
+    )
+    results = reused + scheduler.run(jobs, on_result=on_result, on_event=ndjson_event_writer(ndjson))
+
+    print(file=log)
+    print("=" * 60, file=log)
+    print("✨ 渲染完成！", file=log)
+    print("=" * 60, file=log)
+    for variant in variants:
+        name = variant_dir_name(variant)
+        variant_results = [r for r in results if r['job']['variant'] == name]
+        successful = sum(1 for r in variant_results if r['path'] and not r.get('fallback') and not r.get('qa'))
+        print(f"{name}: 成功 {successful}/{len(sections)} 张 → {os.path.join(output_dir, name)}", file=log)
+    print_fallbacks(results, file=log)
+    print_qa_summary(scheduler, results, file=log)
+    print_outstanding(scheduler, file=log)
+    print_memory_summary(scheduler, file=log)
+    print_usage_summary(get_default_pool(), file=log)
+    print_cache_summary(get_default_style_cache(), file=log)
+    if reused:
+        print(f"\n♻️  复用已有图片: {len(reused)} 张", file=log)
+    prompt_index.close()
+    print(file=log)
+
+    if scheduler.outstanding or any(not r['path'] or r.get('fallback') or r.get('qa') for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Document Illustrator - 草图 / 终稿两阶段生成
+第一阶段以最小分辨率快速生成全部草图供审核；
+第二阶段只把通过审核的序号按最终分辨率重新生成，复用完全相同的提示词
+"""
+
+import json
+import os
+
+from generate_single_image import RESOLUTIONS, get_image_dimensions
+
+
+DRAFTS_DIR_NAME = "drafts"
+MANIFEST_NAME = "manifest.json"
+
+
+def plan_ladder(aspect_ratio, final_resolution):
+    """
+    根据 get_image_dimensions() 制定两阶段计划
+
+    返回：{
+        'aspect_ratio': '16:9',
+        'draft': {'resolution': '1K', 'size': (1280, 720)},
+        'final': {'resolution': '2K', 'size': (2560, 1440)}
+    }
+    """
+    draft_resolution = RESOLUTIONS[0]
+    if final_resolution == draft_resolution:
+        raise ValueError(f"最终分辨率 {final_resolution} 已是最小分辨率，无需草图阶段")
+
+    return {
+        'aspect_ratio': aspect_ratio,
+        'draft': {
+            'resolution': draft_resolution,
+            'size': get_image_dimensions(aspect_ratio, draft_resolution)
+        },
+        'final': {
+            'resolution': final_resolution,
+            'size': get_image_dimensions(aspect_ratio, final_resolution)
+        }
+    }
+
+
+def print_ladder_plan(plan, count, file=None):
+    """显示两阶段计划"""
+    draft_width, draft_height = plan['draft']['size']
+    final_width, final_height = plan['final']['size']
+    print(f"  阶段一（草图）: {count} 张 × {plan['draft']['resolution']} ({draft_width}x{draft_height})", file=file)
+    print(f"  阶段二（终稿）: 通过审核的序号 × {plan['final']['resolution']} ({final_width}x{final_height})", file=file)
+
+
+def drafts_dir(output_dir):
+    return os.path.join(output_dir, DRAFTS_DIR_NAME)
+
+
+def write_manifest(output_dir, plan, style_prompt, items):
+    """
+    写入草图清单，终稿阶段据此复用完全相同的提示词
+
+    items: {序号: {'title': ..., 'content': ..., 'is_cover': ..., 'draft_path': ...}}
+    """
+    manifest = {
+        'aspect_ratio': plan['aspect_ratio'],
+        'draft_resolution': plan['draft']['resolution'],
+        'final_resolution': plan['final']['resolution'],
+        'style_prompt': style_prompt,
+        'items': {str(index): item for index, item in items.items()}
+    }
+    path = os.path.join(drafts_dir(output_dir), MANIFEST_NAME)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def load_manifest(output_dir):
+    """读取草图清单，不存在时返回 None"""
+    path = os.path.join(drafts_dir(output_dir), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def draft_record_path(draft_path):
+    """单张草图旁的记录文件（generate_single_image.py 使用）"""
+    return os.path.splitext(draft_path)[0] + ".json"
+
+
+def write_draft_record(draft_path, record):
+    """在草图旁记录生成参数，终稿阶段原样复用"""
+    with open(draft_record_path(draft_path), 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+
+
+def load_draft_record(draft_path):
+    """读取草图记录，不存在时返回 None"""
+    path = draft_record_path(draft_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def parse_indices(text, available):
+    """
+    解析审核通过的序号，例如 "1,3,5-7" 或 "all"
+
+    返回：排好序的序号列表（序号必须在 available 中）
+    """
+    available = sorted(available)
+    if text.strip().lower() == 'all':
+        return available
+
+    selected = set()
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            selected.update(range(int(start), int(end) + 1))
+        else:
+            selected.add(int(part))
+
+    unknown = selected - set(available)
+    if unknown:
+        raise ValueError(f"没有这些序号: {', '.join(str(i) for i in sorted(unknown))}")
+    return sorted(selected)
@@ -0,0 +1,595 @@
+#!/usr/bin/env python3
+"""
+Document Illustrator - 生成任务调度器
+所有生成任务（多个风格 / 比例 / 分辨率的变体）通过同一个调度器并发执行，
+共用进程内的凭据池和风格提示词缓存；支持整体截止时间和 Ctrl-C 协作取消。
+任务按优先级派发：封面和用户标记的小节最先，其余按预计耗时从短到长（最短作业优先），
+每张图保存后可立即输出一行 NDJSON，供上层流程边生成边展示
+"""
+
+import heapq
+import itertools
+import json
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+
+from credential_pool import RunCancelled, cancellation
+from generate_single_image import get_image_dimensions
+from illustrator_api import ImageJob, ImageResult, generate_image, partial_path
+
+
+DEFAULT_WORKERS = 4
+
+# 派发循环检查取消 / 截止时间的间隔（秒）
+POLL_INTERVAL_SECONDS = 0.5
+
+# 取消后等待在途工作线程退出的时间（秒）：正在保存的线程多半能在这段时间内放弃并退出
+CANCEL_JOIN_SECONDS = 2.0
+
+# 没有历史记录时各分辨率的预计耗时（秒），封面图再乘以 COVER_LATENCY_FACTOR
+DEFAULT_EXPECTED_SECONDS = {'1K': 20.0, '2K': 40.0, '4K': 80.0}
+COVER_LATENCY_FACTOR = 1.25
+
+# 耗时历史的指数加权平均系数：越大越偏向最近的耗时
+LATENCY_EWMA_ALPHA = 0.3
+
+LATENCY_HISTORY_NAME = ".latency-history.json"
+
+# 每个在途请求按像素估算的内存：响应中的 base64 文本 + 解码后的 PNG 字节 + 保存前的缓冲，
+# 约为每像素 4 字节（4K 约 32MB）
+IN_FLIGHT_BYTES_PER_PIXEL = 4
+
+
+def render_job(job):
+    """
+    默认的任务执行函数：调用 illustrator_api.generate_image()
+
+    job 字段：title, content, style_prompt, output_path, aspect_ratio, resolution, is_cover
+
+    返回：ImageResult
+    """
+    return generate_image(ImageJob(
+        title=job['title'],
+        content=job['content'],
+        style_prompt=job['style_prompt'],
+        output_path=job['output_path'],
+        aspect_ratio=job['aspect_ratio'],
+        resolution=job['resolution'],
+        is_cover=job.get('is_cover', False)
+    ))
+
+
+def job_label(job):
+    """任务在汇总中的显示名称，例如 "3" 或 "ticket-3x4-2K#3" """
+    if job.get('variant'):
+        return f"{job['variant']}#{job['index']}"
+    return str(job['index'])
+
+
+class LatencyHistory:
+    """
+    按（分辨率, 是否封面）记录生成耗时的指数加权平均，保存在输出目录中，
+    下次运行据此估计每个任务的耗时
+
+    path 为 None 时只在内存中记录
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.averages = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.averages = json.load(f)
+            except (OSError, ValueError):
+                self.averages = {}
+
+    @classmethod
+    def for_output_dir(cls, output_dir):
+        return cls(os.path.join(output_dir, LATENCY_HISTORY_NAME))
+
+    @staticmethod
+    def _key(job):
+        resolution = job.get('resolution', '2K')
+        return f"{resolution}-cover" if job.get('is_cover') else resolution
+
+    def expected(self, job):
+        """任务的预计耗时（秒）"""
+        average = self.averages.get(self._key(job))
+        if average is not None:
+            return average
+        seconds = DEFAULT_EXPECTED_SECONDS.get(job.get('resolution', '2K'), DEFAULT_EXPECTED_SECONDS['2K'])
+        return seconds * COVER_LATENCY_FACTOR if job.get('is_cover') else seconds
+
+    def observe(self, job, seconds):
+        """记录一次成功生成的耗时"""
+        key = self._key(job)
+        previous = self.averages.get(key)
+        if previous is None:
+            self.averages[key] = seconds
+        else:
+            self.averages[key] = LATENCY_EWMA_ALPHA * seconds + (1 - LATENCY_EWMA_ALPHA) * previous
+
+    def save(self):
+        if not self.path or not self.averages:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.averages, f, indent=2)
+
+
+def megabytes_to_bytes(value):
+    """命令行中的 MB 数转换为字节数，None 或 0 表示不限制"""
+    return int(value * 1024 * 1024) if value else None
+
+
+def estimate_job_bytes(job):
+    """按任务的比例和分辨率估算一个在途请求占用的内存（字节）"""
+    width, height = get_image_dimensions(job.get('aspect_ratio', '16:9'), job.get('resolution', '2K'))
+    return width * height * IN_FLIGHT_BYTES_PER_PIXEL
+
+
+class MemoryBudget:
+    """
+    在途图片数据的内存预算
+
+    派发前按 estimate_job_bytes() 预留，图片保存到磁盘后立即释放；
+    limit 为 None 时不限制，只统计峰值
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.in_use = 0
+        self.peak = 0
+        self.requests = 0
+        self.peak_requests = 0
+        self._lock = threading.Lock()
+
+    def try_reserve(self, size, force=False):
+        """预算内（或 force）时预留 size 字节并返回 True"""
+        with self._lock:
+            if not force and self.limit is not None and self.in_use + size > self.limit:
+                return False
+            self.in_use += size
+            self.requests += 1
+            self.peak = max(self.peak, self.in_use)
+            self.peak_requests = max(self.peak_requests, self.requests)
+            return True
+
+    def release(self, size):
+        with self._lock:
+            self.in_use -= size
+            self.requests -= 1
+
+
+def job_priority(job, history):
+    """
+    任务的派发顺序：(优先级, 预计耗时)，越小越先派发
+
+    封面图最先（用户最先审核封面），其次是用户标记（job['priority']）的小节；
+    同一优先级内预计耗时短的先派发，让第一张可用的图片尽快出现
+    """
+    if job.get('is_cover'):
+        tier = 0
+    elif job.get('priority'):
+        tier = 1
+    else:
+        tier = 2
+    return (tier, history.expected(job))
+
+
+class GenerationScheduler:
+    """
+    并发执行生成任务
+
+    由主线程负责派发：同时最多 max_workers 个任务在途，
+    每个任务完成后立即回调 on_result，便于实时输出进度；
+    待派发的任务放在优先队列中，按 job_priority() 的顺序派发，
+    成功任务的耗时记入 history（运行结束时保存）
+
+    内存预算：memory_budget（字节）不为空时，只有在途请求的估算内存加上新任务
+    仍不超过预算才派发（没有在途任务时总会派发一个，避免单个任务超出预算时卡住）
+
+    取消：到达 deadline（秒，从 run() 开始计时）或收到 SIGINT 时停止派发，
+    放弃在途请求（后台线程为守护线程，不会阻塞退出；仍在等待凭据的请求立即放弃，
+    收到响应的请求不再保存图片），最多等待 CANCEL_JOIN_SECONDS 让在途线程退出后，
+    保留已完成的图片，清理未完成任务留下的 .part 临时文件，未完成的任务记录在 outstanding 中；
+    取消后仍写入了输出文件的任务记录在 late_outputs 中，届时仍未退出的记录在 still_running 中
+
+    兜底：fallback 不为空时，任务生成失败（且运行未被取消）后在同一个工作线程中调用
+    fallback(job) 生成替代图片（例如 local_renderer.local_fallback 渲染的占位卡片），
+    结果字典中 'fallback' 为 True，'error' 保留原来的 API 错误
+
+    质检：qa 不为空时，图片保存后在工作线程中调用 qa(job, path) 得到问题列表（例如 image_qa.qa_check），
+    未通过的任务重新放回优先队列，每个任务最多重新生成 qa_retries 次；
+    超出次数后照常返回结果，'qa' 中保留最后一次的问题列表
+
+    中间事件：on_event 不为空时，生成请求返回后立即回调 on_event('generated', 结果)，
+    质检和兜底完成后再分别回调 on_event('qa', 结果) / on_event('fallback', 结果)，
+    不必等到质检和兜底结束才知道生成本身的结果和耗时
+    """
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, deadline=None, history=None, memory_budget=None,
+                 fallback=None, qa=None, qa_retries=0):
+        self.max_workers = max(1, max_workers)
+        self.deadline = deadline
+        self.history = history if history is not None else LatencyHistory()
+        self.memory = MemoryBudget(memory_budget)
+        self.fallback = fallback
+        self.qa = qa
+        self.qa_retries = max(0, qa_retries)
+        self.qa_retried = []
+        self.cancel_event = threading.Event()
+        self.cancel_reason = None
+        self.outstanding = []
+        self.late_outputs = []
+        self.still_running = []
+
+    def cancel(self, reason):
+        """请求取消（可在任意线程调用）"""
+        if not self.cancel_event.is_set():
+            self.cancel_reason = reason
+            self.cancel_event.set()
+
+    @staticmethod
+    def _execute(render, job):
+        start_time = time.time()
+        retries = 0
+        cancelled = False
+        try:
+            outcome = render(job)
+            if isinstance(outcome, ImageResult):
+                path, error, retries = outcome.path, outcome.error, outcome.retries
+                cancelled = outcome.error_class == RunCancelled.__name__
+            else:
+                path = outcome
+                error = None if path else "未收到图片数据"
+        except RunCancelled as e:
+            path, error, cancelled = None, str(e), True
+        except Exception as e:
+            path = None
+            error = str(e)
+        if cancelled:
+            return {'job': job, 'path': None, 'error': error, 'cancelled': True}
+        return {
+            'job': job,
+            'path': path,
+            'error': error,
+            'retries': retries,
+            'elapsed': time.time() - start_time
+        }
+
+    def _apply_qa(self, result):
+        """
+        检查刚保存的图片，质检本身出错时只打印警告，不视为图片有问题
+
+        返回：是否执行了质检（耗时记录在 result['qa_elapsed']）
+        """
+        if not result['path'] or self.qa is None or self.cancel_event.is_set():
+            return False
+        start_time = time.time()
+        try:
+            result['qa'] = self.qa(result['job'], result['path'])
+        except Exception as e:
+            print(f"  ⚠️  第 {job_label(result['job'])} 张质检出错: {e}", file=sys.stderr)
+        result['qa_elapsed'] = time.time() - start_time
+        return True
+
+    def _apply_fallback(self, result):
+        """
+        API 生成失败时调用兜底函数，兜底也失败时保持原来的失败结果
+
+        返回：是否调用了兜底函数（耗时记录在 result['fallback_elapsed']）
+        """
+        if result['path'] or self.fallback is None or self.cancel_event.is_set():
+            return False
+        start_time = time.time()
+        try:
+            path = self.fallback(result['job'])
+        except Exception as e:
+            print(f"  ⚠️  第 {job_label(result['job'])} 张兜底渲染失败: {e}", file=sys.stderr)
+            path = None
+        result['fallback_elapsed'] = time.time() - start_time
+        if path:
+            result['path'] = path
+            result['fallback'] = True
+        return True
+
+    def _install_sigint_handler(self):
+        """第一次 Ctrl-C 协作取消，第二次恢复默认行为立即中断"""
+        if threading.current_thread() is not threading.main_thread():
+            return None
+
+        def handler(signum, frame):
+            print("\n⏹️  收到中断信号，正在取消剩余任务（再次按 Ctrl-C 立即退出）...", file=sys.stderr)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            self.cancel('interrupted')
+
+        return signal.signal(signal.SIGINT, handler)
+
+    def run(self, jobs, render=render_job, on_result=None, on_event=None):
+        """
+        执行全部任务
+
+        参数：
+        - jobs: 任务字典列表
+        - render: 执行单个任务的函数，返回 ImageResult，或成功时返回图片路径、失败时返回 None
+        - on_result: 每个任务完成时的回调，参数为结果字典
+        - on_event: 中间事件的回调，参数为事件名（'generated' / 'qa' / 'fallback'）和当时结果字典的副本
+
+        返回：已完成任务的结果字典列表 [{'job': ..., 'path': ..., 'error': ..., 'retries': ..., 'elapsed': ...}, ...]
+        """
+        # 优先队列：(优先级, 预计耗时, 原始顺序, 任务)
+        jobs = list(jobs)
+        pending = [job_priority(job, self.history) + (order, job) for order, job in enumerate(jobs)]
+        heapq.heapify(pending)
+        order_counter = itertools.count(len(pending))
+        qa_attempts = {}
+        in_flight = {}
+        threads = {}
+        results = []
+        done_queue = queue.Queue()
+        started_at = time.time()
+        deadline_at = started_at + self.deadline if self.deadline else None
+
+        def worker(job, reserved):
+            try:
+                with cancellation(self.cancel_event):
+                    result = self._execute(render, job)
+            finally:
+                # render 返回时响应已写入磁盘、缓冲已释放，立即归还预算，
+                # 之后的质检（在进程池中读缩略图）和本地兜底渲染不占用在途请求的内存
+                self.memory.release(reserved)
+            # 中间事件交给主线程回调（与 on_result 一样不在工作线程中调用），附带当时结果的副本
+            if not result.get('cancelled'):
+                done_queue.put(('generated', dict(result)))
+            if self._apply_qa(result):
+                done_queue.put(('qa', dict(result)))
+            if self._apply_fallback(result):
+                done_queue.put(('fallback', dict(result)))
+            done_queue.put((None, result))
+
+        def dispatch(item):
+            event, result = item
+            if event is None:
+                accept(result)
+            elif on_event:
+                on_event(event, result)
+
+        def accept(result):
+            if result.get('cancelled'):
+                # 取消后放弃保存：留在 in_flight 中，计入未完成的任务
+                return
+            job = result['job']
+            in_flight.pop(id(job), None)
+            if result['path'] and not result.get('fallback'):
+                self.history.observe(job, result['elapsed'])
+
+            # 质检未通过且还有重试次数：放回队列重新生成，不计入结果
+            attempts = qa_attempts.get(id(job), 0)
+            if result.get('qa') and attempts < self.qa_retries and not self.cancel_event.is_set():
+                qa_attempts[id(job)] = attempts + 1
+                self.qa_retried.append(job)
+                print(f"  🔁 第 {job_label(job)} 张质检未通过（{'；'.join(result['qa'])}），"
+                      f"重新生成（{attempts + 1}/{self.qa_retries}）", file=sys.stderr)
+                heapq.heappush(pending, job_priority(job, self.history) + (next(order_counter), job))
+                return
+            result['qa_retries'] = attempts
+            results.append(result)
+            if on_result:
+                on_result(result)
+
+        previous_handler = self._install_sigint_handler()
+        try:
+            while (pending or in_flight) and not self.cancel_event.is_set():
+                while pending and len(in_flight) < self.max_workers:
+                    job = pending[0][-1]
+                    reserved = estimate_job_bytes(job)
+                    if not self.memory.try_reserve(reserved, force=not in_flight):
+                        # 保持优先顺序：队首任务放不下时等待在途任务完成
+                        break
+                    heapq.heappop(pending)
+                    in_flight[id(job)] = job
+                    threads[id(job)] = threading.Thread(target=worker, args=(job, reserved), daemon=True)
+                    threads[id(job)].start()
+
+                timeout = POLL_INTERVAL_SECONDS
+                if deadline_at is not None:
+                    remaining = deadline_at - time.time()
+                    if remaining <= 0:
+                        self.cancel('deadline')
+                        break
+                    timeout = min(timeout, remaining)
+
+                try:
+                    dispatch(done_queue.get(timeout=timeout))
+                except queue.Empty:
+                    continue
+        finally:
+            if previous_handler is not None:
+                signal.signal(signal.SIGINT, previous_handler)
+
+        if self.cancel_event.is_set():
+            # 在途线程在保存前会检查取消并放弃，稍等它们退出再清理临时文件
+            join_until = time.time() + CANCEL_JOIN_SECONDS
+            for key in list(in_flight):
+                threads[key].join(timeout=max(0.0, join_until - time.time()))
+
+        # 取消时已经完成的结果照常保留
+        while True:
+            try:
+                dispatch(done_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        self.history.save()
+
+        self.outstanding = list(in_flight.values()) + [entry[-1] for entry in sorted(pending)]
+        for job in self.outstanding:
+            if job.get('output_path'):
+                temp_path = partial_path(job['output_path'])
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+        # 不假设输出目录是干净的：报告没有成功结果、却在本次运行中写入了输出文件的任务，以及仍未退出的线程
+        if self.cancel_event.is_set():
+            succeeded = {id(result['job']) for result in results if result['path']}
+            self.late_outputs = [
+                job['output_path'] for job in jobs
+                if id(job) not in succeeded and job.get('output_path') and os.path.exists(job['output_path'])
+                and os.path.getmtime(job['output_path']) >= started_at
+            ]
+            self.still_running = [job for key, job in in_flight.items() if threads[key].is_alive()]
+
+        return results
+
+
+def print_outstanding(scheduler, file=None):
+    """取消后在汇总中打印原因和未完成的序号"""
+    if scheduler.cancel_reason == 'deadline':
+        print(f"\n⏱️  已到达截止时间（{scheduler.deadline:.0f}s），在途请求已取消", file=file)
+    elif scheduler.cancel_reason == 'interrupted':
+        print("\n⏹️  运行已被中断，在途请求已取消", file=file)
+
+    if scheduler.outstanding:
+        labels = ', '.join(job_label(job) for job in scheduler.outstanding)
+        print(f"未完成: {len(scheduler.outstanding)} 张，序号: {labels}", file=file)
+    if scheduler.late_outputs:
+        print(f"⚠️  以下图片未计入本次结果，但已在取消前后被写入输出目录: {', '.join(scheduler.late_outputs)}", file=file)
+    if scheduler.still_running:
+        labels = ', '.join(job_label(job) for job in scheduler.still_running)
+        print(f"⚠️  {len(scheduler.still_running)} 个请求取消后仍未结束（序号: {labels}），"
+              f"进程退出前仍可能写入输出目录", file=file)
+
+
+def open_ndjson_stream(path):
+    """
+    打开 NDJSON 输出："-" 表示标准输出，否则追加写入文件
+
+    返回 (NDJSON 流, 进度信息流)：输出到标准输出时进度信息改为打印到标准错误，保证标准输出中只有 NDJSON；
+    调用方把进度信息流传给各个打印函数（file= / log=），这里不改动 sys.stdout
+    """
+    if path == '-':
+        return sys.stdout, sys.stderr
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return open(path, 'a', encoding='utf-8'), sys.stdout
+
+
+def _ndjson_record(event, job):
+    return {
+        'event': event,
+        'index': job['index'],
+        'variant': job.get('variant'),
+        'title': job['title'],
+        'resolution': job.get('resolution'),
+        'is_cover': bool(job.get('is_cover')),
+    }
+
+
+def _write_ndjson_record(stream, record):
+    stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+    stream.flush()
+
+
+def write_ndjson(stream, result):
+    """
+    把一个任务的最终结果（质检、兜底之后）写成一行 JSON 并立即刷新，例如：
+    {"event": "image", "index": 3, "title": "...", "path": "images/illustration-03.png", "ok": true, ...}
+    """
+    job = result['job']
+    record = _ndjson_record('image', job)
+    record.update({
+        'ok': bool(result['path']),
+        'path': os.path.abspath(result['path']) if result['path'] else None,
+        'error': result['error'],
+        'elapsed': round(result['elapsed'], 3),
+        'retries': result.get('retries', 0),
+        'reused_from': result.get('reused_from'),
+        'fallback': bool(result.get('fallback')),
+        'qa': result.get('qa'),
+        'qa_retries': result.get('qa_retries', 0),
+    })
+    _write_ndjson_record(stream, record)
+
+
+def write_ndjson_event(stream, event, result):
+    """
+    把调度器的中间事件写成一行 JSON 并立即刷新：
+    - generated: 生成请求返回时写入，ok / path / error / elapsed / retries 只反映生成本身
+    - qa: 质检完成时写入，qa 为问题列表（通过时为空列表），elapsed 为质检耗时
+    - fallback: 兜底渲染完成时写入，ok / path 为兜底结果，elapsed 为兜底耗时
+    同一张图之后还会写入一条 "image" 记录（write_ndjson），其中是最终状态
+    """
+    record = _ndjson_record(event, result['job'])
+    if event == 'generated':
+        record.update({
+            'ok': bool(result['path']),
+            'path': os.path.abspath(result['path']) if result['path'] else None,
+            'error': result['error'],
+            'elapsed': round(result['elapsed'], 3),
+            'retries': result.get('retries', 0),
+        })
+    elif event == 'qa':
+        record.update({
+            'ok': not result.get('qa'),
+            'qa': result.get('qa'),
+            'elapsed': round(result['qa_elapsed'], 3),
+        })
+    elif event == 'fallback':
+        record.update({
+            'ok': bool(result.get('fallback')),
+            'path': os.path.abspath(result['path']) if result.get('fallback') else None,
+            'elapsed': round(result['fallback_elapsed'], 3),
+        })
+    _write_ndjson_record(stream, record)
+
+
+def ndjson_event_writer(stream):
+    """返回把中间事件写入 stream 的 on_event 回调；stream 为空（未开启 NDJSON）时返回 None"""
+    if stream is None:
+        return None
+    return lambda event, result: write_ndjson_event(stream, event, result)
+
+
+def print_fallbacks(results, file=None):
+    """在汇总中列出用本地占位图代替的序号"""
+    labels = [job_label(r['job']) for r in results if r.get('fallback')]
+    if labels:
+        print(f"\n🪧 占位图: {len(labels)} 张（API 生成失败，已用本地卡片代替），序号: {', '.join(labels)}", file=file)
+
+
+def print_qa_summary(scheduler, results, file=None):
+    """在汇总中列出因质检未通过而重新生成的序号，以及重试后仍未通过的序号"""
+    if scheduler.qa is None:
+        return
+    if scheduler.qa_retried:
+        labels = sorted({job_label(job) for job in scheduler.qa_retried}, key=lambda label: (len(label), label))
+        print(f"\n🔁 质检重新生成: {len(scheduler.qa_retried)} 次，序号: {', '.join(labels)}", file=file)
+    rejected = [job_label(r['job']) for r in results if r.get('qa')]
+    if rejected:
+        print(f"⚠️  重试后仍未通过质检: {len(rejected)} 张，序号: {', '.join(rejected)}", file=file)
+
+
+def print_memory_summary(scheduler, file=None):
+    """在运行总结中打印在途图片数据的估算峰值、预算和进程峰值 RSS"""
+    memory = scheduler.memory
+    if not memory.peak:
+        return
+
+    line = f"\n🧠 在途图片内存: 峰值约 {memory.peak / 1024 / 1024:.0f}MB（同时在途 {memory.peak_requests} 个请求）"
+    if memory.limit is not None:
+        line += f"，预算 {memory.limit / 1024 / 1024:.0f}MB"
+    print(line, file=file)
+
+    try:
+        import resource
+    except ImportError:
+        return
+    # Linux 上 ru_maxrss 的单位是 KB，macOS 上是字节
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    print(f"  进程峰值 RSS: {max_rss / divisor:.0f}MB", file=file)
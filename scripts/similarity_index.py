@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Document Illustrator - 相似提示词索引
+为已生成图片的（风格, 标题, 内容）建立 MinHash / LSH 索引，保存在图片旁的 SQLite 文件中。
+新小节与已有图片足够相似（同一风格、同一比例）时，可以直接复用已有图片，不再调用 API。
+按 LSH 分桶查询，查找耗时基本不随索引规模增长，主要花在计算新小节的签名上：
+安装 numpy 时签名向量化计算，比纯 Python 快 6～7 倍（2000 字的小节约 8ms，纯 Python 约 50ms）
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import struct
+import time
+from array import array
+
+from generate_single_image import RESOLUTIONS
+
+
+INDEX_NAME = ".similarity-index.db"
+DEFAULT_THRESHOLD = 0.8
+REUSE_MODES = ['off', 'ask', 'auto']
+
+# 64 个哈希函数分为 16 段、每段 4 行：Jaccard 相似度约 0.5 以上的组合有较大概率落入同一个桶，
+# 再用完整签名估算的相似度与阈值比较
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# 字符级 shingle：对中文和英文都适用，不依赖分词
+SHINGLE_SIZE = 3
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def _permutations():
+    """固定种子生成的哈希参数，保证不同进程、不同机器上的签名一致"""
+    params = []
+    for i in range(NUM_PERM):
+        digest = hashlib.sha256(f"document-illustrator-minhash-{i}".encode('utf-8')).digest()
+        a, b = struct.unpack('<QQ', digest[:16])
+        params.append((a % (_MERSENNE_PRIME - 1) + 1, b % _MERSENNE_PRIME))
+    return params
+
+
+_PERMUTATIONS = _permutations()
+
+
+def normalize_text(text):
+    """小写、去掉标点和多余空白，忽略排版差异"""
+    text = re.sub(r'[^\w]+', ' ', text.lower())
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def shingles(text):
+    """文本的字符级 shingle 集合"""
+    text = normalize_text(text)
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+_numpy_params = None
+
+
+def _signature_numpy(hashes):
+    """
+    NumPy 向量化的签名计算，结果与纯 Python 版本逐位一致
+
+    a * h 最多 93 位，uint64 放不下：把 a 拆成高 29 位和低 32 位分别相乘，
+    再利用 2^61 ≡ 1 (mod 2^61 - 1) 折叠，所有中间值都不超过 64 位
+    """
+    import numpy as np
+
+    global _numpy_params
+    if _numpy_params is None:
+        a = np.array([a for a, _ in _PERMUTATIONS], dtype=np.uint64)[:, None]
+        b = np.array([b for _, b in _PERMUTATIONS], dtype=np.uint64)[:, None]
+        _numpy_params = (a >> np.uint64(32), a & np.uint64(_MAX_HASH), b)
+    a_high, a_low, b = _numpy_params
+
+    p = np.uint64(_MERSENNE_PRIME)
+    shift_61, shift_32, shift_29 = np.uint64(61), np.uint64(32), np.uint64(29)
+    h = np.asarray(hashes, dtype=np.uint64)[None, :]
+
+    # 高位部分：y = a_high * h < 2^61，y * 2^32 ≡ (y >> 29) + (y & (2^29 - 1)) * 2^32
+    high = a_high * h
+    total = high >> shift_29
+    high &= np.uint64((1 << 29) - 1)
+    high <<= shift_32
+    total += high
+
+    # 低位部分：x = a_low * h < 2^64，x ≡ (x & p) + (x >> 61)
+    low = a_low * h
+    total += low >> shift_61
+    low &= p
+    total += low
+    total += b
+
+    # total < 2^63，折叠两次后小于 p + 1
+    for _ in range(2):
+        carry = total >> shift_61
+        total &= p
+        total += carry
+    total[total >= p] -= p
+    total &= np.uint64(_MAX_HASH)
+    return total.min(axis=1).tolist()
+
+
+def minhash_signature(text):
+    """
+    计算文本的 MinHash 签名（NUM_PERM 个 32 位整数）
+    安装了 numpy 时向量化计算，否则退回纯 Python（结果相同，慢一个数量级）
+    """
+    hashes = [
+        struct.unpack('<I', hashlib.blake2b(s.encode('utf-8'), digest_size=4).digest())[0]
+        for s in shingles(text)
+    ]
+    if not hashes:
+        return [_MAX_HASH] * NUM_PERM
+    try:
+        return _signature_numpy(hashes)
+    except ImportError:
+        pass
+    return [
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def estimate_similarity(signature_a, signature_b):
+    """用签名中相同位置取值相等的比例估算 Jaccard 相似度"""
+    return sum(1 for x, y in zip(signature_a, signature_b) if x == y) / NUM_PERM
+
+
+def _band_keys(signature):
+    """每一段签名的桶编号"""
+    keys = []
+    for band in range(BANDS):
+        rows = array('I', signature[band * ROWS:(band + 1) * ROWS]).tobytes()
+        keys.append(struct.unpack('<q', hashlib.blake2b(rows, digest_size=8).digest())[0])
+    return keys
+
+
+def style_key(style_prompt, is_cover=False):
+    """风格分组键：风格提示词内容哈希（封面图单独分组，提示词不同）"""
+    prefix = "cover\n" if is_cover else ""
+    return hashlib.sha256(f"{prefix}{style_prompt}".encode('utf-8')).hexdigest()[:32]
+
+
+def index_text(title, content):
+    """参与相似度比较的文本"""
+    return f"{title}\n{content}"
+
+
+class SimilarityIndex:
+    """
+    保存在 SQLite 中的 MinHash / LSH 索引
+
+    - images: 每张已索引图片的风格键、比例、分辨率、标题、路径和签名
+    - bands: (风格键, 比例, 段号, 桶编号) → 图片，查询时只读取同桶的候选
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS images (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                style_key TEXT NOT NULL,
+                aspect_ratio TEXT NOT NULL,
+                resolution TEXT NOT NULL,
+                title TEXT NOT NULL,
+                path TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS bands (
+                style_key TEXT NOT NULL,
+                aspect_ratio TEXT NOT NULL,
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                image_id INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS images_path ON images (path);
+            CREATE INDEX IF NOT EXISTS bands_lookup ON bands (style_key, aspect_ratio, band, bucket);
+            CREATE INDEX IF NOT EXISTS bands_image ON bands (image_id);
+        """)
+
+    @classmethod
+    def for_output_dir(cls, output_dir):
+        return cls(os.path.join(output_dir, INDEX_NAME))
+
+    def close(self):
+        self.conn.close()
+
+    def _delete_path(self, path):
+        stale = [row[0] for row in self.conn.execute("SELECT id FROM images WHERE path = ?", (path,))]
+        if stale:
+            placeholders = ','.join('?' * len(stale))
+            self.conn.execute(f"DELETE FROM bands WHERE image_id IN ({placeholders})", stale)
+            self.conn.execute(f"DELETE FROM images WHERE id IN ({placeholders})", stale)
+
+    def remove(self, path):
+        """删除某个路径的索引记录（该路径已被不应复用的图片覆盖）"""
+        with self.conn:
+            self._delete_path(os.path.abspath(path))
+
+    def add(self, style_prompt, aspect_ratio, resolution, title, content, path, is_cover=False):
+        """把一张已生成的图片加入索引（同一路径重新生成时替换旧记录）"""
+        key = style_key(style_prompt, is_cover)
+        signature = minhash_signature(index_text(title, content))
+        path = os.path.abspath(path)
+        with self.conn:
+            self._delete_path(path)
+            cursor = self.conn.execute(
+                "INSERT INTO images (style_key, aspect_ratio, resolution, title, path, signature, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, aspect_ratio, resolution, title, path,
+                 array('I', signature).tobytes(), time.time())
+            )
+            self.conn.executemany(
+                "INSERT INTO bands (style_key, aspect_ratio, band, bucket, image_id) VALUES (?, ?, ?, ?, ?)",
+                [(key, aspect_ratio, band, bucket, cursor.lastrowid)
+                 for band, bucket in enumerate(_band_keys(signature))]
+            )
+
+    def find(self, style_prompt, aspect_ratio, resolution, title, content, threshold=DEFAULT_THRESHOLD,
+             is_cover=False):
+        """
+        查找同一风格、同一比例、分辨率不低于 resolution 且相似度不低于 threshold 的已有图片
+
+        返回：{'path': ..., 'title': ..., 'similarity': ...}，没有时返回 None
+        """
+        key = style_key(style_prompt, is_cover)
+        signature = minhash_signature(index_text(title, content))
+
+        candidates = set()
+        for band, bucket in enumerate(_band_keys(signature)):
+            rows = self.conn.execute(
+                "SELECT image_id FROM bands WHERE style_key = ? AND aspect_ratio = ? AND band = ? AND bucket = ?",
+                (key, aspect_ratio, band, bucket)
+            )
+            candidates.update(row[0] for row in rows)
+        if not candidates:
+            return None
+
+        min_rank = RESOLUTIONS.index(resolution)
+        placeholders = ','.join('?' * len(candidates))
+        best = None
+        for title_found, path, resolution_found, blob in self.conn.execute(
+            f"SELECT title, path, resolution, signature FROM images WHERE id IN ({placeholders})",
+            list(candidates)
+        ):
+            if RESOLUTIONS.index(resolution_found) < min_rank or not os.path.exists(path):
+                continue
+            similarity = estimate_similarity(signature, array('I', blob))
+            if similarity >= threshold and (best is None or similarity > best['similarity']):
+                best = {'path': path, 'title': title_found, 'similarity': similarity}
+        return best
+
+
+def apply_reuse(jobs, index, mode, threshold=DEFAULT_THRESHOLD, log=None):
+    """
+    在生成前为每个任务查找可复用的已有图片
+
+    mode:
+    - 'auto': 直接复制到任务的输出路径
+    - 'ask': 逐个询问是否复用（询问打印到 log，默认为标准输出）
+    - 'off': 不查找
+
+    任务需要包含 title, content, style_prompt, aspect_ratio, resolution, output_path
+
+    返回：(仍需生成的任务列表, 复用结果列表)；复用结果的格式与调度器的结果字典一致，
+    另有 'reused_from' 字段记录来源图片
+    """
+    if mode == 'off' or index is None:
+        return list(jobs), []
+
+    remaining = []
+    reused = []
+    for job in jobs:
+        match = index.find(
+            job['style_prompt'],
+            job['aspect_ratio'],
+            job['resolution'],
+            job['title'],
+            job['content'],
+            threshold,
+            job.get('is_cover', False)
+        )
+        if match and mode == 'ask':
+            print(f"第 {job['index']} 张「{job['title']}」与已有图片「{match['title']}」"
+                  f"相似度 {match['similarity']:.0%}（{match['path']}），复用？[Y/n]: ", end='', file=log, flush=True)
+            answer = input().strip().lower()
+            if answer not in ('', 'y', 'yes'):
+                match = None
+
+        if not match:
+            remaining.append(job)
+            continue
+
+        if os.path.abspath(match['path']) != os.path.abspath(job['output_path']):
+            os.makedirs(os.path.dirname(os.path.abspath(job['output_path'])), exist_ok=True)
+            shutil.copyfile(match['path'], job['output_path'])
+        reused.append({
+            'job': job,
+            'path': job['output_path'],
+            'error': None,
+            'retries': 0,
+            'elapsed': 0.0,
+            'reused_from': match['path'],
+            'similarity': match['similarity'],
+        })
+    return remaining, reused
+
+
+def index_result(index, result):
+    """
+    把调度器中成功生成的图片加入索引
+    （复用的图片已在索引中，本地占位图和未通过质检的图片不应被复用，都不加入；
+    它们覆盖了输出路径上原来的图片，该路径的旧记录一并删除，避免之后复用到错误的内容）
+    """
+    if index is None or not result['path']:
+        return
+    if result.get('reused_from'):
+        if os.path.abspath(result['reused_from']) != os.path.abspath(result['path']):
+            index.remove(result['path'])
+        return
+    if result.get('fallback') or result.get('qa'):
+        index.remove(result['path'])
+        return
+    job = result['job']
+    index.add(
+        job['style_prompt'],
+        job['aspect_ratio'],
+        job['resolution'],
+        job['title'],
+        job['content'],
+        result['path'],
+        job.get('is_cover', False)
+    )
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Document Illustrator - 风格提示词前缀缓存
+同一批图片共用很长的风格提示词，只有末尾的标题和内容不同。
+这里把风格提示词注册为 Gemini 的上下文缓存（cached content），
+之后每张图只发送标题 / 内容后缀并引用缓存；不支持缓存时自动退回发送完整提示词
+"""
+
+import hashlib
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+from credential_pool import error_status_code
+
+
+DEFAULT_TTL_SECONDS = 3600
+DISPLAY_NAME_PREFIX = "document-illustrator-"
+
+def style_key(model, style_prompt):
+    """风格提示词缓存的键：模型 + 提示词内容哈希"""
+    return hashlib.sha256(f"{model}\n{style_prompt}".encode('utf-8')).hexdigest()[:32]
+
+
+class StylePromptCache:
+    """
+    管理一次运行中风格提示词的上下文缓存
+
+    - 每组凭据（API 项目）+ 模型 + 风格只创建一次缓存
+    - 优先复用服务端已有的同名缓存，多次调用 generate_single_image.py 也能命中
+    - 缓存依赖 TTL 自动过期，不主动删除；引用时发现已过期（404）则在下一次请求时重新创建
+    - 创建失败或模型不接受缓存引用（400）时记为不支持，后续请求直接发送完整提示词
+
+    可以用 cache_stand_in.FakeCachingClient 在本地验证命中、未命中和过期的行为
+    """
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, enabled=True):
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        # (凭据, 风格键) → Future，结果为缓存名，None 表示不可用
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.records = []
+
+    def _cache_name(self, client, credential, model, style_prompt):
+        """
+        返回该凭据 + 风格的缓存名，不可用时返回 None
+
+        锁只用于读写表：第一个请求某个键的线程登记一个 Future，在锁外查询 / 创建缓存，
+        同一个键的其他线程等待这个 Future，其他凭据和风格的请求不受网络调用影响
+        """
+        key = (id(credential), style_key(model, style_prompt))
+        with self._lock:
+            future = self._entries.get(key)
+            owner = future is None
+            if owner:
+                future = self._entries[key] = Future()
+        if not owner:
+            return future.result()
+
+        name = None
+        try:
+            name = self._find_or_create(client, model, style_prompt, DISPLAY_NAME_PREFIX + key[1])
+        finally:
+            # 出现意外错误时也要唤醒等待的线程（它们改为发送完整提示词）
+            future.set_result(name)
+        return name
+
+    def _find_or_create(self, client, model, style_prompt, display_name):
+        """优先复用服务端已有的同名缓存，没有时创建；创建失败时返回 None"""
+        from google.genai import types
+
+        try:
+            for cached in client.caches.list():
+                if cached.display_name == display_name and (cached.model or '').endswith(model):
+                    return cached.name
+        except Exception:
+            pass
+
+        try:
+            cached = client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    display_name=display_name,
+                    contents=[types.Content(role='user', parts=[types.Part(text=style_prompt)])],
+                    ttl=f"{self.ttl_seconds}s"
+                )
+            )
+        except Exception as e:
+            print(f"  提示: 风格提示词缓存不可用，改为发送完整提示词（{e}）", file=sys.stderr)
+            return None
+        return cached.name
+
+    def _mark_unsupported(self, credential, model, style_prompt):
+        future = Future()
+        future.set_result(None)
+        with self._lock:
+            self._entries[(id(credential), style_key(model, style_prompt))] = future
+
+    def _forget(self, credential, model, style_prompt, name):
+        """缓存已过期：删除记录，下一次请求重新查询 / 创建（其他线程已换上新缓存时保留）"""
+        key = (id(credential), style_key(model, style_prompt))
+        with self._lock:
+            future = self._entries.get(key)
+            if future is not None and future.done() and future.result() == name:
+                del self._entries[key]
+
+    def _record(self, response, latency, cached):
+        usage = getattr(response, 'usage_metadata', None)
+        with self._lock:
+            self.records.append({
+                'cached': cached,
+                'latency': latency,
+                'prompt_tokens': getattr(usage, 'prompt_token_count', None) or 0,
+                'cached_tokens': getattr(usage, 'cached_content_token_count', None) or 0,
+            })
+
+    def generate_content(self, client, credential, model, style_prompt, prompt_suffix, config):
+        """
+        发送生成请求：能用缓存时只发送后缀并引用缓存，否则发送「风格提示词 + 后缀」
+
+        完整提示词与 build_prompt() 的结果一致，缓存与否不影响生成内容
+        """
+        name = self._cache_name(client, credential, model, style_prompt) if self.enabled else None
+
+        if name:
+            start_time = time.time()
+            try:
+                response = client.models.generate_content(
+                    model=model,
+                    contents=prompt_suffix,
+                    config=config.model_copy(update={'cached_content': name})
+                )
+                self._record(response, time.time() - start_time, cached=True)
+                return response
+            except Exception as e:
+                # 缓存过期（404）或模型不接受缓存引用（400）：本次退回完整提示词，其他错误照常抛出
+                status = error_status_code(e)
+                if status == 404:
+                    print(f"  提示: 风格提示词缓存已过期，下一张图重新创建（{e}）", file=sys.stderr)
+                    self._forget(credential, model, style_prompt, name)
+                elif status == 400:
+                    print(f"  提示: 风格提示词缓存引用失败，改为发送完整提示词（{e}）", file=sys.stderr)
+                    self._mark_unsupported(credential, model, style_prompt)
+                else:
+                    raise
+
+        start_time = time.time()
+        response = client.models.generate_content(
+            model=model,
+            contents=f"{style_prompt}\n\n{prompt_suffix}",
+            config=config
+        )
+        self._record(response, time.time() - start_time, cached=False)
+        return response
+
+
+def print_cache_summary(cache, file=None):
+    """在运行总结中打印缓存命中情况、平均输入 token 和平均耗时"""
+    if cache is None or not cache.records:
+        return
+
+    def average(records, field):
+        return sum(r[field] for r in records) / len(records) if records else 0
+
+    hits = [r for r in cache.records if r['cached']]
+    misses = [r for r in cache.records if not r['cached']]
+    print(f"\n🗂️  风格提示词缓存: 命中 {len(hits)}/{len(cache.records)} 张", file=file)
+    if hits:
+        print(f"  使用缓存: 平均输入 {average(hits, 'prompt_tokens'):.0f} tokens"
+              f"（其中缓存 {average(hits, 'cached_tokens'):.0f}），平均耗时 {average(hits, 'latency'):.1f}s", file=file)
+    if misses:
+        print(f"  未用缓存: 平均输入 {average(misses, 'prompt_tokens'):.0f} tokens，"
+              f"平均耗时 {average(misses, 'latency'):.1f}s", file=file)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_style_cache():
+    """
+    返回进程内共享的风格提示词缓存
+
+    环境变量：
+    - GEMINI_STYLE_CACHE: 设为 off 时关闭缓存
+    - GEMINI_STYLE_CACHE_TTL: 缓存有效期（秒，默认 3600）
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            enabled = os.environ.get("GEMINI_STYLE_CACHE", "on").lower() not in ('off', '0', 'false', 'no')
+            ttl = int(os.environ.get("GEMINI_STYLE_CACHE_TTL", DEFAULT_TTL_SECONDS))
+            _default_cache = StylePromptCache(ttl, enabled)
+        return _default_cache
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Document Illustrator - 合成测试文档生成器
+按指定大小（1KB ~ 100MB）生成 Markdown 文档，可控制标题深度、重复标题比例、
+中文（CJK）比例和超大章节，供 benchmark_parsing.py 做性能回归测试
+"""
+
+import argparse
+import random
+import sys
+
+
+# 标题层级从 ## 开始（与 analyze_document_structure 支持的 h2 / h3 / h4 一致）
+MIN_HEADING_DEPTH = 1
+MAX_HEADING_DEPTH = 3
+
+CJK_WORDS = [
+    '配图', '文档', '章节', '内容', '风格', '提示词', '分辨率', '渐变', '玻璃', '卡片',
+    '票据', '插画', '结构', '层级', '标题', '段落', '生成', '审核', '终稿', '草图',
+]
+LATIN_WORDS = [
+    'illustration', 'document', 'section', 'content', 'style', 'prompt', 'resolution',
+    'gradient', 'glass', 'card', 'ticket', 'vector', 'layout', 'heading', 'paragraph',
+]
+
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_size(text):
+    """解析 "1K"、"10M"、"4096" 这样的大小，返回字节数"""
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def format_size(size):
+    """把字节数格式化为 1K / 10M 这样的简写"""
+    for unit in ('G', 'M', 'K'):
+        if size >= SIZE_UNITS[unit] and size % SIZE_UNITS[unit] == 0:
+            return f"{size // SIZE_UNITS[unit]}{unit}"
+    return str(size)
+
+
+def _sentence(rng, cjk_ratio):
+    if rng.random() < cjk_ratio:
+        return ''.join(rng.choice(CJK_WORDS) for _ in range(rng.randint(6, 16))) + '。'
+    words = [rng.choice(LATIN_WORDS) for _ in range(rng.randint(6, 16))]
+    return ' '.join(words).capitalize() + '.'
+
+
+def _paragraph(rng, cjk_ratio):
+    return ''.join(_sentence(rng, cjk_ratio) for _ in range(rng.randint(2, 5)))
+
+
+def iter_synthetic_markdown(size, depth=3, duplicate_ratio=0.1, cjk_ratio=0.5,
+                            giant_ratio=0.0, top_ratio=None, paragraphs_per_section=3, seed=0):
+    """
+    逐块生成合成 Markdown，累计 UTF-8 字节数达到 size 后停止
+
+    参数：
+    - depth: 标题深度 1~3（1 只有 ##，3 包含 ## / ### / ####）
+    - duplicate_ratio: 复用已出现标题的比例
+    - cjk_ratio: 中文句子的比例
+    - giant_ratio: 超大章节占总大小的比例（集中在一个章节里）
+    - top_ratio: 每个章节之后回到 ## 的概率；设为 0 时整篇文档只有一个 ##，其余都是它的子章节，
+      用于暴露合并时的二次方拼接（默认: 随机游走）
+    - seed: 随机种子，相同参数生成完全相同的文档
+
+    逐块产出而不是一次性拼接，生成 100MB 文档时内存占用也保持很小
+    """
+    if not MIN_HEADING_DEPTH <= depth <= MAX_HEADING_DEPTH:
+        raise ValueError(f"标题深度必须在 {MIN_HEADING_DEPTH}~{MAX_HEADING_DEPTH} 之间: {depth}")
+
+    rng = random.Random(seed)
+    written = 0
+    titles = []
+    giant_budget = int(size * giant_ratio)
+
+    def emit(text):
+        nonlocal written
+        written += len(text.encode('utf-8'))
+        return text
+
+    yield emit("# 合成测试文档\n\n")
+    yield emit(_paragraph(rng, cjk_ratio) + "\n\n")
+
+    section_index = 0
+    level = 1
+    while written < size:
+        section_index += 1
+        if titles and rng.random() < duplicate_ratio:
+            title = rng.choice(titles)
+        else:
+            title = f"第 {section_index} 节 {_sentence(rng, cjk_ratio)[:24].strip('。.')}"
+            titles.append(title)
+
+        yield emit(f"{'#' * (level + 1)} {title}\n\n")
+
+        if giant_budget and section_index == 1:
+            # 第一个章节承担超大正文，后续章节照常
+            target = written + giant_budget
+            while written < target:
+                yield emit(_paragraph(rng, cjk_ratio) + "\n\n")
+        else:
+            for _ in range(rng.randint(1, paragraphs_per_section * 2 - 1)):
+                yield emit(_paragraph(rng, cjk_ratio) + "\n\n")
+
+        # 下一个标题：可以下钻一层，或者回到任意更高层级
+        if top_ratio is not None:
+            level = 1 if rng.random() < top_ratio or depth == 1 else rng.randint(2, depth)
+        elif level < depth and rng.random() < 0.6:
+            level += 1
+        else:
+            level = rng.randint(1, level)
+
+
+def write_synthetic_markdown(path, size, **options):
+    """把合成文档写入 path，返回实际写入的字节数"""
+    written = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for chunk in iter_synthetic_markdown(size, **options):
+            f.write(chunk)
+            written += len(chunk.encode('utf-8'))
+    return written
+
+
+def main():
+    """主流程"""
+    parser = argparse.ArgumentParser(
+        description='Document Illustrator - 合成测试文档生成器',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例用法:
+  # 生成 10MB、三级标题、20% 重复标题的文档
+  python synthetic_docs.py bench.md --size 10M --duplicate-ratio 0.2
+
+  # 生成包含一个占 50% 大小的超大章节的文档
+  python synthetic_docs.py giant.md --size 1M --giant-ratio 0.5
+"""
+    )
+    parser.add_argument('output', help='输出文件路径')
+    parser.add_argument('--size', default='1M', help='目标大小，例如 1K、10M、100M（默认: 1M）')
+    parser.add_argument('--depth', type=int, default=3, help='标题深度 1~3（默认: 3）')
+    parser.add_argument('--duplicate-ratio', type=float, default=0.1, help='重复标题比例（默认: 0.1）')
+    parser.add_argument('--cjk-ratio', type=float, default=0.5, help='中文句子比例（默认: 0.5）')
+    parser.add_argument('--giant-ratio', type=float, default=0.0, help='超大章节占总大小的比例（默认: 0）')
+    parser.add_argument('--top-ratio', type=float, default=None, help='每个章节之后回到 ## 的概率（默认: 随机游走）')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子（默认: 0）')
+
+    args = parser.parse_args()
+
+    try:
+        written = write_synthetic_markdown(
+            args.output,
+            parse_size(args.size),
+            depth=args.depth,
+            duplicate_ratio=args.duplicate_ratio,
+            cjk_ratio=args.cjk_ratio,
+            giant_ratio=args.giant_ratio,
+            top_ratio=args.top_ratio,
+            seed=args.seed
+        )
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"✓ 已生成: {args.output}（{written} 字节）")
+
+
+if __name__ == "__main__":
+    main()